@@ -8,7 +8,63 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import random
+import hashlib
+import os
+from pathlib import Path
 from typing import Dict, List, Tuple, Optional
+from scipy.spatial import cKDTree
+from app.supply_demand import city_supply_demand, summarize_city_balance
+from app.geo import generate_hex_layers, load_hex_layers, hex_cell_economics, rollup_cells, hex_to_xy
+
+# Предустановленные данные для российских городов
+DEFAULT_CITIES = {
+    "Москва": {
+        "population": 12_500_000, "aov": 420, "frequency": 6.2, "take_rate": 28,
+        "cac": 1800, "competition": 9, "maturity": "Зрелый"
+    },
+    "СПб": {
+        "population": 5_400_000, "aov": 380, "frequency": 4.8, "take_rate": 26,
+        "cac": 1400, "competition": 8, "maturity": "Зрелый"
+    },
+    "Новосибирск": {
+        "population": 1_600_000, "aov": 280, "frequency": 3.2, "take_rate": 24,
+        "cac": 900, "competition": 5, "maturity": "Растущий"
+    },
+    "Екатеринбург": {
+        "population": 1_500_000, "aov": 310, "frequency": 3.8, "take_rate": 25,
+        "cac": 1100, "competition": 6, "maturity": "Растущий"
+    },
+    "Казань": {
+        "population": 1_300_000, "aov": 260, "frequency": 2.9, "take_rate": 23,
+        "cac": 800, "competition": 4, "maturity": "Развивающийся"
+    },
+    "Краснодар": {
+        "population": 900_000, "aov": 240, "frequency": 2.1, "take_rate": 22,
+        "cac": 650, "competition": 3, "maturity": "Развивающийся"
+    }
+}
+
+CITY_INPUT_COLUMNS = ['population', 'aov', 'frequency', 'take_rate', 'cac', 'competition', 'maturity']
+MATURITY_STAGES = ["Зрелый", "Растущий", "Развивающийся"]
+
+# Churn зависит от зрелости рынка
+CHURN_RATES = {"Зрелый": 10, "Растущий": 12, "Развивающийся": 15}
+OPS_COST = 25  # Фиксированная операционная стоимость
+MARKET_PENETRATION = 0.15  # 15% penetration
+
+# Метрики, по которым строятся средние по стадиям зрелости
+MATURITY_AGGREGATE_COLUMNS = ['ltv_cac_ratio', 'cac', 'frequency', 'take_rate']
+
+# Дисковый кэш производных метрик городов; версию повышать при любом изменении формул compute_city_metrics
+CITY_METRICS_VERSION = 2
+CITY_METRICS_COLUMNS = ['monthly_revenue', 'monthly_profit', 'churn', 'ltv', 'ltv_cac_ratio', 'market_potential']
+CITY_METRICS_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "city_metrics"
+CITY_METRICS_CACHE_FILES = 16  # Сколько последних наборов входов хранить на диске
+
+# Порядковое кодирование зрелости для поиска похожих городов
+MATURITY_CODES = {"Развивающийся": 0, "Растущий": 1, "Зрелый": 2}
+
+
 def city_analysis_mode():
     """Анализ по городам"""
     st.header("🏙️ Анализ по городам")
@@ -20,87 +76,291 @@ def city_analysis_mode():
     
     # Настройка городов
     cities_data = setup_cities_data()
+    city_state = st.session_state.get('city_data') or {}
     
     # Визуализация сравнения городов
-    create_cities_comparison_chart(cities_data)
+    create_cities_comparison_chart(cities_data, city_state.get('frontier'))
     
     # Анализ по стадиям развития
-    analyze_city_maturity(cities_data)
+    analyze_city_maturity(cities_data, city_state.get('maturity_means'))
     
     # Рекомендации по городам
-    show_city_recommendations(cities_data)
+    show_city_recommendations(cities_data, city_state)
+    
+    # Поиск похожих городов для нового рынка
+    if city_state:
+        show_similar_cities(city_state)
+        
+        # Баланс спроса и предложения по часам недели
+        show_supply_demand_balance(city_state)
+        
+        # Потенциал рынка по гексагональной сетке
+        show_hex_market_potential(city_state)
+
+def compute_city_metrics(inputs: pd.DataFrame) -> pd.DataFrame:
+    """Векторный расчет LTV, LTV/CAC и потенциала рынка для таблицы городов"""
+    monthly_revenue = inputs['aov'] * inputs['take_rate'] / 100 * inputs['frequency']
+    monthly_profit = monthly_revenue - OPS_COST
+    churn = inputs['maturity'].map(CHURN_RATES).astype(float)
+    ltv = monthly_profit / (churn / 100)
+    
+    return pd.DataFrame({
+        'monthly_revenue': monthly_revenue,
+        'monthly_profit': monthly_profit,
+        'churn': churn,
+        'ltv': ltv,
+        'ltv_cac_ratio': ltv / inputs['cac'],
+        'market_potential': inputs['population'] * MARKET_PENETRATION * inputs['frequency']
+    }, index=inputs.index)
+
+def city_metrics_cache_key(inputs: pd.DataFrame) -> str:
+    """Ключ кэша: версия формул и хэш значений входной таблицы
+
+    Метрики считаются построчно и не зависят от названий городов, поэтому хэшируются только
+    сырые байты числовых колонок и коды стадий зрелости - это дешевле hash_pandas_object.
+    """
+    values = inputs[CITY_INPUT_COLUMNS[:-1]].to_numpy(dtype=float)
+    maturity = inputs['maturity'].map(MATURITY_CODES).to_numpy(dtype=float)
+    digest = hashlib.sha256(f"{CITY_METRICS_VERSION}|{'|'.join(CITY_INPUT_COLUMNS)}".encode())
+    digest.update(np.ascontiguousarray(np.column_stack([values, maturity])).tobytes())
+    return digest.hexdigest()[:32]
+
+def load_or_compute_city_metrics(inputs: pd.DataFrame, cache_dir: Path = CITY_METRICS_CACHE_DIR) -> pd.DataFrame:
+    """Метрики городов из дискового кэша (.npy, memory-mapped без копирования) или с расчетом и сохранением"""
+    path = Path(cache_dir) / f"{city_metrics_cache_key(inputs)}.npy"
+    
+    if path.exists():
+        try:
+            cached = np.load(path, mmap_mode='r')
+            if cached.shape == (len(inputs), len(CITY_METRICS_COLUMNS)):
+                return pd.DataFrame(cached, index=inputs.index, columns=CITY_METRICS_COLUMNS, copy=False)
+        except (OSError, ValueError):
+            pass  # Поврежденный файл просто пересчитываем
+    
+    metrics = compute_city_metrics(inputs)[CITY_METRICS_COLUMNS].astype(float)
+    
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Атомарная запись: параллельный процесс не увидит недописанный файл
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+        np.save(tmp_path, metrics.to_numpy())
+        os.replace(tmp_path, path)
+        # Ограничиваем кэш последними CITY_METRICS_CACHE_FILES наборами входов
+        files = sorted(path.parent.glob("*.npy"), key=lambda file: file.stat().st_mtime, reverse=True)
+        for stale in files[CITY_METRICS_CACHE_FILES:]:
+            stale.unlink(missing_ok=True)
+    except OSError:
+        pass  # Кэш необязателен, например на read-only файловой системе
+    
+    return metrics
+
+def pareto_frontier(cac: np.ndarray, ltv: np.ndarray) -> np.ndarray:
+    """Позиции городов на границе эффективности (ниже CAC, выше LTV)"""
+    if len(cac) == 0:
+        return np.array([], dtype=int)
+    
+    # Сортируем по CAC, при равном CAC - по убыванию LTV
+    order = np.lexsort((-ltv, cac))
+    sorted_ltv = ltv[order]
+    prev_best = np.maximum.accumulate(np.concatenate(([-np.inf], sorted_ltv[:-1])))
+    return np.sort(order[sorted_ltv > prev_best])
+
+def _maturity_sums(inputs: pd.DataFrame, metrics: pd.DataFrame) -> pd.DataFrame:
+    """Суммы и количество городов по стадиям зрелости"""
+    values = pd.concat([metrics['ltv_cac_ratio'], inputs[['cac', 'frequency', 'take_rate']]], axis=1)
+    sums = values.groupby(inputs['maturity']).sum()
+    sums['count'] = inputs.groupby('maturity').size()
+    return sums.reindex(MATURITY_STAGES, fill_value=0).astype(float)
+
+def _finalize_city_state(state: Dict) -> Dict:
+    """Пересчет средних по стадиям из накопленных сумм"""
+    sums = state['maturity_sums']
+    present = sums[sums['count'] > 0]
+    state['maturity_means'] = present[MATURITY_AGGREGATE_COLUMNS].div(present['count'], axis=0)
+    return state
+
+def _normalize_city_inputs(inputs: pd.DataFrame) -> pd.DataFrame:
+    """Приведение входной таблицы городов к единым колонкам и типам"""
+    inputs = inputs[CITY_INPUT_COLUMNS].copy()
+    numeric_columns = CITY_INPUT_COLUMNS[:-1]
+    inputs[numeric_columns] = inputs[numeric_columns].astype(float)
+    return inputs
+
+def load_city_table(source) -> pd.DataFrame:
+    """Таблица городов из CSV с проверкой колонок, стадий зрелости и уникальности городов"""
+    table = pd.read_csv(source)
+    
+    missing = set(['city'] + CITY_INPUT_COLUMNS) - set(table.columns)
+    if missing:
+        raise ValueError(f"В таблице нет колонок: {', '.join(sorted(missing))}")
+    
+    duplicated = table['city'][table['city'].duplicated()].unique()
+    if len(duplicated):
+        raise ValueError(f"Города повторяются: {', '.join(map(str, duplicated))}")
+    
+    unknown = set(table['maturity'].dropna()) - set(MATURITY_STAGES)
+    if unknown or table['maturity'].isna().any():
+        raise ValueError(f"Стадия зрелости должна быть одной из: {', '.join(MATURITY_STAGES)}")
+    
+    numeric_columns = CITY_INPUT_COLUMNS[:-1]
+    try:
+        table[numeric_columns] = table[numeric_columns].astype(float)
+    except ValueError:
+        raise ValueError(f"Нечисловые значения в колонках: {', '.join(numeric_columns)}") from None
+    
+    return table.set_index('city')[CITY_INPUT_COLUMNS]
+
+def build_city_state(inputs: pd.DataFrame) -> Dict:
+    """Полный расчет метрик и агрегатов по таблице городов"""
+    inputs = _normalize_city_inputs(inputs)
+    metrics = load_or_compute_city_metrics(inputs)
+    ratio = metrics['ltv_cac_ratio'].to_numpy()
+    potential = metrics['market_potential'].to_numpy()
+    frontier = pareto_frontier(inputs['cac'].to_numpy(dtype=float), metrics['ltv'].to_numpy())
+    
+    state = {
+        'inputs': inputs,
+        'metrics': metrics,
+        'maturity_sums': _maturity_sums(inputs, metrics),
+        'best': inputs.index[ratio.argmax()] if len(ratio) else None,
+        'worst': inputs.index[ratio.argmin()] if len(ratio) else None,
+        'highest_potential': inputs.index[potential.argmax()] if len(potential) else None,
+        'frontier': list(inputs.index[frontier]),
+        'recomputed_rows': len(inputs)
+    }
+    return _finalize_city_state(state)
+
+def update_city_state(state: Optional[Dict], inputs: pd.DataFrame) -> Dict:
+    """Инкрементальный пересчет: только измененные строки и зависящие от них агрегаты"""
+    inputs = _normalize_city_inputs(inputs)
+    if not state or not state['inputs'].index.equals(inputs.index):
+        return build_city_state(inputs)
+    
+    old_inputs = state['inputs']
+    # Пустые ячейки (NaN) в обеих версиях считаем совпадающими
+    same = (old_inputs == inputs) | (old_inputs.isna() & inputs.isna())
+    changed_mask = ~same.all(axis=1).to_numpy()
+    changed = inputs.index[changed_mask]
+    if len(changed) == 0:
+        state['recomputed_rows'] = 0
+        return state
+    
+    # При массовом редактировании дешевле пересчитать таблицу целиком
+    if len(changed) > len(inputs) // 4:
+        return build_city_state(inputs)
+    
+    # Метрики из кэша отображены в память только для чтения: копия при первой правке
+    if not state['metrics'].to_numpy().flags.writeable:
+        state['metrics'] = state['metrics'].copy()
+    
+    old_metrics = state['metrics'].loc[changed]
+    new_inputs = inputs.loc[changed].copy()
+    new_metrics = compute_city_metrics(new_inputs)
+    
+    # Средние по стадиям: вычитаем старый вклад строк и добавляем новый
+    sums = state['maturity_sums']
+    sums = sums.sub(_maturity_sums(old_inputs.loc[changed], old_metrics), fill_value=0)
+    sums = sums.add(_maturity_sums(new_inputs, new_metrics), fill_value=0)
+    
+    state['inputs'].loc[changed] = new_inputs
+    state['metrics'].loc[changed] = new_metrics
+    state['maturity_sums'] = sums
+    
+    metrics = state['metrics']
+    
+    # Лучший/худший город: полный поиск нужен, только если изменился текущий лидер
+    ratio = new_metrics['ltv_cac_ratio']
+    if state['best'] in changed:
+        state['best'] = metrics['ltv_cac_ratio'].idxmax()
+    elif ratio.max() > metrics.at[state['best'], 'ltv_cac_ratio']:
+        state['best'] = ratio.idxmax()
+    
+    if state['worst'] in changed:
+        state['worst'] = metrics['ltv_cac_ratio'].idxmin()
+    elif ratio.min() < metrics.at[state['worst'], 'ltv_cac_ratio']:
+        state['worst'] = ratio.idxmin()
+    
+    potential = new_metrics['market_potential']
+    if state['highest_potential'] in changed:
+        state['highest_potential'] = metrics['market_potential'].idxmax()
+    elif potential.max() > metrics.at[state['highest_potential'], 'market_potential']:
+        state['highest_potential'] = potential.idxmax()
+    
+    # Граница эффективности меняется, если затронута точка на ней
+    # или измененный город не доминируется текущей границей
+    frontier = state['frontier']
+    frontier_cac = state['inputs'].loc[frontier, 'cac'].to_numpy(dtype=float)
+    frontier_ltv = metrics.loc[frontier, 'ltv'].to_numpy()
+    new_cac = new_inputs['cac'].to_numpy(dtype=float)[:, None]
+    new_ltv = new_metrics['ltv'].to_numpy()[:, None]
+    dominated = ((frontier_cac <= new_cac) & (frontier_ltv >= new_ltv)).any(axis=1)
+    
+    if changed.isin(frontier).any() or not dominated.all():
+        positions = pareto_frontier(state['inputs']['cac'].to_numpy(dtype=float), metrics['ltv'].to_numpy())
+        state['frontier'] = list(inputs.index[positions])
+    
+    state['recomputed_rows'] = len(changed)
+    state.pop('similarity_index', None)  # Индекс похожести строится по входам заново
+    return _finalize_city_state(state)
 
 def setup_cities_data() -> Dict:
     """Настройка данных по городам"""
     st.subheader("⚙️ Настройка метрик по городам")
     
-    # Предустановленные данные для российских городов
-    default_cities = {
-        "Москва": {
-            "population": 12_500_000, "aov": 420, "frequency": 6.2, "take_rate": 28,
-            "cac": 1800, "competition": 9, "maturity": "Зрелый"
-        },
-        "СПб": {
-            "population": 5_400_000, "aov": 380, "frequency": 4.8, "take_rate": 26,
-            "cac": 1400, "competition": 8, "maturity": "Зрелый"
-        },
-        "Новосибирск": {
-            "population": 1_600_000, "aov": 280, "frequency": 3.2, "take_rate": 24,
-            "cac": 900, "competition": 5, "maturity": "Растущий"
-        },
-        "Екатеринбург": {
-            "population": 1_500_000, "aov": 310, "frequency": 3.8, "take_rate": 25,
-            "cac": 1100, "competition": 6, "maturity": "Растущий"
-        },
-        "Казань": {
-            "population": 1_300_000, "aov": 260, "frequency": 2.9, "take_rate": 23,
-            "cac": 800, "competition": 4, "maturity": "Развивающийся"
+    uploaded = st.file_uploader("Загрузить таблицу городов (CSV: city + метрики)", type="csv")
+    
+    base_table = None
+    if uploaded is not None:
+        try:
+            base_table = load_city_table(uploaded)
+        except ValueError as error:
+            st.error(f"Не удалось прочитать таблицу городов: {error}")
+    
+    if base_table is None:
+        selected_cities = st.multiselect(
+            "Выберите города для анализа:",
+            list(DEFAULT_CITIES.keys()),
+            default=["Москва", "СПб", "Новосибирск", "Казань"]
+        )
+        
+        if not selected_cities:
+            selected_cities = ["Москва", "СПб"]
+        
+        base_table = pd.DataFrame.from_dict(DEFAULT_CITIES, orient='index').loc[selected_cities, CITY_INPUT_COLUMNS]
+    
+    base_table.index.name = 'Город'
+    
+    # Редактируемая таблица: изменение строки пересчитывает только эту строку
+    edited = st.data_editor(
+        base_table,
+        use_container_width=True,
+        num_rows="fixed",
+        column_config={
+            'population': st.column_config.NumberColumn("Население", min_value=0, step=10_000),
+            'aov': st.column_config.NumberColumn("AOV (руб)", min_value=1),
+            'frequency': st.column_config.NumberColumn("Частота", min_value=0.0, format="%.1f"),
+            'take_rate': st.column_config.NumberColumn("Take Rate (%)", min_value=0, max_value=100),
+            'cac': st.column_config.NumberColumn("CAC (руб)", min_value=1),
+            'competition': st.column_config.NumberColumn("Конкуренция", min_value=0, max_value=10),
+            'maturity': st.column_config.SelectboxColumn("Стадия", options=MATURITY_STAGES, required=True)
         },
-        "Краснодар": {
-            "population": 900_000, "aov": 240, "frequency": 2.1, "take_rate": 22,
-            "cac": 650, "competition": 3, "maturity": "Развивающийся"
-        }
-    }
-    
-    selected_cities = st.multiselect(
-        "Выберите города для анализа:",
-        list(default_cities.keys()),
-        default=["Москва", "СПб", "Новосибирск", "Казань"]
+        key="city_editor"
     )
     
-    if not selected_cities:
-        selected_cities = ["Москва", "СПб"]
+    city_state = update_city_state(st.session_state.get('city_data'), edited)
+    st.session_state.city_data = city_state
+    st.caption(f"Пересчитано строк: {city_state['recomputed_rows']} из {len(edited)}")
+    
+    incomplete = edited.index[edited.isna().any(axis=1)]
+    if len(incomplete):
+        st.warning(f"Незаполненные метрики у городов: {', '.join(map(str, incomplete))} - их показатели не рассчитаны")
     
     # Расширенные метрики
-    cities_analysis = {}
-    for city in selected_cities:
-        data = default_cities[city].copy()
-        
-        # Расчет LTV и других метрик
-        monthly_revenue = data['aov'] * data['take_rate'] / 100 * data['frequency']
-        ops_cost = 25  # Фиксированная операционная стоимость
-        monthly_profit = monthly_revenue - ops_cost
-        
-        # Churn зависит от зрелости рынка
-        churn_rates = {"Зрелый": 10, "Растущий": 12, "Развивающийся": 15}
-        churn = churn_rates[data['maturity']]
-        
-        ltv = monthly_profit / (churn / 100)
-        ltv_cac_ratio = ltv / data['cac']
-        
-        cities_analysis[city] = {
-            **data,
-            'monthly_revenue': monthly_revenue,
-            'monthly_profit': monthly_profit,
-            'churn': churn,
-            'ltv': ltv,
-            'ltv_cac_ratio': ltv_cac_ratio,
-            'market_potential': data['population'] * 0.15 * data['frequency']  # 15% penetration
-        }
+    cities_analysis = pd.concat([city_state['inputs'], city_state['metrics']], axis=1).to_dict('index')
     
     return cities_analysis
 
-def create_cities_comparison_chart(cities_data: Dict):
+def create_cities_comparison_chart(cities_data: Dict, frontier: Optional[List[str]] = None):
     """Сравнительный анализ городов"""
     st.subheader("📊 Сравнение городов")
     
@@ -121,7 +381,7 @@ def create_cities_comparison_chart(cities_data: Dict):
     fig.add_trace(go.Scatter(
         x=cac_values,
         y=ltv_values,
-        mode='markers+text',
+        mode='markers+text' if len(cities) <= 50 else 'markers',  # Подписи только для небольших таблиц
         text=cities,
         textposition="middle center",
         marker=dict(
@@ -138,6 +398,19 @@ def create_cities_comparison_chart(cities_data: Dict):
                       '<extra></extra>'
     ))
     
+    # Граница эффективности: города, которые не доминируются по CAC и LTV
+    if frontier:
+        frontier_points = sorted(frontier, key=lambda city: cities_data[city]['cac'])
+        fig.add_trace(go.Scatter(
+            x=[cities_data[city]['cac'] for city in frontier_points],
+            y=[cities_data[city]['ltv'] for city in frontier_points],
+            mode='lines',
+            name='Граница эффективности',
+            line=dict(color='blue', width=2, shape='hv'),
+            hoverinfo='skip',
+            showlegend=False
+        ))
+    
     # Добавляем линии-ориентиры
     max_val = max(max(ltv_values), max(cac_values))
     
@@ -170,11 +443,11 @@ def create_cities_comparison_chart(cities_data: Dict):
     comparison_df = pd.DataFrame([
         {
             'Город': city,
-            'Население': f"{data['population']:,}",
-            'AOV': f"{data['aov']} руб",
+            'Население': f"{data['population']:,.0f}",
+            'AOV': f"{data['aov']:.0f} руб",
             'Частота': f"{data['frequency']:.1f}",
-            'Take Rate': f"{data['take_rate']}%",
-            'CAC': f"{data['cac']:,} руб",
+            'Take Rate': f"{data['take_rate']:.0f}%",
+            'CAC': f"{data['cac']:,.0f} руб",
             'LTV': f"{data['ltv']:,.0f} руб",
             'LTV/CAC': f"{data['ltv_cac_ratio']:.1f}:1",
             'Стадия': data['maturity'],
@@ -185,17 +458,14 @@ def create_cities_comparison_chart(cities_data: Dict):
     
     st.dataframe(comparison_df, use_container_width=True)
 
-def analyze_city_maturity(cities_data: Dict):
+def analyze_city_maturity(cities_data: Dict, maturity_means: Optional[pd.DataFrame] = None):
     """Анализ по стадиям зрелости рынка"""
     st.subheader("📈 Анализ по стадиям развития рынка")
     
-    # Группировка по стадиям
-    maturity_groups = {}
-    for city, data in cities_data.items():
-        stage = data['maturity']
-        if stage not in maturity_groups:
-            maturity_groups[stage] = []
-        maturity_groups[stage].append(data)
+    # Средние по стадиям берем из инкрементального состояния, если оно есть
+    if maturity_means is None:
+        maturity_means = pd.DataFrame.from_dict(cities_data, orient='index') \
+            .groupby('maturity')[MATURITY_AGGREGATE_COLUMNS].mean()
     
     # Средние показатели по стадиям
     fig = make_subplots(
@@ -206,15 +476,11 @@ def analyze_city_maturity(cities_data: Dict):
                [{"type": "bar"}, {"type": "bar"}]]
     )
     
-    stages = list(maturity_groups.keys())
+    stages = list(maturity_means.index)
     colors = ['red', 'orange', 'green']
     
     for i, stage in enumerate(stages):
-        stage_data = maturity_groups[stage]
-        avg_ltv_cac = np.mean([d['ltv_cac_ratio'] for d in stage_data])
-        avg_cac = np.mean([d['cac'] for d in stage_data])
-        avg_frequency = np.mean([d['frequency'] for d in stage_data])
-        avg_take_rate = np.mean([d['take_rate'] for d in stage_data])
+        avg_ltv_cac, avg_cac, avg_frequency, avg_take_rate = maturity_means.loc[stage, MATURITY_AGGREGATE_COLUMNS]
         
         fig.add_trace(go.Bar(x=[stage], y=[avg_ltv_cac], 
                             marker_color=colors[i % len(colors)], showlegend=False), 
@@ -237,15 +503,19 @@ def analyze_city_maturity(cities_data: Dict):
     
     st.plotly_chart(fig, use_container_width=True)
 
-def show_city_recommendations(cities_data: Dict):
+def show_city_recommendations(cities_data: Dict, city_state: Optional[Dict] = None):
     """Рекомендации по городам"""
     st.subheader("💡 Стратегические рекомендации")
     
-    # Анализ лучших и худших городов
-    best_city = max(cities_data.keys(), key=lambda x: cities_data[x]['ltv_cac_ratio'])
-    worst_city = min(cities_data.keys(), key=lambda x: cities_data[x]['ltv_cac_ratio'])
-    
-    highest_potential = max(cities_data.keys(), key=lambda x: cities_data[x]['market_potential'])
+    # Анализ лучших и худших городов (из инкрементального состояния, если оно есть)
+    if city_state and city_state.get('best') in cities_data:
+        best_city = city_state['best']
+        worst_city = city_state['worst']
+        highest_potential = city_state['highest_potential']
+    else:
+        best_city = max(cities_data.keys(), key=lambda x: cities_data[x]['ltv_cac_ratio'])
+        worst_city = min(cities_data.keys(), key=lambda x: cities_data[x]['ltv_cac_ratio'])
+        highest_potential = max(cities_data.keys(), key=lambda x: cities_data[x]['market_potential'])
     
     col1, col2 = st.columns(2)
     
@@ -256,7 +526,7 @@ def show_city_recommendations(cities_data: Dict):
         **{best_city}**: LTV/CAC = {best_data['ltv_cac_ratio']:.1f}:1
         
         • Частота: {best_data['frequency']:.1f} поездок/месяц
-        • AOV: {best_data['aov']} руб
+        • AOV: {best_data['aov']:.0f} руб
         • Зрелость рынка: {best_data['maturity']}
         
         **Стратегия**: Максимальное масштабирование
@@ -267,9 +537,9 @@ def show_city_recommendations(cities_data: Dict):
         st.info(f"""
         **{highest_potential}**: Потенциал {potential_data['market_potential']:,.0f}
         
-        • Население: {potential_data['population']:,}
-        • Текущий CAC: {potential_data['cac']:,} руб
-        • Конкуренция: {potential_data['competition']}/10
+        • Население: {potential_data['population']:,.0f}
+        • Текущий CAC: {potential_data['cac']:,.0f} руб
+        • Конкуренция: {potential_data['competition']:.0f}/10
         """)
     
     with col2:
@@ -279,8 +549,8 @@ def show_city_recommendations(cities_data: Dict):
         **{worst_city}**: LTV/CAC = {worst_data['ltv_cac_ratio']:.1f}:1
         
         • Частота: {worst_data['frequency']:.1f} поездок/месяц
-        • CAC: {worst_data['cac']:,} руб
-        • Churn: {worst_data['churn']}%
+        • CAC: {worst_data['cac']:,.0f} руб
+        • Churn: {worst_data['churn']:.0f}%
         
         **Стратегия**: Оптимизация retention и частоты
         """)
@@ -288,7 +558,7 @@ def show_city_recommendations(cities_data: Dict):
         # Общие рекомендации по типам городов
         st.markdown("#### 📊 По типам городов")
         
-        for maturity in ["Зрелый", "Растущий", "Развивающийся"]:
+        for maturity in MATURITY_STAGES:
             cities_in_stage = [city for city, data in cities_data.items() 
                              if data['maturity'] == maturity]
             if cities_in_stage:
@@ -297,5 +567,244 @@ def show_city_recommendations(cities_data: Dict):
                     "Растущий": "Агрессивное масштабирование, захват доли",
                     "Развивающийся": "Образование рынка, низкие цены"
                 }
-                st.write(f"**{maturity}** ({', '.join(cities_in_stage)}): {stage_recommendations[maturity]}")
+                listed = ', '.join(cities_in_stage[:10])
+                if len(cities_in_stage) > 10:
+                    listed += f" и еще {len(cities_in_stage) - 10}"
+                st.write(f"**{maturity}** ({listed}): {stage_recommendations[maturity]}")
+
+def city_feature_matrix(inputs: pd.DataFrame) -> np.ndarray:
+    """Матрица признаков городов для поиска похожих (население в логарифме)"""
+    return np.column_stack([
+        np.log10(inputs['population'].to_numpy(dtype=float).clip(min=1)),
+        inputs['aov'].to_numpy(dtype=float),
+        inputs['frequency'].to_numpy(dtype=float),
+        inputs['take_rate'].to_numpy(dtype=float),
+        inputs['cac'].to_numpy(dtype=float),
+        inputs['competition'].to_numpy(dtype=float),
+        inputs['maturity'].map(MATURITY_CODES).to_numpy(dtype=float)
+    ])
+
+def build_city_similarity_index(inputs: pd.DataFrame) -> Dict:
+    """KD-дерево по нормализованным признакам городов"""
+    features = city_feature_matrix(inputs)
+    mean = features.mean(axis=0)
+    std = features.std(axis=0)
+    std[std == 0] = 1.0  # Константный признак не влияет на расстояние
+    
+    return {
+        'tree': cKDTree((features - mean) / std),
+        'mean': mean,
+        'std': std,
+        'cities': inputs.index
+    }
+
+def get_city_similarity_index(city_state: Dict) -> Dict:
+    """Индекс похожести из состояния городов (строится при первом запросе)"""
+    if 'similarity_index' not in city_state:
+        city_state['similarity_index'] = build_city_similarity_index(city_state['inputs'])
+    return city_state['similarity_index']
+
+def find_similar_cities(index: Dict, query: pd.DataFrame, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """k ближайших городов для каждой строки query: (расстояния, позиции в индексе)"""
+    k = min(k, len(index['cities']))
+    scaled = (city_feature_matrix(query) - index['mean']) / index['std']
+    distances, positions = index['tree'].query(scaled, k=k)
+    return distances.reshape(len(query), k), positions.reshape(len(query), k)
+
+def show_similar_cities(city_state: Dict):
+    """Похожие города для нового рынка"""
+    st.subheader("🔍 Похожие города для нового рынка")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        population = st.number_input("Население", 100_000, 20_000_000, 1_000_000, 50_000, key="similar_population")
+        aov = st.number_input("AOV (руб)", 100, 1000, 300, 10, key="similar_aov")
+        frequency = st.slider("Частота (поездок/месяц)", 1.0, 8.0, 3.0, key="similar_frequency")
+    
+    with col2:
+        take_rate = st.slider("Take Rate (%)", 15, 35, 24, key="similar_take_rate")
+        cac = st.number_input("Ожидаемый CAC (руб)", 100, 5000, 900, 50, key="similar_cac")
+        competition = st.slider("Конкуренция (1-10)", 0, 10, 5, key="similar_competition")
+    
+    with col3:
+        maturity = st.selectbox("Стадия рынка", MATURITY_STAGES, index=2, key="similar_maturity")
+        k = st.slider("Количество похожих городов", 1, 20, 3, key="similar_k")
+    
+    query = pd.DataFrame([{
+        'population': population, 'aov': aov, 'frequency': frequency, 'take_rate': take_rate,
+        'cac': cac, 'competition': competition, 'maturity': maturity
+    }])
+    
+    index = get_city_similarity_index(city_state)
+    distances, positions = find_similar_cities(index, query, k)
+    
+    neighbours = index['cities'][positions[0]]
+    metrics = city_state['metrics'].loc[neighbours]
+    
+    similar_df = pd.DataFrame({
+        'Город': neighbours,
+        'Расстояние': [f"{d:.2f}" for d in distances[0]],
+        'LTV': [f"{v:,.0f} руб" for v in metrics['ltv']],
+        'LTV/CAC': [f"{v:.1f}:1" for v in metrics['ltv_cac_ratio']],
+        'Стадия': city_state['inputs'].loc[neighbours, 'maturity'].to_numpy()
+    })
+    
+    st.dataframe(similar_df, use_container_width=True)
+    
+    weights = 1 / (distances[0] + 1e-6)
+    expected_ratio = np.average(metrics['ltv_cac_ratio'], weights=weights)
+    st.info(f"📊 **Ожидаемый LTV/CAC по аналогам**: {expected_ratio:.1f}:1 (взвешено по близости)")
 
+@st.cache_data(show_spinner=False)
+def city_balance_summary(monthly_rides: np.ndarray, supply_ratio: float, n_zones: int,
+                         trip_minutes: float, patience_minutes: float) -> Tuple[Dict, np.ndarray]:
+    """Итоги Erlang-C модели по городам и ожидание по часам недели (взвешено по зонам)"""
+    balance = city_supply_demand(monthly_rides, supply_ratio=supply_ratio, n_zones=n_zones,
+                                 trip_minutes=trip_minutes, patience_minutes=patience_minutes)
+    requests = balance['requests']
+    hourly_wait = (requests * balance['wait_minutes']).sum(axis=2) / np.maximum(requests.sum(axis=2), 1e-12)
+    return summarize_city_balance(balance), hourly_wait
+
+def show_supply_demand_balance(city_state: Dict):
+    """Баланс спроса и предложения: время подачи и потерянные заказы"""
+    st.subheader("⚖️ Баланс спроса и предложения")
+    
+    st.markdown("""
+    Модель очереди M/M/c (Erlang-C) по каждому городу, 168 часам недели и зонам города: 
+    водители на линии обслуживают поток заказов, при долгом ожидании пассажир уходит.
+    Раздел диагностический: LTV и LTV/CAC в остальных разделах и в таблице городов
+    дефицит водителей не учитывают.
+    """)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        supply_ratio = st.slider("Запас водителей на линии (× средней нагрузки)", 1.0, 3.0, 2.0, 0.1)
+        n_zones = st.slider("Количество зон в городе", 1, 30, 10)
+    
+    with col2:
+        trip_minutes = st.slider("Длительность заказа с подачей (мин)", 10, 40, 20)
+        patience_minutes = st.slider("Терпение пассажира (мин)", 3, 20, 10)
+    
+    inputs = city_state['inputs']
+    metrics = city_state['metrics']
+    
+    # Спрос города: поездки потенциального рынка в месяц
+    summary, hourly_wait = city_balance_summary(
+        metrics['market_potential'].to_numpy(), supply_ratio, n_zones, trip_minutes, patience_minutes
+    )
+    
+    # Оценка только для этой таблицы: потерянные заказы снижают реализованную частоту и LTV
+    adjusted_inputs = inputs.assign(frequency=inputs['frequency'] * (1 - summary['lost_share']))
+    adjusted_metrics = compute_city_metrics(adjusted_inputs)
+    
+    balance_df = pd.DataFrame({
+        'Город': inputs.index,
+        'Среднее ожидание': [f"{v:.1f} мин" for v in summary['avg_wait_minutes']],
+        'Пиковое ожидание': [f"{v:.1f} мин" for v in summary['peak_wait_minutes']],
+        'Загрузка водителей': [f"{v:.0%}" for v in summary['avg_utilization']],
+        'Потерянные заказы': [f"{v:.1%}" for v in summary['lost_share']],
+        'LTV': [f"{v:,.0f} руб" for v in metrics['ltv']],
+        'LTV с учетом дефицита': [f"{v:,.0f} руб" for v in adjusted_metrics['ltv']],
+        'LTV/CAC с учетом дефицита': [f"{v:.1f}:1" for v in adjusted_metrics['ltv_cac_ratio']]
+    })
+    
+    st.dataframe(balance_df, use_container_width=True)
+    
+    # Тепловая карта ожидания по часам недели для выбранного города
+    city = st.selectbox("Город для тепловой карты:", list(inputs.index), key="balance_city")
+    position = inputs.index.get_loc(city)
+    
+    fig = go.Figure(data=go.Heatmap(
+        z=hourly_wait[position].reshape(7, 24),
+        x=[f"{h:02d}:00" for h in range(24)],
+        y=["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"],
+        colorscale='RdYlGn_r',
+        colorbar=dict(title="мин")
+    ))
+    fig.update_layout(title=f"Среднее время подачи по часам недели: {city}", height=350)
+    
+    st.plotly_chart(fig, use_container_width=True)
+    
+    worst_position = int(np.argmax(summary['lost_share']))
+    if summary['lost_share'][worst_position] > 0.05:
+        st.warning(f"""
+        ⚠️ **Дефицит водителей**: в городе {inputs.index[worst_position]} теряется 
+        {summary['lost_share'][worst_position]:.1%} заказов. Нужны бонусы водителям в часы пик.
+        """)
+    else:
+        st.success("✅ Предложение водителей покрывает спрос во всех городах")
+
+@st.cache_data(show_spinner=False)
+def cached_hex_layers(cities: pd.DataFrame, rings: int) -> pd.DataFrame:
+    """Синтетическая гексагональная сетка для таблицы городов"""
+    return generate_hex_layers(cities, rings=rings)
+
+def show_hex_market_potential(city_state: Dict):
+    """Потенциал рынка и LTV/CAC по гексагональной сетке города"""
+    st.subheader("🗺️ Потенциал рынка по районам (гексагональная сетка)")
+    
+    st.markdown("""
+    Город разбивается на гексагональные ячейки со слоями населения, дохода и качества 
+    общественного транспорта. Спрос и LTV/CAC считаются по каждой ячейке и суммируются в итоги города.
+    """)
+    
+    inputs = city_state['inputs']
+    uploaded = st.file_uploader("Слои сетки (.npz или .csv: city, q, r, population, income, transit_quality)",
+                                type=["npz", "csv"], key="hex_layers")
+    
+    if uploaded is not None:
+        try:
+            layers = load_hex_layers(uploaded)
+        except (ValueError, KeyError) as error:
+            st.error(f"Не удалось прочитать файл: {error}")
+            return
+    else:
+        rings = st.slider("Радиус сетки (колец гексов вокруг центра)", 5, 60, 25)
+        layers = cached_hex_layers(inputs[['population']], rings)
+    
+    cells = hex_cell_economics(layers, inputs, city_state['metrics']['churn'].to_numpy(),
+                               MARKET_PENETRATION, OPS_COST)
+    totals = rollup_cells(cells, len(inputs))
+    
+    st.caption(f"Ячеек в расчете: {len(cells['potential']):,}")
+    
+    grid_df = pd.DataFrame({
+        'Город': inputs.index,
+        'Ячеек': totals['cells'].to_numpy(),
+        'Потенциал (простая модель)': [f"{v:,.0f}" for v in city_state['metrics']['market_potential']],
+        'Потенциал (сетка)': [f"{v:,.0f}" for v in totals['market_potential']],
+        'LTV (сетка)': [f"{v:,.0f} руб" for v in totals['ltv']],
+        'CAC (сетка)': [f"{v:,.0f} руб" for v in totals['cac']],
+        'Пользователи с LTV/CAC ≥ 3': [f"{v:.0%}" for v in totals['profitable_users_share']]
+    })
+    
+    st.dataframe(grid_df, use_container_width=True)
+    
+    # Карта ячеек выбранного города
+    city = st.selectbox("Город для карты:", list(inputs.index), key="hex_city")
+    in_city = cells['city_index'] == inputs.index.get_loc(city)
+    
+    if in_city.any():
+        city_layers = layers[layers['city'] == city]
+        xy = hex_to_xy(city_layers['q'].to_numpy(), city_layers['r'].to_numpy())
+        ratio = cells['ltv_cac_ratio'][in_city]
+        
+        # Для отрисовки ограничиваем число точек
+        shown = np.arange(len(ratio))
+        if len(shown) > 20_000:
+            shown = np.random.default_rng(0).choice(shown, 20_000, replace=False)
+        
+        fig = go.Figure(data=go.Scattergl(
+            x=xy[shown, 0],
+            y=xy[shown, 1],
+            mode='markers',
+            marker=dict(symbol='hexagon', size=6, color=ratio[shown], colorscale='RdYlGn',
+                        cmin=0, cmax=6, colorbar=dict(title="LTV/CAC")),
+            hovertemplate='LTV/CAC: %{marker.color:.1f}<extra></extra>'
+        ))
+        fig.update_layout(title=f"LTV/CAC по районам: {city}", xaxis_title="км", yaxis_title="км",
+                          yaxis=dict(scaleanchor="x"), height=500)
+        
+        st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy.spatial import cKDTree
+from typing import Dict, Tuple, Union
+
+HEX_LAYER_COLUMNS = ['city', 'q', 'r', 'population', 'income', 'transit_quality']
+NEUTRAL_TRANSIT_QUALITY = 5  # Качество транспорта (1-10), при котором спрос не корректируется
+
+
+def hex_disc(rings: int) -> np.ndarray:
+    """Осевые координаты (q, r) гексов в радиусе rings от центра"""
+    q, r = np.meshgrid(np.arange(-rings, rings + 1), np.arange(-rings, rings + 1), indexing='ij')
+    q, r = q.ravel(), r.ravel()
+    inside = np.abs(q + r) <= rings
+    return np.column_stack([q[inside], r[inside]])
+
+def hex_distance(q: np.ndarray, r: np.ndarray) -> np.ndarray:
+    """Расстояние в гексах от центра (0, 0)"""
+    return np.maximum.reduce([np.abs(q), np.abs(r), np.abs(q + r)])
+
+def hex_to_xy(q: np.ndarray, r: np.ndarray, size_km: float = 0.5) -> np.ndarray:
+    """Координаты центров гексов в км (pointy-top)"""
+    x = size_km * np.sqrt(3) * (q + r / 2)
+    y = size_km * 1.5 * r
+    return np.column_stack([x, y])
+
+def generate_hex_layers(cities: pd.DataFrame, rings: int = 30, avg_income: float = 55000,
+                        seed: int = 42) -> pd.DataFrame:
+    """Синтетическая сетка: население убывает от центра, доход и транспорт с шумом"""
+    rng = np.random.default_rng(seed)
+    disc = hex_disc(rings)
+    n_cells = len(disc)
+    n_cities = len(cities)
+
+    distance = hex_distance(disc[:, 0], disc[:, 1]) / max(rings, 1)
+
+    # Плотность: экспоненциальный спад от центра с локальным шумом
+    density = np.exp(-3 * distance)[None, :] * rng.lognormal(0, 0.4, size=(n_cities, n_cells))
+    population = density / density.sum(axis=1, keepdims=True) * cities['population'].to_numpy(dtype=float)[:, None]
+
+    income = avg_income * (1.3 - 0.5 * distance)[None, :] * rng.lognormal(0, 0.15, size=(n_cities, n_cells))
+    transit_quality = np.clip(9 - 7 * distance[None, :] + rng.normal(0, 1, size=(n_cities, n_cells)), 1, 10)
+
+    return pd.DataFrame({
+        'city': np.repeat(cities.index.to_numpy(), n_cells),
+        'q': np.tile(disc[:, 0], n_cities),
+        'r': np.tile(disc[:, 1], n_cities),
+        'population': population.ravel(),
+        'income': income.ravel(),
+        'transit_quality': transit_quality.ravel()
+    })
+
+def load_hex_layers(source: Union[str, Path, object]) -> pd.DataFrame:
+    """Загрузка слоев сетки из .npz (массивы по колонкам) или .csv"""
+    name = str(getattr(source, 'name', source))
+
+    if name.endswith('.npz'):
+        with np.load(source, allow_pickle=False) as data:
+            available = set(data.files)
+            layers = pd.DataFrame({column: data[column] for column in HEX_LAYER_COLUMNS if column in available})
+    else:
+        layers = pd.read_csv(source)
+        available = set(layers.columns)
+
+    missing = set(HEX_LAYER_COLUMNS) - available
+    if missing:
+        raise ValueError(f"В слоях сетки нет колонок: {', '.join(sorted(missing))}")
+    return layers[HEX_LAYER_COLUMNS]
+
+def hex_cell_economics(layers: pd.DataFrame, cities: pd.DataFrame, churn: np.ndarray,
+                       penetration: float, ops_cost: float) -> Dict[str, np.ndarray]:
+    """Спрос, потенциал и LTV/CAC по каждой ячейке сетки"""
+    city_index = pd.Index(cities.index).get_indexer(layers['city'])
+    known = city_index >= 0
+    city_index = city_index[known]
+    n_cities = len(cities)
+
+    population = layers['population'].to_numpy(dtype=float)[known]
+    income = layers['income'].to_numpy(dtype=float)[known]
+    transit = layers['transit_quality'].to_numpy(dtype=float)[known]
+
+    # Доход и плотность относительно среднего по городу (взвешено по населению)
+    city_population = np.bincount(city_index, weights=population, minlength=n_cities)
+    safe_population = np.where(city_population > 0, city_population, 1.0)
+    mean_income = np.bincount(city_index, weights=population * income, minlength=n_cities) / safe_population
+    income_index = income / np.where(mean_income > 0, mean_income, 1.0)[city_index]
+
+    cells_per_city = np.bincount(city_index, minlength=n_cities)
+    mean_cell_population = safe_population / np.maximum(cells_per_city, 1)
+    density_index = population / mean_cell_population[city_index]
+
+    aov = cities['aov'].to_numpy(dtype=float)[city_index]
+    frequency = cities['frequency'].to_numpy(dtype=float)[city_index]
+    take_rate = cities['take_rate'].to_numpy(dtype=float)[city_index]
+    cac = cities['cac'].to_numpy(dtype=float)[city_index]
+
+    # Богатые районы чаще и дороже ездят, хороший транспорт отнимает спрос
+    transit_factor = np.clip(1 - 0.06 * (transit - NEUTRAL_TRANSIT_QUALITY), 0.5, 1.5)
+    cell_penetration = penetration * np.sqrt(income_index) * transit_factor
+    cell_frequency = frequency * income_index ** 0.3
+    cell_aov = aov * income_index ** 0.2
+    # В плотных районах привлечение дешевле, на окраинах дороже
+    cell_cac = cac * np.clip(density_index, 0.2, 5) ** -0.25
+
+    potential = population * cell_penetration * cell_frequency
+    monthly_profit = cell_aov * take_rate / 100 * cell_frequency - ops_cost
+    ltv = monthly_profit / (np.asarray(churn, dtype=float)[city_index] / 100)
+
+    return {
+        'city_index': city_index,
+        'population': population,
+        'potential': potential,
+        'users': population * cell_penetration,
+        'ltv': ltv,
+        'cac': cell_cac,
+        'ltv_cac_ratio': ltv / cell_cac
+    }
+
+def rollup_cells(cells: Dict[str, np.ndarray], n_cities: int) -> pd.DataFrame:
+    """Агрегация ячеек в итоги по городам"""
+    city_index = cells['city_index']
+    users = cells['users']
+    safe_users = np.maximum(np.bincount(city_index, weights=users, minlength=n_cities), 1e-12)
+
+    return pd.DataFrame({
+        'cells': np.bincount(city_index, minlength=n_cities),
+        'market_potential': np.bincount(city_index, weights=cells['potential'], minlength=n_cities),
+        'users': np.bincount(city_index, weights=users, minlength=n_cities),
+        # LTV и CAC города: среднее по пользователям ячеек
+        'ltv': np.bincount(city_index, weights=users * cells['ltv'], minlength=n_cities) / safe_users,
+        'cac': np.bincount(city_index, weights=users * cells['cac'], minlength=n_cities) / safe_users,
+        'profitable_users_share': np.bincount(
+            city_index, weights=users * (cells['ltv_cac_ratio'] >= 3), minlength=n_cities
+        ) / safe_users
+    })
+
+TRIP_COLUMNS = ['origin_x', 'origin_y', 'dest_x', 'dest_y']
+TRIP_SEGMENT_BOUNDS_KM = (3, 10)  # Короткие < 3 км, средние 3-10 км, длинные > 10 км
+TRIP_SEGMENT_NAMES = ['Короткие поездки (<3 км)', 'Средние поездки (3-10 км)', 'Длинные поездки (>10 км)']
+SEGMENT_SWITCH_RATES = np.array([0.45, 0.25, 0.10])  # Доля переключающихся при покрытии обоих концов
+PREMIUM_SWITCH_FACTOR = 0.3  # Премиум менее чувствителен к альтернативе
+
+
+def generate_trips(n_trips: int, city_radius_km: float = 15, premium_share: float = 0.1,
+                   seed: int = 42) -> Dict[str, np.ndarray]:
+    """Синтетические поездки: начала сгущаются к центру, длина логнормальная, направление к центру"""
+    rng = np.random.default_rng(seed)
+
+    radius = np.minimum(rng.exponential(4.0, n_trips), city_radius_km)
+    angle = rng.uniform(0, 2 * np.pi, n_trips)
+    origins = np.column_stack([radius * np.cos(angle), radius * np.sin(angle)])
+
+    # Поездки чаще направлены к центру, чем от него
+    length = np.minimum(rng.lognormal(np.log(5), 0.7, n_trips), 2 * city_radius_km)
+    heading = angle + np.pi + rng.vonmises(0, 1.0, n_trips)
+    destinations = origins + length[:, None] * np.column_stack([np.cos(heading), np.sin(heading)])
+
+    return {
+        'origins': origins.astype(np.float32),
+        'destinations': destinations.astype(np.float32),
+        'premium': rng.random(n_trips) < premium_share
+    }
+
+def load_trip_points(source: Union[str, Path, object]) -> Dict[str, np.ndarray]:
+    """Загрузка поездок из .npz (массивы по колонкам) или .csv, координаты в км"""
+    name = str(getattr(source, 'name', source))
+
+    if name.endswith('.npz'):
+        with np.load(source, allow_pickle=False) as data:
+            trips = pd.DataFrame({column: data[column] for column in data.files})
+    else:
+        trips = pd.read_csv(source)
+
+    missing = set(TRIP_COLUMNS) - set(trips.columns)
+    if missing:
+        raise ValueError(f"В поездках нет колонок: {', '.join(sorted(missing))}")
+
+    premium = trips['premium'].to_numpy(dtype=bool) if 'premium' in trips else np.zeros(len(trips), dtype=bool)
+    return {
+        'origins': trips[['origin_x', 'origin_y']].to_numpy(dtype=np.float32),
+        'destinations': trips[['dest_x', 'dest_y']].to_numpy(dtype=np.float32),
+        'premium': premium
+    }
+
+def metro_network(n_new_stations: int, n_lines: int = 5, core_radius_km: float = 6,
+                  spacing_km: float = 1.2) -> Tuple[np.ndarray, np.ndarray]:
+    """Радиальные линии метро: действующие станции в ядре и новые станции продлений линий"""
+    line_angles = np.linspace(0, 2 * np.pi, n_lines, endpoint=False) + 0.3
+    directions = np.column_stack([np.cos(line_angles), np.sin(line_angles)])
+
+    existing_steps = np.arange(0, core_radius_km + 1e-9, spacing_km)
+    existing = (existing_steps[:, None, None] * directions[None, :, :]).reshape(-1, 2)
+    existing = np.unique(np.round(existing, 6), axis=0)
+
+    # Новые станции продлевают линии по очереди, каждая следующая дальше от центра
+    step = np.arange(n_new_stations)
+    line = step % n_lines
+    distance = existing_steps[-1] + spacing_km * (step // n_lines + 1)
+    new = distance[:, None] * directions[line]
+    return existing, new
+
+def nearest_station_within(points: np.ndarray, stations: np.ndarray,
+                           walk_km: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Есть ли станция в пешей доступности точки и индекс ближайшей из них (KD-дерево)"""
+    if not len(stations):
+        return np.zeros(len(points), dtype=bool), np.zeros(len(points), dtype=int)
+    _, station = cKDTree(stations).query(points, distance_upper_bound=walk_km, workers=-1)
+    # Промах запроса возвращает индекс len(stations)
+    return station < len(stations), station
+
+def station_catchment_impact(trips: Dict[str, np.ndarray], existing_stations: np.ndarray,
+                             new_stations: np.ndarray, walk_km: float = 0.8, price_ratio: float = 7.8,
+                             quality_multiplier: float = 1.0) -> Dict[str, np.ndarray]:
+    """Потеря поездок ride-hailing от новых станций: KD-деревья станций и дальность каждой поездки
+
+    Поездка переходит в зону конкуренции с метро, если после открытия оба ее конца в пешей
+    доступности станций, а до открытия хотя бы один конец был вне доступности существующих.
+    Новые станции ищутся отдельным деревом, поэтому конец у новой станции учитывается, даже если
+    ближайшая к нему станция - существующая. Вероятность ухода зависит от сегмента
+    по дальности, соотношения цен и качества общественного транспорта.
+    """
+    origins = trips['origins']
+    destinations = trips['destinations']
+
+    origin_existing, _ = nearest_station_within(origins, existing_stations, walk_km)
+    dest_existing, _ = nearest_station_within(destinations, existing_stations, walk_km)
+    origin_new, origin_station = nearest_station_within(origins, new_stations, walk_km)
+    dest_new, dest_station = nearest_station_within(destinations, new_stations, walk_km)
+
+    covered_before = origin_existing & dest_existing
+    covered_after = (origin_existing | origin_new) & (dest_existing | dest_new)
+    newly_covered = covered_after & ~covered_before
+
+    distance = np.linalg.norm(destinations - origins, axis=1)
+    segment = np.digitize(distance, TRIP_SEGMENT_BOUNDS_KM)
+
+    # Чем дороже ride-hailing относительно метро, тем больше уходят
+    price_factor = np.clip((price_ratio - 1) / 10, 0, 1)
+    switch_probability = np.minimum(
+        SEGMENT_SWITCH_RATES[segment] * price_factor * quality_multiplier
+        * np.where(trips['premium'], PREMIUM_SWITCH_FACTOR, 1.0), 1.0
+    ) * newly_covered
+
+    # Тариф растет с дальностью: посадка + километраж
+    fare_weight = 0.4 + 0.6 * distance / max(distance.mean(), 1e-9)
+    n_segments = len(TRIP_SEGMENT_BOUNDS_KM) + 1
+
+    # Станция, к которой ушла поездка: новая станция у конца, который раньше был вне доступности
+    new_station = np.where(origin_new & ~origin_existing, origin_station, dest_station)
+
+    return {
+        'segment_trips': np.bincount(segment, minlength=n_segments),
+        'segment_covered': np.bincount(segment, weights=newly_covered, minlength=n_segments),
+        'segment_lost': np.bincount(segment, weights=switch_probability, minlength=n_segments),
+        'premium_trips': trips['premium'].sum(),
+        'premium_lost': switch_probability[trips['premium']].sum(),
+        'station_lost': np.bincount(new_station[newly_covered], weights=switch_probability[newly_covered],
+                                    minlength=len(new_stations)),
+        'lost_share': switch_probability.mean(),
+        'revenue_lost_share': (switch_probability * fare_weight).sum() / fare_weight.sum(),
+        'switch_probability': switch_probability
+    }
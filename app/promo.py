@@ -9,6 +9,22 @@ from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import random
 from typing import Dict, List, Tuple, Optional
+from app.promo_kernels import (
+    new_user_promo_kernel, optimize_new_user_promo, simulate_new_user_prospects, reactivation_promo_kernel,
+    retention_promo_kernel, competitive_defense_kernel, promo_program_curves, promo_allocation_path,
+    allocate_promo_budget, generate_reactivation_data, load_reactivation_table, fit_reactivation_curves,
+    split_history, reactivation_curve, optimize_bucket_discounts, REACTIVATION_HISTORY_COLUMNS, REACTIVATION_SEGMENTS,
+    REACTIVATION_BASE_RATES, REACTIVATED_LTV, RETENTION_SEGMENTS, DEFENSE_STRATEGIES, RESPONSE_SPEEDS,
+    best_defense_response, DEFENSE_SEGMENT_NAMES, fit_frequency_from_segments, fit_frequency_from_rides,
+    frequency_bins, frequency_segments_kernel, optimize_frequency_segments, BEHAVIOR_SEGMENT_NAMES,
+    generate_slot_table, load_slot_table, optimize_hour_of_week_pricing, DAY_NAMES, generate_ride_log_chunks,
+    read_ride_log_chunks, accumulate_rfm, rfm_scores, value_tier_table, VALUE_TIER_NAMES, VALUE_TIER_REVENUE_LIFT,
+    VALUE_TIER_PROMO_BUDGET, generate_zone_table, load_zone_table, allocate_zone_discounts, ZONE_COLUMNS,
+    ZONE_NEW_USER_LTV, HABIT_SCALE,
+    PROMO_PROGRAM_NAMES, generate_retention_users, feature_matrix, fit_churn_model, churn_probability,
+    rank_retention_targets, RETENTION_FEATURES, RETENTION_FEATURE_NAMES, RETAINED_LTV
+)
+
 def promo_optimizer():
     """Оптимизатор промокодов"""
     st.header("💰 Оптимизатор промокодов")
@@ -26,7 +42,8 @@ def promo_optimizer():
             "🔄 Реактивация неактивных",
             "💎 Retention существующих",
             "🆚 Конкурентная защита",
-            "🎯 Sегментированные промо"
+            "🎯 Sегментированные промо",
+            "⚖️ Распределение общего бюджета"
         ]
     )
     
@@ -40,6 +57,8 @@ def promo_optimizer():
         competitive_defense_promo()
     elif promo_type == "🎯 Sегментированные промо":
         segmented_promo_optimization()
+    elif promo_type == "⚖️ Распределение общего бюджета":
+        promo_budget_allocation()
 
 def new_user_promo_optimization():
     """Оптимизация промокодов для новых пользователей"""
@@ -53,6 +72,7 @@ def new_user_promo_optimization():
         promo_discount = st.slider("Размер скидки (%)", 20, 80, 50)
         max_rides_promo = st.slider("Максимум поездок по промо", 1, 10, 3)
         promo_budget = st.number_input("Бюджет на промокоды (руб)", 500000, 20000000, 3000000)
+        reachable_prospects = st.number_input("Охват кампании (потенциальных клиентов)", 1000, 1000000, 50000, 1000)
         
         # Базовые метрики
         base_aov = 350
@@ -64,34 +84,21 @@ def new_user_promo_optimization():
         promo_elasticity = st.slider("Эластичность к размеру скидки", 0.5, 2.0, 1.2)
         activation_rate = st.slider("Доля делающих 2+ поездки (%)", 30, 80, 55)
         organic_frequency = st.slider("Частота после промо", 2.0, 6.0, 3.8)
+        habit_curve = st.checkbox("Активация зависит от числа промо-поездок",
+                                  help="Кривая привычки: доля активации равна заданной при 3 промо-поездках, "
+                                       "при одной - около 77% от нее, сверх трех растет на доли процента")
+        habit_scale = HABIT_SCALE if habit_curve else None
         
     # Расчет эффективности промокампании
+    campaign = new_user_promo_kernel(promo_discount, max_rides_promo, promo_budget, promo_elasticity,
+                                     activation_rate, organic_frequency, reachable_prospects,
+                                     base_aov=base_aov, base_conversion_rate=base_conversion_rate,
+                                     habit_scale=habit_scale)
+    campaign = {key: np.asarray(value).item() for key, value in campaign.items()}
     
-    # Влияние размера скидки на конверсию
-    boosted_conversion = base_conversion_rate * (1 + (promo_discount / 100) * promo_elasticity)
-    
-    # Количество пользователей, которых можем привлечь
-    promo_aov = base_aov * (1 - promo_discount / 100)
-    cost_per_promo_ride = base_aov - promo_aov
-    
-    # Максимальное количество новых пользователей при данном бюджете
-    max_new_users = promo_budget / (cost_per_promo_ride * max_rides_promo)
-    
-    # Фактическое количество с учетом конверсии
-    actual_new_users = max_new_users * (boosted_conversion / 100) if boosted_conversion <= 100 else max_new_users
-    
-    # LTV анализ
-    # Промо-пользователи: первые max_rides_promo по скидке, потом organic
-    promo_revenue = actual_new_users * max_rides_promo * promo_aov * 0.25  # 25% take rate
-    
-    # Активированные пользователи продолжают использовать сервис
-    activated_users = actual_new_users * (activation_rate / 100)
-    organic_ltv_per_user = (base_aov * 0.25 * organic_frequency) / 0.12  # 12% месячный churn
-    total_organic_revenue = activated_users * organic_ltv_per_user
-    
-    total_revenue = promo_revenue + total_organic_revenue
-    effective_cac = promo_budget / actual_new_users if actual_new_users > 0 else float('inf')
-    ltv_per_user = total_revenue / actual_new_users if actual_new_users > 0 else 0
+    actual_new_users = campaign['new_users']
+    effective_cac = campaign['effective_cac'] if actual_new_users > 0 else float('inf')
+    ltv_per_user = campaign['ltv_per_user'] if actual_new_users > 0 else 0
     
     # Результаты
     st.subheader("📈 Результаты промокампании")
@@ -119,112 +126,160 @@ def new_user_promo_optimization():
     
     # Оптимизация промо-параметров
     create_promo_optimization_chart(promo_budget, base_aov, base_conversion_rate, 
-                                   activation_rate, organic_frequency, promo_elasticity)
+                                   activation_rate, organic_frequency, promo_elasticity,
+                                   reachable_prospects, promo_discount, max_rides_promo, habit_scale)
+    
+    if st.checkbox("🎲 Стохастическая симуляция по клиентам"):
+        show_prospect_simulation(promo_discount, max_rides_promo, promo_budget, promo_elasticity,
+                                 activation_rate, organic_frequency, reachable_prospects, habit_scale)
     
     # Рекомендации
     show_promo_recommendations(ltv_cac_ratio, promo_discount, activation_rate)
 
+@st.cache_data(show_spinner=False)
+def cached_new_user_promo_optimization(elasticity: float, aov: float, base_conv: float, activation: float,
+                                       frequency: float, reachable_prospects: float,
+                                       habit_scale: Optional[float] = None) -> Dict:
+    """Поверхность и оптимальные планы промокампании (кэш по входам)"""
+    return optimize_new_user_promo(elasticity, reachable_prospects, activation_rate=activation,
+                                   organic_frequency=frequency, base_aov=aov, base_conversion_rate=base_conv,
+                                   habit_scale=habit_scale)
+
 def create_promo_optimization_chart(budget: int, aov: float, base_conv: float,
-                                   activation: float, frequency: float, elasticity: float):
-    """График оптимизации промопараметров"""
+                                   activation: float, frequency: float, elasticity: float,
+                                   reachable_prospects: float, discount: Optional[float] = None,
+                                   max_rides: Optional[float] = None, habit_scale: Optional[float] = None):
+    """Карты ROI и LTV/CAC по сетке промопараметров и непрерывные оптимумы"""
     
     st.subheader("🎯 Оптимизация промопараметров")
     
-    # Сценарии с разными размерами скидок
-    discount_range = np.arange(20, 81, 10)
-    scenarios = []
+    optimization = cached_new_user_promo_optimization(elasticity, aov, base_conv, activation, frequency,
+                                                      reachable_prospects, habit_scale)
+    plans = optimization['plans']
     
-    for discount in discount_range:
-        # Расчет для каждого уровня скидки
-        boosted_conv = base_conv * (1 + (discount / 100) * elasticity)
-        promo_aov = aov * (1 - discount / 100)
-        cost_per_ride = aov - promo_aov
-        
-        max_users = budget / (cost_per_ride * 3)  # 3 промо-поездки
-        actual_users = max_users * min(boosted_conv / 100, 1.0)
-        
-        # LTV расчет
-        promo_revenue = actual_users * 3 * promo_aov * 0.25
-        activated = actual_users * (activation / 100)
-        organic_ltv = (aov * 0.25 * frequency) / 0.12
-        total_revenue = promo_revenue + activated * organic_ltv
-        
-        cac = budget / actual_users if actual_users > 0 else 0
-        ltv = total_revenue / actual_users if actual_users > 0 else 0
-        roi = (total_revenue - budget) / budget * 100 if budget > 0 else 0
-        
-        scenarios.append({
-            'discount': discount,
-            'users': actual_users,
-            'cac': cac,
-            'ltv': ltv,
-            'roi': roi,
-            'ltv_cac_ratio': ltv / cac if cac > 0 else 0
-        })
+    grid_size = np.prod([len(optimization[axis]) for axis in ('discounts', 'rides', 'budgets', 'elasticities')])
+    st.caption(f"Сетка: {grid_size:,} конфигураций (скидка × промо-поездки × бюджет × эластичность), "
+               f"оптимумы уточнены до непрерывных значений. ROI и LTV/CAC не зависят от бюджета, пока он "
+               f"не превышает стоимость охвата, поэтому бюджет плана - стоимость всего охвата")
     
-    df_scenarios = pd.DataFrame(scenarios)
+    plans_df = pd.DataFrame([
+        {
+            'План': name,
+            'Скидка': f"{plan['promo_discount']:.1f}%",
+            'Промо-поездок': f"{plan['max_rides_promo']:.1f}",
+            'Бюджет': f"{plan['promo_budget']:,.0f} руб",
+            'Пользователи': f"{plan['new_users']:,.0f}",
+            'CAC': f"{plan['effective_cac']:,.0f} руб",
+            'LTV/CAC': f"{plan['ltv_cac_ratio']:.2f}",
+            'ROI': f"{plan['roi']:.1f}%"
+        }
+        for name, plan in [("Максимум ROI", plans['roi']), ("Максимум LTV/CAC", plans['ltv_cac_ratio'])]
+    ])
+    st.dataframe(plans_df, use_container_width=True)
+    
+    # Срезы поверхности при текущих бюджете и эластичности
+    b_idx = int(np.abs(optimization['budgets'] - budget).argmin())
+    e_idx = int(np.abs(optimization['elasticities'] - elasticity).argmin())
     
-    # График сравнения сценариев
     fig = make_subplots(
         rows=2, cols=2,
-        subplot_titles=('Привлеченные пользователи', 'LTV/CAC соотношение',
-                       'ROI кампании', 'CAC vs LTV'),
-        specs=[[{"type": "bar"}, {"type": "bar"}],
-               [{"type": "bar"}, {"type": "scatter"}]]
+        subplot_titles=('ROI кампании (%)', 'LTV/CAC', 'Лучший ROI: бюджет × эластичность',
+                        'Оптимальная скидка по эластичности'),
+        horizontal_spacing=0.12, vertical_spacing=0.15
     )
     
-    # График 1: Пользователи
-    fig.add_trace(
-        go.Bar(x=df_scenarios['discount'], y=df_scenarios['users'],
-               marker_color='blue', showlegend=False),
-        row=1, col=1
-    )
+    fig.add_trace(go.Heatmap(x=optimization['rides'], y=optimization['discounts'],
+                             z=optimization['roi'][:, :, b_idx, e_idx], colorscale='RdYlGn',
+                             colorbar=dict(x=0.45, y=0.8, len=0.4)), row=1, col=1)
+    fig.add_trace(go.Heatmap(x=optimization['rides'], y=optimization['discounts'],
+                             z=optimization['ltv_cac_ratio'][:, :, b_idx, e_idx], colorscale='Viridis',
+                             colorbar=dict(x=1.0, y=0.8, len=0.4)), row=1, col=2)
+    fig.add_trace(go.Heatmap(x=optimization['elasticities'], y=optimization['budgets'],
+                             z=optimization['roi'].max(axis=(0, 1)), colorscale='RdYlGn',
+                             colorbar=dict(x=0.45, y=0.2, len=0.4)), row=2, col=1)
+    
+    for objective, name, color in [('roi', 'ROI', 'green'), ('ltv_cac_ratio', 'LTV/CAC', 'purple')]:
+        fig.add_trace(go.Scatter(x=optimization['elasticities'], y=optimization['optimal_discount'][objective],
+                                 mode='lines', name=name, line=dict(color=color, width=3)), row=2, col=2)
+    
+    if discount is not None and max_rides is not None:
+        for col in (1, 2):
+            fig.add_trace(go.Scatter(x=[max_rides], y=[discount], mode='markers', showlegend=False,
+                                     marker=dict(size=12, color='black', symbol='x')), row=1, col=col)
+    
+    fig.update_layout(height=750, showlegend=True, legend=dict(x=0.75, y=0.02))
+    fig.update_xaxes(title_text="Промо-поездок", row=1, col=1)
+    fig.update_xaxes(title_text="Промо-поездок", row=1, col=2)
+    fig.update_xaxes(title_text="Эластичность", row=2, col=1)
+    fig.update_xaxes(title_text="Эластичность", row=2, col=2)
+    fig.update_yaxes(title_text="Скидка (%)", row=1, col=1)
+    fig.update_yaxes(title_text="Скидка (%)", row=1, col=2)
+    fig.update_yaxes(title_text="Бюджет (руб)", row=2, col=1)
+    fig.update_yaxes(title_text="Скидка (%)", row=2, col=2)
     
-    # График 2: LTV/CAC
-    fig.add_trace(
-        go.Bar(x=df_scenarios['discount'], y=df_scenarios['ltv_cac_ratio'],
-               marker_color='green', showlegend=False),
-        row=1, col=2
-    )
+    st.plotly_chart(fig, use_container_width=True)
     
-    # График 3: ROI
-    colors = ['green' if roi > 0 else 'red' for roi in df_scenarios['roi']]
-    fig.add_trace(
-        go.Bar(x=df_scenarios['discount'], y=df_scenarios['roi'],
-               marker_color=colors, showlegend=False),
-        row=2, col=1
-    )
+    # Оптимальные параметры
+    optimal = plans['roi']
+    notice = st.success if optimal['roi'] >= 0 else st.warning
+    notice(f"""
+    🎯 **Оптимальный план (максимум ROI)**: скидка {optimal['promo_discount']:.1f}%, 
+    {optimal['max_rides_promo']:.1f} промо-поездки, бюджет {optimal['promo_budget']:,.0f} руб
     
-    # График 4: CAC vs LTV scatter
-    fig.add_trace(
-        go.Scatter(x=df_scenarios['cac'], y=df_scenarios['ltv'],
-                  mode='markers+text', text=[f"{d}%" for d in df_scenarios['discount']],
-                  textposition="top center", marker=dict(size=10, color='purple'),
-                  showlegend=False),
-        row=2, col=2
-    )
+    • Привлеченных пользователей: {optimal['new_users']:,.0f}
+    • LTV/CAC: {optimal['ltv_cac_ratio']:.1f}:1
+    • ROI кампании: {optimal['roi']:.1f}%
+    """)
+
+@st.cache_data(show_spinner=False)
+def cached_prospect_simulation(**params) -> Dict[str, np.ndarray]:
+    """Кэшированная стохастическая симуляция промокампании"""
+    return simulate_new_user_prospects(**params)
+
+def show_prospect_simulation(promo_discount: float, max_rides_promo: int, promo_budget: float,
+                             promo_elasticity: float, activation_rate: float, organic_frequency: float,
+                             reachable_prospects: float, habit_scale: Optional[float] = None):
+    """Распределение CAC и ROI по симуляциям кампании на уровне отдельных клиентов"""
     
-    fig.update_layout(height=600)
-    fig.update_xaxes(title_text="Размер скидки (%)", row=1, col=1)
-    fig.update_xaxes(title_text="Размер скидки (%)", row=1, col=2)
-    fig.update_xaxes(title_text="Размер скидки (%)", row=2, col=1)
-    fig.update_xaxes(title_text="CAC (руб)", row=2, col=2)
-    fig.update_yaxes(title_text="Пользователи", row=1, col=1)
-    fig.update_yaxes(title_text="LTV/CAC", row=1, col=2)
-    fig.update_yaxes(title_text="ROI (%)", row=2, col=1)
-    fig.update_yaxes(title_text="LTV (руб)", row=2, col=2)
+    col1, col2 = st.columns(2)
+    with col1:
+        n_simulations = st.slider("Число симуляций кампании", 50, 1000, 200, 50)
+    with col2:
+        promo_ride_continue = st.slider("Вероятность использовать следующую промо-поездку", 0.5, 1.0, 0.9, 0.05)
+    
+    with st.spinner("Симуляция клиентов..."):
+        simulation = cached_prospect_simulation(
+            promo_discount=promo_discount, max_rides_promo=max_rides_promo, promo_budget=promo_budget,
+            promo_elasticity=promo_elasticity, activation_rate=activation_rate,
+            organic_frequency=organic_frequency, reachable_prospects=reachable_prospects,
+            promo_ride_continue=promo_ride_continue, habit_scale=habit_scale, n_simulations=n_simulations
+        )
     
-    st.plotly_chart(fig, use_container_width=True)
+    cac = simulation['effective_cac'][np.isfinite(simulation['effective_cac'])]
+    roi = simulation['roi']
     
-    # Оптимальная скидка
-    optimal_scenario = max(scenarios, key=lambda x: x['roi'])
-    st.success(f"""
-    🎯 **Оптимальный размер скидки**: {optimal_scenario['discount']}%
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Пользователей (медиана)", f"{np.median(simulation['new_users']):,.0f}")
+    with col2:
+        st.metric("CAC P5–P95", f"{np.percentile(cac, 5):,.0f}–{np.percentile(cac, 95):,.0f} руб"
+                  if len(cac) else "—")
+    with col3:
+        st.metric("ROI P5–P95", f"{np.percentile(roi, 5):.0f}%…{np.percentile(roi, 95):.0f}%")
+    with col4:
+        st.metric("Бюджет исчерпан", f"{simulation['budget_exhausted'].mean() * 100:.0f}% симуляций")
     
-    • Привлеченных пользователей: {optimal_scenario['users']:,.0f}
-    • LTV/CAC: {optimal_scenario['ltv_cac_ratio']:.1f}:1
-    • ROI кампании: {optimal_scenario['roi']:.1f}%
-    """)
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('Эффективный CAC (руб)', 'ROI кампании (%)'))
+    fig.add_trace(go.Histogram(x=cac, nbinsx=40, marker_color='orange', name='CAC'), row=1, col=1)
+    fig.add_trace(go.Histogram(x=roi, nbinsx=40, marker_color='green', name='ROI'), row=1, col=2)
+    fig.add_vline(x=0, line_dash="dash", line_color="red", row=1, col=2)
+    fig.update_layout(height=380, showlegend=False)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.caption(f"Вероятность убыточной кампании: {(roi < 0).mean() * 100:.0f}%. "
+               f"Средний охват до остановки: {simulation['prospects_reached'].mean():,.0f} клиентов. "
+               "Симуляция списывает бюджет только за использованные промо-поездки, "
+               "поэтому CAC ниже детерминированной оценки с резервом на каждый промокод.")
 
 def show_promo_recommendations(ltv_cac_ratio: float, discount: int, activation: int):
     """Рекомендации по промокодам"""
@@ -298,41 +353,22 @@ def reactivation_promo_optimization():
         promo_size = st.slider("Размер скидки (%)", 15, 50, 25)
         personalization_lift = st.slider("Лифт от персонализации (%)", 10, 100, 40)
     
-    # Базовые показатели реактивации по сегментам
-    base_reactivation_rates = {
-        'recent': 12,  # % реактивируются без промо
-        'long': 6,
-        'dormant': 2
-    }
-    
-    # Эффект промокодов и персонализации
-    promo_lift = promo_size / 20  # Каждые 20% скидки = 1x лифт
-    total_lift = promo_lift * (1 + personalization_lift / 100)
-    
     # Расчет по сегментам
-    segments_analysis = {}
-    total_reactivated = 0
-    total_cost = 0
-    
-    for segment, count in [('recent', recent_inactive), ('long', long_inactive), ('dormant', dormant)]:
-        base_rate = base_reactivation_rates[segment.split('_')[0] if '_' in segment else segment]
-        boosted_rate = min(base_rate * (1 + total_lift), 50)  # Максимум 50% реактивация
-        
-        reactivated = count * (boosted_rate / 100)
-        cost_per_reactivation = 350 * (promo_size / 100) * 2  # 2 промо-поездки
-        segment_cost = reactivated * cost_per_reactivation
-        
-        segments_analysis[segment] = {
+    reactivation = reactivation_promo_kernel((recent_inactive, long_inactive, dormant), promo_size,
+                                             personalization_lift)
+    segments_analysis = {
+        segment: {
             'count': count,
-            'base_rate': base_rate,
-            'boosted_rate': boosted_rate,
-            'reactivated': reactivated,
-            'cost': segment_cost,
-            'cac': cost_per_reactivation
+            'base_rate': REACTIVATION_BASE_RATES[k],
+            'boosted_rate': reactivation['boosted_rate'][k],
+            'reactivated': reactivation['reactivated'][k],
+            'cost': reactivation['cost'][k],
+            'cac': reactivation['cost_per_reactivation'][k]
         }
-        
-        total_reactivated += reactivated
-        total_cost += segment_cost
+        for k, (segment, count) in enumerate(zip(REACTIVATION_SEGMENTS, (recent_inactive, long_inactive, dormant)))
+    }
+    total_reactivated = reactivation['reactivated'].sum()
+    total_cost = reactivation['cost'].sum()
     
     # Результаты
     st.subheader("📊 Результаты реактивации")
@@ -354,7 +390,7 @@ def reactivation_promo_optimization():
         st.metric("Средний CAC реактивации", f"{avg_cac:,.0f} руб")
         
         # LTV реактивированных (обычно ниже новых пользователей)
-        reactivated_ltv = 4200  # Примерная оценка
+        reactivated_ltv = REACTIVATED_LTV  # Примерная оценка
         ltv_cac = reactivated_ltv / avg_cac if avg_cac > 0 else 0
         
         color = "success" if ltv_cac >= 3 else "warning" if ltv_cac >= 2 else "error"
@@ -400,6 +436,9 @@ def reactivation_promo_optimization():
     
     st.plotly_chart(fig, use_container_width=True)
     
+    if st.checkbox("📅 Дневные корзины давности и скидка для каждой корзины"):
+        show_recency_bucket_optimization(promo_size)
+    
     # Рекомендации по реактивации
     st.markdown("""
     ### 💡 Рекомендации по реактивации:
@@ -411,6 +450,85 @@ def reactivation_promo_optimization():
     5. **Градуированные промо**: Начать с малого, эскалировать при необходимости
     """)
 
+@st.cache_data(show_spinner=False)
+def cached_reactivation_data(seed: int = 42) -> Dict[str, np.ndarray]:
+    """Синтетические неактивные пользователи и история кампаний (кэш)"""
+    return generate_reactivation_data(seed=seed)
+
+def show_recency_bucket_optimization(uniform_discount: float):
+    """Кривые реактивации по корзинам давности и оптимальная скидка для каждой"""
+    st.subheader("📅 Скидка по давности последней поездки")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        users_file = st.file_uploader("Неактивные пользователи (CSV: last_ride_date или days_inactive)", type="csv")
+        history_file = st.file_uploader("История кампаний (CSV: last_ride_date или days_inactive, discount, reactivated)",
+                                        type="csv")
+    with col2:
+        bucket_days = st.slider("Ширина корзины (дни)", 1, 60, 7)
+        max_days = st.slider("Горизонт давности (дни)", 90, 1080, 720, 30)
+        smoothing_days = st.slider("Сглаживание кривых по давности (дни)", 0, 60, 21)
+    
+    data = cached_reactivation_data()
+    days_inactive = data['days_inactive']
+    history = (data['history_days'], data['history_discount'], data['history_reactivated'])
+    try:
+        if users_file is not None:
+            days_inactive = load_reactivation_table(users_file)['days_inactive'].to_numpy()
+        if history_file is not None:
+            table = load_reactivation_table(history_file)
+            history = tuple(table[column].to_numpy() for column in REACTIVATION_HISTORY_COLUMNS)
+    except (ValueError, KeyError) as error:
+        st.error(f"Не удалось прочитать файл: {error}")
+        return
+    
+    # Скидки выбираются по обучающей части истории, итоги считаются по отложенной
+    train, holdout = split_history(*history)
+    curves = fit_reactivation_curves(*train, bucket_days=bucket_days, max_days=max_days,
+                                     smoothing_days=smoothing_days)
+    holdout_curves = fit_reactivation_curves(*holdout, bucket_days=bucket_days, max_days=max_days,
+                                             smoothing_days=smoothing_days)
+    plan = optimize_bucket_discounts(days_inactive, curves, uniform_discount=uniform_discount,
+                                     eval_curves=holdout_curves)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Корзин давности", f"{len(plan['users'])}")
+    with col2:
+        gain = plan['net_value'].sum() - plan['uniform_net_value'].sum()
+        st.metric("Чистый LTV", f"{plan['net_value'].sum():,.0f} руб", f"{gain:+,.0f} руб к единой скидке")
+    with col3:
+        st.metric("Затраты", f"{plan['cost'].sum():,.0f} руб",
+                  f"{plan['cost'].sum() - plan['uniform_cost'].sum():+,.0f} руб", delta_color="inverse")
+    with col4:
+        st.metric("Оплачено вернувшимся бы сами", f"{plan['subsidized_cost'].sum():,.0f} руб",
+                  f"{plan['subsidized_cost'].sum() - plan['uniform_subsidized_cost'].sum():+,.0f} руб",
+                  delta_color="inverse")
+    
+    days = plan['bucket_start'] + bucket_days / 2
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('Оптимальная скидка по давности',
+                                                        'Реактивация без промо и при оптимальной скидке'))
+    fig.add_trace(go.Scatter(x=days, y=plan['optimal_discount'], mode='lines', name='Оптимальная скидка',
+                             line=dict(color='purple', width=3)), row=1, col=1)
+    fig.add_hline(y=uniform_discount, line_dash="dash", line_color="gray", row=1, col=1)
+    fig.add_trace(go.Scatter(x=days, y=curves['base_rate'] * 100, mode='lines', name='Без промо',
+                             line=dict(color='gray')), row=1, col=2)
+    fig.add_trace(go.Scatter(x=days, y=reactivation_curve(curves, plan['optimal_discount'][:, None])[:, 0] * 100,
+                             mode='lines', name='С оптимальной скидкой', line=dict(color='green')), row=1, col=2)
+    fig.update_xaxes(title_text="Дней без поездок")
+    fig.update_yaxes(title_text="Скидка (%)", row=1, col=1)
+    fig.update_yaxes(title_text="Реактивация (%)", row=1, col=2)
+    fig.update_layout(height=400)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.caption("Скидки подобраны по 70% истории кампаний, итоги плана и единой скидки посчитаны "
+               "по кривым на отложенных 30%, поэтому выигрыш не завышен подгонкой под шум.")
+    
+    sparse = int((curves['effective_observations'] < 200).sum())
+    if sparse:
+        st.caption(f"В {sparse} корзинах меньше 200 наблюдений истории даже после сглаживания: кривые там шумные, "
+                   f"стоит увеличить сглаживание или ширину корзины")
+
 def retention_promo_optimization():
     """Промокоды для удержания"""
     st.subheader("💎 Retention промокоды")
@@ -443,56 +561,23 @@ def retention_promo_optimization():
                                     ["Скидки на поездки", "Cashback программа", "Loyalty points", "Premium features"])
     
     # Модель риска оттока и эффективности intervention
-    risk_segments = {
-        'high': {
-            'count': high_risk_users,
-            'churn_probability': 80,  # % вероятность ухода без intervention
-            'intervention_effectiveness': 60,  # % снижения риска при intervention
-            'cost_per_intervention': 150
-        },
-        'medium': {
-            'count': medium_risk_users,
-            'churn_probability': 40,
-            'intervention_effectiveness': 45,
-            'cost_per_intervention': 80
-        },
-        'low': {
-            'count': low_risk_users,
-            'churn_probability': 15,
-            'intervention_effectiveness': 30,
-            'cost_per_intervention': 40
+    segment_counts = (high_risk_users, medium_risk_users, low_risk_users)
+    retention = retention_promo_kernel(segment_counts)
+    risk_segments = {segment: {'count': count} for segment, count in zip(RETENTION_SEGMENTS, segment_counts)}
+    retention_results = {
+        segment: {
+            'would_churn': retention['would_churn'][k],
+            'saved': retention['saved'][k],
+            'cost': retention['cost'][k],
+            'roi_per_saved': retention['cost_per_saved'][k]
         }
+        for k, segment in enumerate(RETENTION_SEGMENTS)
     }
     
-    # Расчет ROI от retention программы
-    total_saved_users = 0
-    total_program_cost = 0
-    
-    retention_results = {}
-    
-    for segment, data in risk_segments.items():
-        # Пользователи, которых потеряли бы без программы
-        would_churn = data['count'] * (data['churn_probability'] / 100)
-        
-        # Пользователи, которых сохранили благодаря программе
-        saved_users = would_churn * (data['intervention_effectiveness'] / 100)
-        
-        # Стоимость программы для сегмента
-        segment_cost = data['count'] * data['cost_per_intervention']
-        
-        retention_results[segment] = {
-            'would_churn': would_churn,
-            'saved': saved_users,
-            'cost': segment_cost,
-            'roi_per_saved': segment_cost / saved_users if saved_users > 0 else 0
-        }
-        
-        total_saved_users += saved_users
-        total_program_cost += segment_cost
-    
     # LTV анализ сохраненных пользователей
-    avg_ltv_remaining = 3500  # LTV пользователя, который остался благодаря retention программе
-    total_ltv_saved = total_saved_users * avg_ltv_remaining
+    total_saved_users = retention['saved'].sum()
+    total_program_cost = retention['cost'].sum()
+    total_ltv_saved = retention['ltv_gained'].sum()
     program_roi = (total_ltv_saved - total_program_cost) / total_program_cost * 100
     
     # Результаты
@@ -535,6 +620,9 @@ def retention_promo_optimization():
     
     st.dataframe(segments_df, use_container_width=True)
     
+    if st.checkbox("🧮 Скоринг риска оттока и таргетинг по сохраненному LTV"):
+        show_churn_targeting(retention_budget)
+    
     # Recommendations
     st.markdown("""
     ### 💡 Retention стратегии по типам промо:
@@ -560,6 +648,96 @@ def retention_promo_optimization():
     • Лучше для: High-value пользователей всех сегментов
     """)
 
+@st.cache_data(show_spinner=False)
+def cached_retention_users(n_users: int, seed: int) -> Dict[str, np.ndarray]:
+    """Синтетическая активность пользователей (кэш по размеру выборки)"""
+    return generate_retention_users(n_users, seed=seed)
+
+@st.cache_data(show_spinner=False)
+def cached_churn_scores(X_history: np.ndarray, churned: np.ndarray, X_users: np.ndarray) -> Tuple[Dict, np.ndarray]:
+    """Модель оттока по истории и вероятности оттока текущих пользователей"""
+    model = fit_churn_model(X_history, churned)
+    return model, churn_probability(model, X_users)
+
+def show_churn_targeting(retention_budget: float):
+    """Логистический скоринг оттока и бюджетный топ-K список для retention-промо"""
+    st.subheader("🧮 Таргетинг retention по риску оттока")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        uploaded = st.file_uploader(f"Пользователи (CSV: {', '.join(RETENTION_FEATURES)}, churned, "
+                                    f"[ltv_remaining])", type="csv")
+        n_users = st.select_slider("Пользователей для скоринга (синтетика)",
+                                   [100_000, 300_000, 1_000_000, 3_000_000], 1_000_000)
+    with col2:
+        cost_per_intervention = st.slider("Стоимость вмешательства на пользователя (руб)", 20, 300, 100, 10)
+    
+    if uploaded is not None:
+        table = pd.read_csv(uploaded)
+        missing = set(RETENTION_FEATURES + ['churned']) - set(table.columns)
+        if missing:
+            st.error(f"В файле нет колонок: {', '.join(sorted(missing))}")
+            return
+        # Модель учится на всей истории, а скорятся пользователи, еще не ушедшие
+        history = table
+        users = table[~table['churned'].astype(bool)].reset_index(drop=True)
+        if 'ltv_remaining' in users:
+            ltv_remaining = users['ltv_remaining'].to_numpy(dtype=float)
+        else:
+            ltv_remaining = np.full(len(users), float(RETAINED_LTV))
+    else:
+        history = cached_retention_users(max(n_users // 3, 50_000), seed=1)
+        users = cached_retention_users(n_users, seed=2)
+        ltv_remaining = users['ltv_remaining']
+    
+    with st.spinner("Обучение модели и скоринг..."):
+        model, scores = cached_churn_scores(feature_matrix(history), np.asarray(history['churned'], dtype=float),
+                                            feature_matrix(users))
+    targeting = rank_retention_targets(scores, ltv_remaining, retention_budget, cost_per_intervention)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("В списке", f"{len(targeting['targets']):,}")
+    with col2:
+        st.metric("Ожидаемо сохраненных", f"{targeting['total_saved_users']:,.0f}")
+    with col3:
+        st.metric("Сохраненный LTV", f"{targeting['total_saved_ltv']:,.0f} руб")
+    with col4:
+        roi = (targeting['total_saved_ltv'] - targeting['spend']) / max(targeting['spend'], 1) * 100
+        st.metric("ROI списка", f"{roi:.0f}%")
+    
+    if targeting['spend'] < retention_budget:
+        st.info(f"Окупаемых вмешательств только на {targeting['spend']:,.0f} руб из бюджета "
+                f"{retention_budget:,.0f} руб")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=targeting['curve_spend'], y=targeting['curve_roi'], mode='lines',
+                                 line=dict(color='green', width=3), name='ROI'))
+        fig.update_layout(title="ROI по мере расширения списка", xaxis_title="Затраты (руб)",
+                          yaxis_title="ROI (%)", height=380)
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        coefficients_df = pd.DataFrame({
+            'Признак': RETENTION_FEATURE_NAMES,
+            'Коэффициент (на 1 ст. откл.)': np.round(model['coef'][1:], 3)
+        })
+        st.dataframe(coefficients_df, use_container_width=True)
+        st.caption(f"IRLS: {model['iterations']} итераций, "
+                   f"{'сошлось' if model['converged'] else 'не сошлось'}; "
+                   f"средний риск оттока {scores.mean() * 100:.1f}%")
+    
+    top = targeting['targets'][:100]
+    top_df = pd.DataFrame({
+        'Пользователь': top,
+        'Риск оттока': [f"{p * 100:.0f}%" for p in targeting['churn_probability'][:100]],
+        'Сохраненный LTV': [f"{v:,.0f} руб" for v in targeting['saved_ltv'][:100]],
+        'Эффект за вычетом затрат': [f"{v:,.0f} руб" for v in targeting['net_value'][:100]]
+    })
+    st.markdown("**Первые 100 пользователей списка**")
+    st.dataframe(top_df, use_container_width=True)
+
 def competitive_defense_promo():
     """Конкурентная защита через промокоды"""
     st.subheader("🆚 Конкурентная защита")
@@ -595,65 +773,15 @@ def competitive_defense_promo():
         response_speed = st.selectbox("Скорость реакции:", 
                                     ["Immediate (в течение дня)", "Fast (в течение недели)", "Measured (2-3 недели)"])
     
-    # Modeling competitive threat
-    base_weekly_churn = organic_churn / 4  # Базовый недельный churn
-    
-    # Threat multiplier based on competitor offer
-    threat_multiplier = 1 + (competitor_discount / 50)  # Каждые 50% скидки = 2x threat
-    
-    # Time decay of competitive effect
-    weeks = list(range(1, threat_duration + 1))
-    competitive_churn_rates = []
-    
-    for week in weeks:
-        # Эффект конкурента затухает со временем
-        decay_factor = np.exp(-week / 4)  # Exponential decay
-        weekly_threat = base_weekly_churn * threat_multiplier * decay_factor
-        competitive_churn_rates.append(weekly_threat)
-    
-    # Users lost without defense
-    users_lost_without_defense = []
-    remaining_users = at_risk_users
-    
-    for weekly_churn in competitive_churn_rates:
-        lost_this_week = remaining_users * (weekly_churn / 100)
-        users_lost_without_defense.append(lost_this_week)
-        remaining_users -= lost_this_week
-    
-    total_lost_without_defense = sum(users_lost_without_defense)
+    # Modeling competitive threat: все стратегии × скорости × сегменты одним расчетом
+    defense = competitive_defense_kernel(competitor_discount, threat_duration, at_risk_users, organic_churn)
+    strategy_index = DEFENSE_STRATEGIES.index(defense_strategy)
+    speed_index = RESPONSE_SPEEDS.index(response_speed)
     
-    # Defense effectiveness
-    defense_effectiveness = {
-        "Matching (аналогичная скидка)": 70,  # % снижения потерь
-        "Premium positioning": 40,
-        "Loyalty surge": 55,
-        "Targeted retention": 65
-    }
-    
-    response_delay_penalty = {
-        "Immediate (в течение дня)": 1.0,
-        "Fast (в течение недели)": 0.8,
-        "Measured (2-3 недели)": 0.6
-    }
-    
-    effectiveness = defense_effectiveness[defense_strategy] * response_delay_penalty[response_speed]
-    users_saved = total_lost_without_defense * (effectiveness / 100)
-    
-    # Cost analysis
-    if defense_strategy == "Matching (аналогичная скидка)":
-        cost_per_user = competitor_discount / 100 * 350 * 3  # 3 поездки с защитной скидкой
-    elif defense_strategy == "Premium positioning":
-        cost_per_user = 200  # Маркетинг премиум позиционирования
-    elif defense_strategy == "Loyalty surge":
-        cost_per_user = 120  # Loyalty бонусы
-    else:  # Targeted retention
-        cost_per_user = 150  # Персонализированные retention offers
-    
-    total_defense_cost = at_risk_users * cost_per_user
-    
-    # LTV impact
-    avg_ltv_at_risk = 4500  # LTV пользователей под угрозой
-    ltv_saved = users_saved * avg_ltv_at_risk
+    total_lost_without_defense = defense['total_lost'].sum()
+    users_saved = defense['users_saved'][strategy_index, speed_index].sum()
+    total_defense_cost = defense['cost'][strategy_index, speed_index].sum()
+    ltv_saved = defense['ltv_saved'][strategy_index, speed_index].sum()
     defense_roi = (ltv_saved - total_defense_cost) / total_defense_cost * 100
     
     # Results
@@ -679,35 +807,69 @@ def competitive_defense_promo():
         </div>
         """, unsafe_allow_html=True)
     
-    # Timeline visualization
+    # Timeline visualization: дневные потери
+    survival_defended = defense['survival_defended'][strategy_index, speed_index]
+    previous_defended = np.concatenate([np.ones((survival_defended.shape[0], 1)), survival_defended[:, :-1]], axis=1)
+    daily_lost_defended = (defense['segment_users'][:, None] * (previous_defended - survival_defended)).sum(axis=0)
+    
     fig = go.Figure()
     
     fig.add_trace(go.Scatter(
-        x=weeks,
-        y=users_lost_without_defense,
-        mode='lines+markers',
+        x=defense['days'],
+        y=defense['daily_lost'].sum(axis=0),
+        mode='lines',
         name='Потери без защиты',
         line=dict(color='red', width=3)
     ))
     
-    users_lost_with_defense = [loss * (1 - effectiveness/100) for loss in users_lost_without_defense]
     fig.add_trace(go.Scatter(
-        x=weeks,
-        y=users_lost_with_defense,
-        mode='lines+markers',
+        x=defense['days'],
+        y=daily_lost_defended,
+        mode='lines',
         name='Потери с защитой',
         line=dict(color='green', width=3)
     ))
     
     fig.update_layout(
         title="Временная динамика конкурентной угрозы",
-        xaxis_title="Неделя",
-        yaxis_title="Потеря пользователей",
+        xaxis_title="День",
+        yaxis_title="Потеря пользователей в день",
         height=400
     )
     
     st.plotly_chart(fig, use_container_width=True)
     
+    # Лучший ответ для каждого сегмента
+    st.subheader("🎯 Лучший ответ по сегментам")
+    
+    best = best_defense_response(defense)
+    best_df = pd.DataFrame({
+        'Сегмент': DEFENSE_SEGMENT_NAMES,
+        'Пользователей': [f"{users:,.0f}" for users in defense['segment_users']],
+        'Потери без защиты': [f"{lost:,.0f}" for lost in defense['total_lost']],
+        'Стратегия': [DEFENSE_STRATEGIES[k] if k >= 0 else "Без защиты" for k in best['strategy']],
+        'Скорость': [RESPONSE_SPEEDS[k] if k >= 0 else "—" for k in best['speed']],
+        'Сохранено': [f"{saved:,.0f}" for saved in best['users_saved']],
+        'Затраты': [f"{cost:,.0f} руб" for cost in best['cost']],
+        'Эффект': [f"{value:,.0f} руб" for value in best['net_value']]
+    })
+    st.dataframe(best_df, use_container_width=True)
+    
+    best_cost = best['cost'].sum()
+    chosen_net = ltv_saved - total_defense_cost
+    st.info(f"Лучший ответ по сегментам: эффект {best['net_value'].sum():,.0f} руб при затратах "
+            f"{best_cost:,.0f} руб против {chosen_net:,.0f} руб у единой стратегии «{defense_strategy}»"
+            + (f". Бюджет защиты {defense_budget:,.0f} руб меньше необходимого" if best_cost > defense_budget else ""))
+    
+    fig = go.Figure(go.Heatmap(
+        x=[speed.split(' (')[0] for speed in RESPONSE_SPEEDS],
+        y=[strategy.split(' (')[0] for strategy in DEFENSE_STRATEGIES],
+        z=defense['net_value'].sum(axis=2) / 1e6,
+        colorscale='RdYlGn', zmid=0, colorbar=dict(title="млн руб")
+    ))
+    fig.update_layout(title="Чистый эффект стратегии × скорости (все сегменты)", height=350)
+    st.plotly_chart(fig, use_container_width=True)
+    
     # Strategic recommendations
     if defense_roi > 200:
         st.success("🛡️ **Defensive кампания высокоэффективна** - рекомендуется к реализации")
@@ -750,6 +912,86 @@ def competitive_defense_promo():
     for rec in strategy_recommendations[defense_strategy]:
         st.write(f"• {rec}")
 
+@st.cache_data(show_spinner=False)
+def cached_promo_allocation_path(**params) -> Dict[str, np.ndarray]:
+    """Кривые отклика программ и порядок их финансирования (кэш по входам)"""
+    return promo_allocation_path(promo_program_curves(**params))
+
+def promo_budget_allocation():
+    """Распределение общего промобюджета между программами по предельной отдаче"""
+    st.subheader("⚖️ Распределение общего промобюджета")
+    
+    st.info("""
+    **Единый бюджет**: рубль, потраченный на реактивацию, не может быть потрачен на защиту.
+    Бюджет распределяется туда, где следующий рубль приносит больше всего LTV, пока
+    предельная отдача не упадет ниже 1 рубля LTV на рубль затрат.
+    """)
+    
+    with st.expander("⚙️ Параметры программ"):
+        col1, col2 = st.columns(2)
+        with col1:
+            reachable_prospects = st.number_input("Охват привлечения новых", 1000, 1000000, 50000, 1000)
+            recent_inactive = st.number_input("Неактивны 1-3 месяца", 10000, 500000, 150000, 10000)
+            long_inactive = st.number_input("Неактивны 3-6 месяцев", 5000, 300000, 80000, 5000)
+            dormant = st.number_input("Неактивны >6 месяцев", 20000, 1000000, 200000, 10000)
+            personalization_lift = st.slider("Лифт от персонализации (%)", 10, 100, 40)
+        with col2:
+            high_risk_users = st.number_input("Высокий риск оттока", 5000, 100000, 25000)
+            medium_risk_users = st.number_input("Средний риск", 10000, 200000, 50000)
+            low_risk_users = st.number_input("Низкий риск", 50000, 500000, 150000)
+            at_risk_users = st.number_input("Пользователей под угрозой конкурента", 10000, 200000, 75000)
+            competitor_discount = st.slider("Скидка конкурента (%)", 30, 80, 50)
+    
+    path = cached_promo_allocation_path(
+        reachable_prospects=reachable_prospects,
+        reactivation_counts=(recent_inactive, long_inactive, dormant),
+        personalization_lift=personalization_lift,
+        retention_counts=(high_risk_users, medium_risk_users, low_risk_users),
+        competitor_discount=competitor_discount, at_risk_users=at_risk_users
+    )
+    worthwhile_spend = path['cumulative_spend'][-1]
+    
+    total_cap = st.slider("Общий лимит промобюджета (млн руб)", 1.0, 100.0, 10.0, 0.5) * 1_000_000
+    allocation = allocate_promo_budget(path, total_cap)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Распределено", f"{allocation['total_spend']:,.0f} руб")
+    with col2:
+        st.metric("Прирост LTV", f"{allocation['total_ltv_gained']:,.0f} руб")
+    with col3:
+        st.metric("LTV на рубль", f"{allocation['total_ltv_gained'] / max(allocation['total_spend'], 1):.1f}")
+    with col4:
+        st.metric("Предельная отдача", f"{allocation['marginal_return']:.1f} руб/руб")
+    
+    if total_cap > worthwhile_spend:
+        st.warning(f"Окупаемые возможности исчерпаны на {worthwhile_spend:,.0f} руб: "
+                   f"остаток лимита лучше не тратить")
+    
+    allocation_df = pd.DataFrame({
+        'Программа': PROMO_PROGRAM_NAMES,
+        'Бюджет': [f"{spend:,.0f} руб" for spend in allocation['spend']],
+        'Доля': [f"{spend / max(allocation['total_spend'], 1) * 100:.0f}%" for spend in allocation['spend']],
+        'Прирост LTV': [f"{gain:,.0f} руб" for gain in allocation['ltv_gained']],
+        'LTV на рубль': [f"{gain / spend:.1f}" if spend > 0 else "—"
+                         for spend, gain in zip(allocation['spend'], allocation['ltv_gained'])]
+    })
+    st.dataframe(allocation_df, use_container_width=True)
+    
+    # Оптимальное распределение при разных лимитах
+    caps = np.linspace(0, max(100_000_000, total_cap), 201)
+    allocation_path = allocate_promo_budget(path, caps)
+    
+    fig = go.Figure()
+    colors = ['blue', 'green', 'purple', 'red']
+    for k, (name, color) in enumerate(zip(PROMO_PROGRAM_NAMES, colors)):
+        fig.add_trace(go.Scatter(x=caps / 1e6, y=allocation_path['spend'][:, k] / 1e6, name=name,
+                                 stackgroup='budget', line=dict(color=color)))
+    fig.add_vline(x=total_cap / 1e6, line_dash="dash", line_color="black", annotation_text="Текущий лимит")
+    fig.update_layout(title="Оптимальное распределение при разных лимитах", xaxis_title="Общий лимит (млн руб)",
+                      yaxis_title="Бюджет программы (млн руб)", height=420)
+    st.plotly_chart(fig, use_container_width=True)
+
 def segmented_promo_optimization():
     """Сегментированные промокоды"""
     st.subheader("🎯 Сегментированные промокампании")
@@ -796,76 +1038,45 @@ def behavioral_segmentation():
         regular_promo = st.slider("Regular users скидка (%)", 15, 50, 25)
         occasional_promo = st.slider("Occasional users скидка (%)", 30, 70, 45)
     
-    # Behavioral insights для каждого сегмента
-    segments_data = {
-        'Power Users': {
-            'count': power_users,
-            'avg_frequency': 12,
-            'avg_aov': 380,
-            'churn_risk': 'Low',
-            'promo_sensitivity': 'Low',
-            'promo_discount': power_promo,
-            'strategy': 'Loyalty & Premium'
-        },
-        'Regular Users': {
-            'count': regular_users,
-            'avg_frequency': 5,
-            'avg_aov': 350,
-            'churn_risk': 'Medium',
-            'promo_sensitivity': 'Medium',
-            'promo_discount': regular_promo,
-            'strategy': 'Frequency increase'
-        },
-        'Occasional Users': {
-            'count': occasional_users,
-            'avg_frequency': 1.5,
-            'avg_aov': 320,
-            'churn_risk': 'High',
-            'promo_sensitivity': 'High',
-            'promo_discount': occasional_promo,
-            'strategy': 'Activation & Habit'
-        }
-    }
-    
-    # Расчет эффективности по сегментам
-    total_campaign_cost = 0
-    total_incremental_revenue = 0
+    # Распределение частоты: гамма по числу пользователей в сегментах или по загруженным поездкам
+    col1, col2 = st.columns(2)
+    with col1:
+        uploaded = st.file_uploader("Поездки пользователей за месяц (CSV: rides)", type="csv")
+    with col2:
+        cuts = st.slider("Пороги сегментов (поездок/мес)", 0.5, 20.0, (3.0, 8.0), 0.5)
+    
+    n_users = power_users + regular_users + occasional_users
+    if uploaded is not None:
+        rides = pd.read_csv(uploaded)
+        if 'rides' not in rides:
+            st.error("В файле нет колонки rides")
+            return
+        shape, scale = fit_frequency_from_rides(rides['rides'])
+    else:
+        shape, scale = fit_frequency_from_segments([occasional_users, regular_users, power_users])
+    centers, users = frequency_bins(shape, scale, n_users)
+    st.caption(f"Частота поездок: гамма-распределение, shape {shape:.2f}, scale {scale:.2f} "
+               f"(средняя {shape * scale:.1f} поездки/мес), {len(centers)} интервалов интегрирования")
     
-    results_data = []
+    # Расчет эффективности по сегментам: интеграл по распределению частоты
+    discounts = [occasional_promo, regular_promo, power_promo]
+    segments = frequency_segments_kernel(centers, users, cuts, discounts)
     
-    for segment, data in segments_data.items():
-        # Baseline revenue без промо
-        baseline_revenue = data['count'] * data['avg_frequency'] * data['avg_aov'] * 0.25
-        
-        # Эффект промо на frequency (обратная зависимость от baseline frequency)
-        frequency_lift = (data['promo_discount'] / 100) * (10 / data['avg_frequency'])  # Higher discount + lower baseline = higher lift
-        new_frequency = data['avg_frequency'] * (1 + frequency_lift)
-        
-        # Промо стоимость
-        promo_cost_per_ride = data['avg_aov'] * (data['promo_discount'] / 100)
-        total_promo_rides = data['count'] * new_frequency
-        segment_promo_cost = total_promo_rides * promo_cost_per_ride
-        
-        # Новая выручка
-        new_revenue = data['count'] * new_frequency * data['avg_aov'] * 0.25
-        incremental_revenue = new_revenue - baseline_revenue
-        
-        # ROI сегмента
-        segment_roi = (incremental_revenue - segment_promo_cost) / segment_promo_cost * 100 if segment_promo_cost > 0 else 0
-        
-        results_data.append({
-            'Сегмент': segment,
-            'Пользователей': f"{data['count']:,}",
-            'Baseline частота': f"{data['avg_frequency']:.1f}",
-            'Новая частота': f"{new_frequency:.1f}",
-            'Скидка': f"{data['promo_discount']}%",
-            'Затраты на промо': f"{segment_promo_cost:,.0f}",
-            'Доп. выручка': f"{incremental_revenue:,.0f}",
-            'ROI': f"{segment_roi:.0f}%"
-        })
-        
-        total_campaign_cost += segment_promo_cost
-        total_incremental_revenue += incremental_revenue
+    results_data = [
+        {
+            'Сегмент': name,
+            'Пользователей': f"{segments['users'][k]:,.0f}",
+            'Baseline частота': f"{segments['avg_frequency'][k]:.1f}",
+            'Новая частота': f"{segments['new_frequency'][k]:.1f}",
+            'Скидка': f"{discounts[k]}%",
+            'Затраты на промо': f"{segments['cost'][k]:,.0f}",
+            'Доп. выручка': f"{segments['incremental_revenue'][k]:,.0f}",
+            'ROI': f"{segments['roi'][k]:.0f}%"
+        }
+        for k, name in enumerate(BEHAVIOR_SEGMENT_NAMES)
+    ]
+    total_campaign_cost = segments['cost'].sum()
+    total_incremental_revenue = segments['incremental_revenue'].sum()
     
     # Результаты
     st.subheader("📈 Результаты сегментированной кампании")
@@ -874,7 +1085,8 @@ def behavioral_segmentation():
     st.dataframe(results_df, use_container_width=True)
     
     # Общий ROI
-    overall_roi = (total_incremental_revenue - total_campaign_cost) / total_campaign_cost * 100
+    overall_roi = ((total_incremental_revenue - total_campaign_cost) / total_campaign_cost * 100
+                   if total_campaign_cost > 0 else 0)
     
     col1, col2, col3 = st.columns(3)
     
@@ -893,6 +1105,8 @@ def behavioral_segmentation():
         </div>
         """, unsafe_allow_html=True)
     
+    show_frequency_segment_optimization(centers, users)
+    
     # Insights по сегментам
     st.markdown("""
     ### 💡 Инсайты поведенческой сегментации:
@@ -913,71 +1127,30 @@ def behavioral_segmentation():
     • Фокус на habit formation, а не только на deals
     """)
 
-def geographic_segmentation():
-    """Географическая сегментация"""
-    st.markdown("### 🗺️ Географическая сегментация")
-    
-    st.info("""
-    **Географическая специфика**: Разные районы города имеют разную плотность спроса,
-    покупательную способность и конкуренцию с общественным транспортом.
-    """)
-    
-    # Зоны города
-    zones_data = {
-        'Центр': {
-            'population': 500000,
-            'avg_income': 80000,
-            'competition': 9,
-            'public_transport': 8,
-            'current_penetration': 15
-        },
-        'Бизнес-районы': {
-            'population': 300000,
-            'avg_income': 120000,
-            'competition': 7,
-            'public_transport': 7,
-            'current_penetration': 25
-        },
-        'Спальные районы': {
-            'population': 800000,
-            'avg_income': 50000,
-            'competition': 4,
-            'public_transport': 5,
-            'current_penetration': 8
-        },
-        'Пригороды': {
-            'population': 400000,
-            'avg_income': 45000,
-            'competition': 2,
-            'public_transport': 3,
-            'current_penetration': 12
-        }
-    }
-    
+def show_typical_zones(zones_data: Dict[str, Dict], allocation: Dict[str, np.ndarray]):
+    """Четыре типовые зоны: потенциал, стратегия и распределенная скидка"""
     # Расчет потенциала и стратегии по зонам
-    for zone, data in zones_data.items():
+    for k, (zone, data) in enumerate(zones_data.items()):
         # Потенциал роста
         market_potential = data['population'] * 0.2  # 20% максимальная penetration
-        growth_potential = market_potential - (data['population'] * data['current_penetration'] / 100)
+        growth_potential = max(market_potential - (data['population'] * data['current_penetration'] / 100), 0)
         
         # Стратегия промо на основе характеристик зоны
         if data['avg_income'] > 80000 and data['competition'] > 6:
             promo_strategy = "Premium positioning, небольшие скидки"
-            recommended_discount = 15
         elif data['public_transport'] < 5:
             promo_strategy = "Convenience focus, средние скидки"
-            recommended_discount = 25
         elif data['current_penetration'] < 10:
             promo_strategy = "Market education, высокие скидки"
-            recommended_discount = 40
         else:
             promo_strategy = "Balanced approach"
-            recommended_discount = 30
         
         zones_data[zone].update({
             'growth_potential': growth_potential,
             'promo_strategy': promo_strategy,
-            'recommended_discount': recommended_discount
+            'recommended_discount': allocation['discount'][k],
+            'spend': allocation['spend'][k],
+            'new_users': allocation['new_users'][k]
         })
     
     # Визуализация
@@ -992,7 +1165,10 @@ def geographic_segmentation():
                 'Средний доход': f"{data['avg_income']:,}",
                 'Текущая penetration': f"{data['current_penetration']}%",
                 'Потенциал роста': f"{data['growth_potential']:,.0f}",
-                'Рекомендуемая скидка': f"{data['recommended_discount']}%"
+                'Стратегия': data['promo_strategy'],
+                'Рекомендуемая скидка': f"{data['recommended_discount']:.1f}%",
+                'Бюджет': f"{data['spend']:,.0f} руб",
+                'Новые пользователи': f"{data['new_users']:,.0f}"
             }
             for zone, data in zones_data.items()
         ])
@@ -1027,6 +1203,150 @@ def geographic_segmentation():
         )
         
         st.plotly_chart(fig, use_container_width=True)
+
+def show_zone_allocation(zones: pd.DataFrame, allocation: Dict[str, np.ndarray]):
+    """Распределение скидок по множеству районов: крупнейшие получатели и скидка от характеристик"""
+    funded = allocation['spend'] > 0
+    st.caption(f"Скидку получили {funded.sum():,} из {len(zones):,} районов, "
+               f"медианная скидка {np.median(allocation['discount'][funded]) if funded.any() else 0:.1f}%")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        top = np.argsort(-allocation['spend'])[:20]
+        top_df = pd.DataFrame({
+            'Район': allocation['zone'][top],
+            'Скидка': [f"{d:.1f}%" for d in allocation['discount'][top]],
+            'Бюджет': [f"{v:,.0f} руб" for v in allocation['spend'][top]],
+            'Новые пользователи': [f"{v:,.0f}" for v in allocation['new_users'][top]],
+            'Предельный ROI': [f"{v:.2f}" for v in allocation['marginal_roi'][top]]
+        })
+        st.dataframe(top_df, use_container_width=True)
+    with col2:
+        sample = np.random.default_rng(0).permutation(len(zones))[:5000]
+        fig = go.Figure(go.Scattergl(
+            x=zones['current_penetration'].to_numpy()[sample], y=allocation['discount'][sample], mode='markers',
+            marker=dict(size=5, color=zones['avg_income'].to_numpy()[sample], colorscale='Viridis',
+                        colorbar=dict(title="Доход"), opacity=0.6)
+        ))
+        fig.update_layout(title="Скидка района vs текущее проникновение", xaxis_title="Проникновение (%)",
+                          yaxis_title="Скидка (%)", height=400)
+        st.plotly_chart(fig, use_container_width=True)
+
+def show_frequency_segment_optimization(centers: np.ndarray, users: np.ndarray):
+    """Автоматический поиск порогов сегментов и скидок по распределению частоты"""
+    st.subheader("🔍 Оптимальные пороги и скидки")
+    
+    n_segments = st.slider("Число сегментов", 2, 6, 3)
+    optimum = optimize_frequency_segments(centers, users, n_segments)
+    segments = optimum['segments']
+    
+    edges = np.concatenate([[0.0], optimum['cuts'], [np.inf]])
+    optimum_df = pd.DataFrame({
+        'Частота (поездок/мес)': [f"{low:.1f}–{high:.1f}" if np.isfinite(high) else f"{low:.1f}+"
+                                  for low, high in zip(edges[:-1], edges[1:])],
+        'Пользователей': [f"{count:,.0f}" for count in segments['users']],
+        'Скидка': [f"{discount:.0f}%" for discount in optimum['discounts']],
+        'Затраты на промо': [f"{cost:,.0f}" for cost in segments['cost']],
+        'Доп. выручка': [f"{revenue:,.0f}" for revenue in segments['incremental_revenue']],
+        'Эффект': [f"{value:,.0f}" for value in segments['net_value']]
+    })
+    st.dataframe(optimum_df, use_container_width=True)
+    st.success(f"Лучшая сегментация дает {optimum['net_value']:,.0f} руб доп. выручки сверх затрат на промо; "
+               f"сегментам со скидкой 0% промо не окупается")
+    
+    # Эффект скидки на пользователя в зависимости от частоты
+    frequency_points = np.array([0.5, 1, 2, 3, 5, 8, 12])
+    indices = np.searchsorted(centers, frequency_points).clip(0, len(centers) - 1)
+    fig = go.Figure()
+    for index, frequency in zip(indices, frequency_points):
+        fig.add_trace(go.Scatter(x=optimum['discount_grid'], y=optimum['net_value_per_user'][:, index],
+                                 mode='lines', name=f"{frequency:g} поездок/мес"))
+    fig.add_hline(y=0, line_dash="dash", line_color="gray")
+    fig.update_layout(title="Эффект скидки на пользователя по частоте поездок", xaxis_title="Скидка (%)",
+                      yaxis_title="Доп. выручка минус затраты (руб/мес)", height=400)
+    st.plotly_chart(fig, use_container_width=True)
+
+def geographic_segmentation():
+    """Географическая сегментация"""
+    st.markdown("### 🗺️ Географическая сегментация")
+    
+    st.info("""
+    **Географическая специфика**: Разные районы города имеют разную плотность спроса,
+    покупательную способность и конкуренцию с общественным транспортом.
+    """)
+    
+    # Зоны города
+    zones_data = {
+        'Центр': {
+            'population': 500000,
+            'avg_income': 80000,
+            'competition': 9,
+            'public_transport': 8,
+            'current_penetration': 15
+        },
+        'Бизнес-районы': {
+            'population': 300000,
+            'avg_income': 120000,
+            'competition': 7,
+            'public_transport': 7,
+            'current_penetration': 25
+        },
+        'Спальные районы': {
+            'population': 800000,
+            'avg_income': 50000,
+            'competition': 4,
+            'public_transport': 5,
+            'current_penetration': 8
+        },
+        'Пригороды': {
+            'population': 400000,
+            'avg_income': 45000,
+            'competition': 2,
+            'public_transport': 3,
+            'current_penetration': 12
+        }
+    }
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        uploaded = st.file_uploader(f"Районы (CSV: {', '.join(ZONE_COLUMNS)}, [ltv])", type="csv")
+        n_districts = st.number_input("Синтетических районов (0 - четыре типовые зоны)", 0, 20000, 0, 500)
+    with col2:
+        promo_budget = st.slider("Общий промобюджет (млн руб)", 0.5, 100.0, 5.0, 0.5) * 1_000_000
+        new_user_ltv = st.slider("LTV нового пользователя (руб)", 1000, 8000, ZONE_NEW_USER_LTV, 250)
+    
+    if uploaded is not None:
+        try:
+            zones = load_zone_table(uploaded)
+        except ValueError as error:
+            st.error(str(error))
+            return
+    elif n_districts > 0:
+        zones = generate_zone_table(n_districts)
+    else:
+        zones = pd.DataFrame([{'zone': zone, **data} for zone, data in zones_data.items()])
+    
+    # Распределение бюджета: предельный ROI районов выравнивается
+    allocation = allocate_zone_discounts(zones, promo_budget, new_user_ltv=new_user_ltv)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Потрачено", f"{allocation['total_spend']:,.0f} руб")
+    with col2:
+        st.metric("Новые пользователи", f"{allocation['new_users'].sum():,.0f}")
+    with col3:
+        st.metric("LTV на рубль", f"{allocation['ltv'].sum() / max(allocation['total_spend'], 1):.1f}")
+    with col4:
+        st.metric("Предельный ROI", f"{allocation['budget_price']:.2f} руб/руб")
+    
+    if allocation['total_spend'] < promo_budget * 0.99:
+        st.info(f"Окупаемые скидки исчерпаны на {allocation['total_spend']:,.0f} руб: "
+                f"дальше рубль скидки приносит меньше рубля LTV")
+    
+    if uploaded is not None or n_districts > 0:
+        show_zone_allocation(zones, allocation)
+    else:
+        show_typical_zones(zones_data, allocation)
     
     # Стратегические рекомендации
     st.markdown("""
@@ -1188,6 +1508,120 @@ def temporal_segmentation():
     
     segments_df = pd.DataFrame(all_segments_data)
     st.dataframe(segments_df, use_container_width=True)
+    
+    if st.checkbox("🗓️ Почасовой оптимизатор surge и скидок (168 часов недели)"):
+        show_hour_of_week_pricing()
+
+@st.cache_data(show_spinner=False)
+def cached_slot_table(n_cities: int, n_zones: int) -> pd.DataFrame:
+    """Синтетическая таблица слотов (кэш по размеру)"""
+    return generate_slot_table(n_cities, n_zones)
+
+@st.cache_data(show_spinner=False)
+def cached_hour_of_week_pricing(slots: pd.DataFrame, **params) -> Dict[str, np.ndarray]:
+    """Оптимальные множители для таблицы слотов (кэш по таблице и параметрам)"""
+    return optimize_hour_of_week_pricing(slots, **params)
+
+def show_hour_of_week_pricing():
+    """Совместная оптимизация surge и off-peak скидок по 168 часам недели для городов и зон"""
+    st.subheader("🗓️ Surge и скидки по часам недели")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        uploaded = st.file_uploader("Слоты (CSV: city, zone, hour 0-167, requests, drivers, [elasticity])",
+                                    type="csv")
+        n_cities = st.slider("Городов (синтетика)", 1, 50, 5)
+        n_zones = st.slider("Зон в городе (синтетика)", 1, 30, 8)
+    with col2:
+        surge_cap = st.slider("Максимальный surge", 1.0, 3.0, 2.0, 0.1)
+        max_discount = st.slider("Максимальная off-peak скидка (%)", 0, 60, 40)
+        incremental_ride_value = st.slider("Ценность доп. поездки (руб)", 0, 300, 100, 10,
+                                           help="Будущая ценность поездки сверх маржи: привычка, загрузка водителей")
+        supply_elasticity = st.slider("Эластичность предложения к surge", 0.0, 1.5, 0.6, 0.1)
+    
+    try:
+        slots = load_slot_table(uploaded) if uploaded is not None else cached_slot_table(n_cities, n_zones)
+    except ValueError as error:
+        st.error(str(error))
+        return
+    
+    with st.spinner("Оптимизация слотов..."):
+        plan = cached_hour_of_week_pricing(slots, surge_cap=surge_cap, max_discount=max_discount,
+                                           incremental_ride_value=incremental_ride_value,
+                                           supply_elasticity=supply_elasticity)
+    
+    multiplier = plan['multiplier']
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Слотов", f"{multiplier.size:,}")
+    with col2:
+        st.metric("Поездки", f"{plan['rides'].sum():,.0f}",
+                  f"{(plan['rides'].sum() / plan['baseline_rides'].sum() - 1) * 100:+.1f}%")
+    with col3:
+        st.metric("Маржа платформы", f"{plan['margin'].sum():,.0f} руб",
+                  f"{(plan['margin'].sum() / plan['baseline_margin'].sum() - 1) * 100:+.1f}%")
+    with col4:
+        st.metric("Surge / скидка", f"{(multiplier > 1).mean() * 100:.0f}% / {(multiplier < 1).mean() * 100:.0f}%")
+    
+    cities = np.unique(plan['city'])
+    city = st.selectbox("Город для тепловой карты:", cities)
+    in_city = plan['city'] == city
+    weights = plan['requests'][in_city]
+    weekly = (multiplier[in_city] * weights).sum(axis=0) / np.maximum(weights.sum(axis=0), 1e-12)
+    
+    fig = go.Figure(go.Heatmap(
+        z=weekly.reshape(7, 24), x=list(range(24)), y=DAY_NAMES,
+        colorscale='RdBu_r', zmid=1.0, colorbar=dict(title="Множитель")
+    ))
+    fig.update_layout(title=f"Ценовой множитель по часам недели: {city} (среднее по зонам, взвешенное спросом)",
+                      xaxis_title="Час", yaxis=dict(autorange='reversed'), height=380)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    city_df = pd.DataFrame({
+        'city': plan['city'],
+        'rides': plan['rides'].sum(axis=1),
+        'baseline_rides': plan['baseline_rides'].sum(axis=1),
+        'margin': plan['margin'].sum(axis=1),
+        'baseline_margin': plan['baseline_margin'].sum(axis=1),
+        'surge_slots': (multiplier > 1).sum(axis=1),
+        'discount_slots': (multiplier < 1).sum(axis=1)
+    }).groupby('city').sum()
+    summary_df = pd.DataFrame({
+        'Город': city_df.index,
+        'Поездки': [f"{rides:,.0f} ({(rides / base - 1) * 100:+.1f}%)"
+                    for rides, base in zip(city_df['rides'], city_df['baseline_rides'])],
+        'Маржа': [f"{margin:,.0f} руб ({(margin / base - 1) * 100:+.1f}%)"
+                  for margin, base in zip(city_df['margin'], city_df['baseline_margin'])],
+        'Слотов с surge': city_df['surge_slots'].to_numpy(),
+        'Слотов со скидкой': city_df['discount_slots'].to_numpy()
+    })
+    st.dataframe(summary_df, use_container_width=True)
+
+@st.cache_data(show_spinner=False)
+def cached_synthetic_rfm(n_users: int, seed: int = 42) -> Dict[str, np.ndarray]:
+    """RFM по синтетическому журналу поездок (кэш по числу пользователей)"""
+    return accumulate_rfm(generate_ride_log_chunks(n_users, seed=seed))
+
+def read_rfm(uploaded) -> Dict[str, np.ndarray]:
+    """RFM по загруженному журналу поездок"""
+    with st.spinner("Чтение журнала поездок..."):
+        return accumulate_rfm(read_ride_log_chunks(uploaded))
+
+def show_rfm_grid(rfm: Dict[str, np.ndarray]):
+    """Тепловая карта R × F: пользователи и средние траты в каждой ячейке"""
+    scores = rfm_scores(rfm)
+    cell = (scores['r'].astype(int) - 1) * 5 + (scores['f'].astype(int) - 1)
+    users = np.bincount(cell, minlength=25).reshape(5, 5)
+    spend = np.bincount(cell, weights=rfm['monetary'], minlength=25).reshape(5, 5) / np.maximum(users, 1)
+    
+    fig = go.Figure(go.Heatmap(
+        z=spend, x=[f"F{k}" for k in range(1, 6)], y=[f"R{k}" for k in range(1, 6)],
+        text=users, texttemplate="%{text:,}", colorscale='Viridis', colorbar=dict(title="Траты, руб")
+    ))
+    fig.update_layout(title=f"RFM: {len(rfm['user_id']):,} пользователей за {rfm['observed_days']} дней "
+                            f"(R5 - недавние, F5 - частые; в ячейках - пользователи)",
+                      height=420)
+    st.plotly_chart(fig, use_container_width=True)
 
 def value_based_segmentation():
     """Сегментация по потраченной сумме"""
@@ -1198,16 +1632,38 @@ def value_based_segmentation():
     Monetary (потраченная сумма). Разные value segments требуют разного подхода к промо.
     """)
     
+    source = st.radio("Источник сегментов:", ["Ручной ввод", "Журнал поездок (RFM)"], horizontal=True)
+    
     # RFM сегменты
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("**💰 Value сегменты**")
         
-        vip_users = st.number_input("VIP (>10k руб/мес)", 1000, 50000, 8000)
-        high_value = st.number_input("High value (5-10k руб/мес)", 5000, 100000, 25000)
-        medium_value = st.number_input("Medium value (2-5k руб/мес)", 20000, 200000, 75000)
-        low_value = st.number_input("Low value (<2k руб/мес)", 50000, 500000, 150000)
+        if source == "Ручной ввод":
+            vip_users = st.number_input("VIP (>10k руб/мес)", 1000, 50000, 8000)
+            high_value = st.number_input("High value (5-10k руб/мес)", 5000, 100000, 25000)
+            medium_value = st.number_input("Medium value (2-5k руб/мес)", 20000, 200000, 75000)
+            low_value = st.number_input("Low value (<2k руб/мес)", 50000, 500000, 150000)
+            tiers = {
+                'count': np.array([low_value, medium_value, high_value, vip_users]),
+                'avg_monthly_spend': np.array([1200, 3500, 7500, 12000]),
+                'frequency': np.array([2, 5, 9, 15]),
+                'churn_risk': np.array([20, 12, 8, 5])
+            }
+        else:
+            uploaded = st.file_uploader("Журнал поездок (CSV: user_id, ride_date, fare)", type="csv")
+            n_users = st.select_slider("Пользователей в журнале (синтетика)",
+                                       [100_000, 1_000_000, 5_000_000, 20_000_000], 1_000_000)
+            try:
+                rfm = read_rfm(uploaded) if uploaded is not None else cached_synthetic_rfm(n_users)
+            except ValueError as error:
+                st.error(f"Не удалось прочитать журнал: {error}")
+                return
+            except MemoryError:
+                st.error("Журнал не помещается в память: уменьшите выборку или разбейте файл по пользователям")
+                return
+            tiers = value_tier_table(rfm)
         
     with col2:
         st.markdown("**🎯 Промо стратегии**")
@@ -1224,37 +1680,10 @@ def value_based_segmentation():
         low_value_strategy = st.selectbox("Low value стратегия:",
                                         ["Activation campaigns", "High discounts", "Habit formation"])
     
-    # Расчет ROI для каждого сегмента
-    value_segments = {
-        'VIP': {
-            'count': vip_users,
-            'avg_monthly_spend': 12000,
-            'frequency': 15,
-            'churn_risk': 5,
-            'promo_budget_per_user': 200 if vip_strategy != "No promotions needed" else 0
-        },
-        'High Value': {
-            'count': high_value,
-            'avg_monthly_spend': 7500,
-            'frequency': 9,
-            'churn_risk': 8,
-            'promo_budget_per_user': 150
-        },
-        'Medium Value': {
-            'count': medium_value,
-            'avg_monthly_spend': 3500,
-            'frequency': 5,
-            'churn_risk': 12,
-            'promo_budget_per_user': 80
-        },
-        'Low Value': {
-            'count': low_value,
-            'avg_monthly_spend': 1200,
-            'frequency': 2,
-            'churn_risk': 20,
-            'promo_budget_per_user': 120
-        }
-    }
+    # Расчет ROI для каждого сегмента: от VIP к Low Value
+    promo_budget_per_user = VALUE_TIER_PROMO_BUDGET.copy()
+    if vip_strategy == "No promotions needed":
+        promo_budget_per_user[-1] = 0
     
     # Анализ эффективности промо по сегментам
     total_promo_budget = 0
@@ -1262,31 +1691,23 @@ def value_based_segmentation():
     
     segment_results = []
     
-    for segment, data in value_segments.items():
+    for k in reversed(range(len(VALUE_TIER_NAMES))):
+        count = tiers['count'][k]
         # Базовая выручка (take rate 25%)
-        base_monthly_revenue = data['count'] * data['avg_monthly_spend'] * 0.25
+        base_monthly_revenue = count * tiers['avg_monthly_spend'][k] * 0.25
         
         # Эффект промо зависит от сегмента
-        if segment == 'VIP':
-            revenue_lift = 0.05  # VIP мало реагируют на промо, но ценят attention
-        elif segment == 'High Value':
-            revenue_lift = 0.15  # Умеренная реакция
-        elif segment == 'Medium Value':
-            revenue_lift = 0.25  # Хорошая реакция
-        else:  # Low Value
-            revenue_lift = 0.40  # Высокая реакция на промо
-        
-        incremental_revenue = base_monthly_revenue * revenue_lift
-        promo_cost = data['count'] * data['promo_budget_per_user']
+        incremental_revenue = base_monthly_revenue * VALUE_TIER_REVENUE_LIFT[k]
+        promo_cost = count * promo_budget_per_user[k]
         
         segment_roi = (incremental_revenue - promo_cost) / promo_cost * 100 if promo_cost > 0 else 0
         
         segment_results.append({
-            'Сегмент': segment,
-            'Пользователей': f"{data['count']:,}",
-            'Средний spend': f"{data['avg_monthly_spend']:,} руб",
-            'Частота': f"{data['frequency']} поездок",
-            'Churn risk': f"{data['churn_risk']}%",
+            'Сегмент': VALUE_TIER_NAMES[k],
+            'Пользователей': f"{count:,}",
+            'Средний spend': f"{tiers['avg_monthly_spend'][k]:,.0f} руб",
+            'Частота': f"{tiers['frequency'][k]:.1f} поездок",
+            'Churn risk': f"{tiers['churn_risk'][k]:.0f}%",
             'Промо бюджет': f"{promo_cost:,.0f} руб",
             'Доп. выручка': f"{incremental_revenue:,.0f} руб",
             'ROI': f"{segment_roi:.0f}%"
@@ -1302,7 +1723,7 @@ def value_based_segmentation():
     st.dataframe(results_df, use_container_width=True)
     
     # Общий ROI и рекомендации
-    overall_roi = (total_incremental_revenue - total_promo_budget) / total_promo_budget * 100
+    overall_roi = (total_incremental_revenue - total_promo_budget) / total_promo_budget * 100 if total_promo_budget > 0 else 0
     
     col1, col2, col3 = st.columns(3)
     
@@ -1321,6 +1742,9 @@ def value_based_segmentation():
         </div>
         """, unsafe_allow_html=True)
     
+    if source == "Журнал поездок (RFM)":
+        show_rfm_grid(rfm)
+    
     # Value-based инсайты
     st.markdown("""
     ### 💡 Value-based промо инсайты:
@@ -0,0 +1,1278 @@
+"""Чистые вычислительные ядра промокампаний ride-hailing.
+
+Как и app/scenario_kernels.py, ядра принимают скаляры или массивы одной формы
+(numpy broadcasting) и возвращают словари массивов, поэтому одна и та же формула
+считает и текущие параметры со слайдеров, и сетки из миллионов конфигураций.
+UI в app/promo.py только собирает параметры и отображает результат.
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy.ndimage import gaussian_filter1d
+from scipy.optimize import minimize
+from scipy.stats import gamma
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+from app.supply_demand import hour_of_week_profile, zone_shares, HOURS_PER_WEEK
+
+PROMO_TAKE_RATE = 25  # %
+NEW_USER_MONTHLY_CHURN = 12  # % месячный churn после промо
+HABIT_ANCHOR_RIDES = 3  # При 3 промо-поездках доля активации равна заданной
+HABIT_SCALE = 0.7  # Масштаб кривой привычки: одна промо-поездка дает ~77% уровня трех
+
+REACTIVATION_SEGMENTS = ['recent', 'long', 'dormant']
+REACTIVATION_SEGMENT_NAMES = ["Недавние", "Давние", "Спящие"]
+REACTIVATION_BASE_RATES = np.array([12, 6, 2])  # % реактивируются без промо
+REACTIVATION_PROMO_RIDES = 2
+MAX_REACTIVATION_RATE = 50  # %
+REACTIVATED_LTV = 4200
+REACTIVATION_HISTORY_COLUMNS = ['days_inactive', 'discount', 'reactivated']
+
+RETENTION_SEGMENTS = ['high', 'medium', 'low']
+RETENTION_SEGMENT_NAMES = ['Высокий риск', 'Средний риск', 'Низкий риск']
+RETENTION_CHURN_PROBABILITY = np.array([80, 40, 15])  # % вероятность ухода без intervention
+RETENTION_EFFECTIVENESS = np.array([60, 45, 30])  # % снижения риска при intervention
+RETENTION_COST_PER_INTERVENTION = np.array([150, 80, 40])
+RETAINED_LTV = 3500
+RETENTION_FEATURES = ['days_since_last_ride', 'rides_last_30d', 'rides_trend', 'support_tickets', 'promo_share']
+RETENTION_FEATURE_NAMES = ['Дней с последней поездки', 'Поездок за 30 дней', 'Тренд поездок',
+                           'Обращений в поддержку', 'Доля промо-поездок']
+RETENTION_LIFETIME_MONTHS = 10  # Ожидаемая оставшаяся жизнь удержанного пользователя
+
+DEFENSE_STRATEGIES = ["Matching (аналогичная скидка)", "Premium positioning", "Loyalty surge", "Targeted retention"]
+DEFENSE_EFFECTIVENESS = np.array([70, 40, 55, 65])  # % снижения потерь
+DEFENSE_COST_PER_USER = np.array([np.nan, 200, 120, 150])  # Matching считается от скидки конкурента
+DEFENSE_MATCHING_RIDES = 3
+RESPONSE_SPEEDS = ["Immediate (в течение дня)", "Fast (в течение недели)", "Measured (2-3 недели)"]
+RESPONSE_DELAY_DAYS = np.array([1, 7, 17])  # День запуска защиты
+DEFENSE_SEGMENTS = ['price', 'regular', 'premium']
+DEFENSE_SEGMENT_NAMES = ['Ценовые охотники', 'Регулярные', 'Премиум']
+DEFENSE_SEGMENT_SHARES = np.array([0.35, 0.45, 0.20])
+DEFENSE_SEGMENT_LTV = np.array([2500, 4500, 8000])  # В среднем 4500 руб
+DEFENSE_PRICE_SENSITIVITY = np.array([1.6, 1.0, 0.4])  # Относительная угроза от скидки конкурента
+# Множитель эффективности стратегии (строки) для сегмента (столбцы)
+DEFENSE_SEGMENT_FIT = np.array([
+    [1.2, 1.0, 0.6],
+    [0.4, 0.9, 1.6],
+    [0.7, 1.1, 1.2],
+    [1.0, 1.0, 1.0]
+])
+
+BEHAVIOR_SEGMENT_NAMES = ['Occasional Users', 'Regular Users', 'Power Users']
+BEHAVIOR_CUTS = (3, 8)  # Поездок в месяц: occasional < 3 ≤ regular < 8 ≤ power
+BEHAVIOR_AOV_FREQUENCY = np.array([1.5, 5, 12])  # AOV растет с частотой поездок
+BEHAVIOR_AOV = np.array([320, 350, 380])
+
+SLOT_COLUMNS = ['city', 'zone', 'hour', 'requests', 'drivers']
+SLOT_ELASTICITY_RANGE = (0.8, 2.5)  # Низкая чувствительность в пик, высокая в off-peak
+DAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+RIDE_LOG_COLUMNS = ['user_id', 'ride_date', 'fare']
+VALUE_TIER_NAMES = ['Low Value', 'Medium Value', 'High Value', 'VIP']
+VALUE_TIER_BOUNDS = (2000, 5000, 10000)  # Руб/мес: low < 2k ≤ medium < 5k ≤ high < 10k ≤ VIP
+VALUE_TIER_REVENUE_LIFT = np.array([0.40, 0.25, 0.15, 0.05])  # VIP мало реагируют на промо
+VALUE_TIER_PROMO_BUDGET = np.array([120, 80, 150, 200])  # Руб на пользователя
+RFM_CHURN_RECENCY_DAYS = 30  # Без поездок дольше - в зоне риска оттока
+
+ZONE_COLUMNS = ['zone', 'population', 'avg_income', 'competition', 'public_transport', 'current_penetration']
+ZONE_MAX_PENETRATION = 20  # % населения - потолок проникновения
+ZONE_PROMO_RIDES = 3  # Промо-поездок на привлеченного пользователя
+ZONE_NEW_USER_LTV = 3000
+
+PROMO_PROGRAMS = ['new_users', 'reactivation', 'retention', 'defense']
+PROMO_PROGRAM_NAMES = ["🆕 Новые пользователи", "🔄 Реактивация", "💎 Retention", "🆚 Конкурентная защита"]
+
+
+def habit_activation(activation_rate, promo_rides, habit_scale: Optional[float] = None) -> np.ndarray:
+    """Доля активации (%) от числа промо-поездок
+
+    При habit_scale=None доля постоянна и равна activation_rate. Иначе - насыщающаяся кривая
+    формирования привычки, калиброванная так, что при HABIT_ANCHOR_RIDES поездках равна
+    activation_rate: при habit_scale=HABIT_SCALE одна промо-поездка дает ~77% этого уровня,
+    сверх трех поездок прирост - доли процента.
+    """
+    if habit_scale is None:
+        return np.broadcast_to(np.asarray(activation_rate, dtype=float), np.shape(promo_rides))
+
+    def curve(rides):
+        return 1 - np.exp(-np.asarray(rides, dtype=float) / habit_scale)
+
+    return np.minimum(np.asarray(activation_rate, dtype=float) * curve(promo_rides) / curve(HABIT_ANCHOR_RIDES), 95)
+
+def new_user_promo_kernel(promo_discount=50, max_rides_promo=3, promo_budget=3_000_000, promo_elasticity=1.2,
+                          activation_rate=55, organic_frequency=3.8, reachable_prospects=np.inf, base_aov=350,
+                          base_conversion_rate=5, take_rate=PROMO_TAKE_RATE,
+                          monthly_churn=NEW_USER_MONTHLY_CHURN, habit_scale=None) -> Dict[str, np.ndarray]:
+    """Пользователи, CAC, LTV и ROI промокампании для новых пользователей
+
+    Бюджет покупает промо-офферы (скидка × число промо-поездок), но не больше охвата
+    reachable_prospects; неизрасходованный бюджет остается в знаменателе ROI, но не в CAC.
+    Доля активации постоянна, с habit_scale - зависит от числа промо-поездок (habit_activation).
+    """
+    promo_discount = np.asarray(promo_discount, dtype=float)
+    max_rides_promo = np.asarray(max_rides_promo, dtype=float)
+    promo_budget = np.asarray(promo_budget, dtype=float)
+
+    # Влияние размера скидки на конверсию
+    boosted_conversion = base_conversion_rate * (1 + (promo_discount / 100) * np.asarray(promo_elasticity))
+    promo_aov = base_aov * (1 - promo_discount / 100)
+    cost_per_promo_ride = base_aov - promo_aov
+
+    offers = np.minimum(promo_budget / (cost_per_promo_ride * max_rides_promo), reachable_prospects)
+    new_users = offers * np.minimum(boosted_conversion / 100, 1.0)
+    spend = offers * cost_per_promo_ride * max_rides_promo
+
+    # Промо-пользователи: первые max_rides_promo по скидке, потом organic
+    promo_revenue = new_users * max_rides_promo * promo_aov * take_rate / 100
+    activated_users = new_users * habit_activation(activation_rate, max_rides_promo, habit_scale) / 100
+    organic_ltv_per_user = (base_aov * take_rate / 100 * np.asarray(organic_frequency)) / (monthly_churn / 100)
+    total_revenue = promo_revenue + activated_users * organic_ltv_per_user
+
+    safe_users = np.where(new_users > 0, new_users, np.nan)
+    effective_cac = spend / safe_users
+    ltv_per_user = total_revenue / safe_users
+
+    return {
+        'new_users': new_users,
+        'activated_users': activated_users,
+        'spend': spend,
+        'total_revenue': total_revenue,
+        'effective_cac': effective_cac,
+        'ltv_per_user': ltv_per_user,
+        'ltv_cac_ratio': np.nan_to_num(ltv_per_user / effective_cac),
+        'roi': (total_revenue - promo_budget) / promo_budget * 100
+    }
+
+def optimize_new_user_promo(promo_elasticity: float, reachable_prospects: float,
+                            discount_bounds: Tuple[float, float] = (20, 80),
+                            rides_bounds: Tuple[float, float] = (1, 10),
+                            budget_bounds: Tuple[float, float] = (500_000, 20_000_000),
+                            elasticity_bounds: Tuple[float, float] = (0.5, 2.0),
+                            resolution: Tuple[int, int, int, int] = (40, 25, 25, 40),
+                            **params) -> Dict[str, object]:
+    """Оптимальная промокампания: сетка скидка × промо-поездки × бюджет × эластичность и scipy-уточнение
+
+    Поверхность считается одним вызовом ядра по 4D-сетке (по умолчанию 10^6 конфигураций).
+    Для текущей эластичности лучшая точка сетки уточняется Powell с границами до
+    непрерывного оптимума отдельно для ROI и для LTV/CAC. Обе цели не зависят от бюджета,
+    пока он не превышает стоимость охвата reachable_prospects, поэтому бюджет плана -
+    стоимость всего охвата при найденных скидке и числе промо-поездок (в пределах границ).
+    """
+    if not np.isfinite(reachable_prospects) or reachable_prospects <= 0:
+        raise ValueError("Для оптимизации нужен конечный положительный охват reachable_prospects")
+    params = {**params, 'reachable_prospects': reachable_prospects}
+
+    axes = {
+        'discounts': np.linspace(*discount_bounds, resolution[0]),
+        'rides': np.linspace(*rides_bounds, resolution[1]),
+        'budgets': np.linspace(*budget_bounds, resolution[2]),
+        'elasticities': np.linspace(*elasticity_bounds, resolution[3])
+    }
+    surface = new_user_promo_kernel(
+        axes['discounts'][:, None, None, None], axes['rides'][None, :, None, None],
+        axes['budgets'][None, None, :, None], axes['elasticities'][None, None, None, :], **params
+    )
+
+    def reach_budget(discount, rides):
+        # Стоимость всего охвата: затраты кампании с неограниченным бюджетом
+        with np.errstate(invalid='ignore'):
+            spend = new_user_promo_kernel(discount, rides, np.inf, promo_elasticity, **params)['spend']
+        return np.clip(spend, *budget_bounds)
+
+    bounds = [discount_bounds, rides_bounds]
+    scale = np.array([b[1] - b[0] for b in bounds])
+    e_idx = int(np.abs(axes['elasticities'] - promo_elasticity).argmin())
+    plans = {}
+    optimal_discount = {}
+
+    for objective in ('roi', 'ltv_cac_ratio'):
+        # Лучшее значение по бюджету для каждой скидки, числа поездок и эластичности
+        values = np.nan_to_num(surface[objective], nan=-np.inf).max(axis=2)
+
+        best_flat = values.reshape(-1, resolution[3]).argmax(axis=0)
+        d_best, r_best = np.unravel_index(best_flat, resolution[:2])
+        optimal_discount[objective] = axes['discounts'][values.max(axis=1).argmax(axis=0)]
+
+        start = np.array([axes['discounts'][d_best[e_idx]], axes['rides'][r_best[e_idx]]])
+
+        def loss(x):
+            # Переменные нормированы на ширину границ
+            discount, rides = x * scale
+            plan = new_user_promo_kernel(discount, rides, reach_budget(discount, rides),
+                                         promo_elasticity=promo_elasticity, **params)
+            return -np.nan_to_num(plan[objective], nan=-np.inf)
+
+        result = minimize(loss, start / scale, method='Powell',
+                          bounds=[(b[0] / s, b[1] / s) for b, s in zip(bounds, scale)])
+        discount, rides = result.x * scale if result.fun <= loss(start / scale) else start
+        x = np.array([discount, rides, reach_budget(discount, rides)])
+
+        plan = new_user_promo_kernel(*x, promo_elasticity=promo_elasticity, **params)
+        plans[objective] = {
+            'promo_discount': x[0],
+            'max_rides_promo': x[1],
+            'promo_budget': x[2],
+            **{key: np.asarray(value).item() for key, value in plan.items()}
+        }
+
+    return {
+        **axes,
+        'roi': surface['roi'],
+        'ltv_cac_ratio': surface['ltv_cac_ratio'],
+        'new_users': surface['new_users'],
+        'optimal_discount': optimal_discount,
+        'plans': plans
+    }
+
+def simulate_new_user_prospects(promo_discount=50, max_rides_promo=3, promo_budget=3_000_000, promo_elasticity=1.2,
+                                activation_rate=55, organic_frequency=3.8, reachable_prospects=1_000_000,
+                                promo_ride_continue=0.9, base_aov=350, base_conversion_rate=5,
+                                take_rate=PROMO_TAKE_RATE, monthly_churn=NEW_USER_MONTHLY_CHURN, habit_scale=None,
+                                n_simulations=200, chunk_size=1_000_000, seed=42) -> Dict[str, np.ndarray]:
+    """Стохастическая промокампания по отдельным клиентам: распределение CAC и ROI
+
+    Каждый клиент проходит цепочку показ → конверсия (Бернулли) → промо-поездки
+    (геометрическое, не больше max_rides_promo) → активация (Бернулли по habit_activation)
+    → органическая жизнь (геометрическое число месяцев, пуассоновское число поездок).
+    Клиенты обрабатываются в порядке показа блоками по chunk_size значений на все
+    симуляции сразу; кампания останавливается, когда следующий клиент не помещается
+    в бюджет или охват исчерпан. Память ограничена размером блока, а не числом клиентов.
+    В отличие от new_user_promo_kernel, бюджет списывается только за фактически
+    использованные промо-поездки, а не резервируется на каждый выданный промокод.
+    """
+    rng = np.random.default_rng(seed)
+    max_rides = max(int(round(max_rides_promo)), 1)
+    conversion = min(base_conversion_rate * (1 + promo_discount / 100 * promo_elasticity) / 100, 1.0)
+    promo_aov = base_aov * (1 - promo_discount / 100)
+    cost_per_promo_ride = base_aov - promo_aov
+    ride_revenue = base_aov * take_rate / 100
+    activation = habit_activation(activation_rate, np.arange(max_rides + 1), habit_scale) / 100
+
+    n_simulations = int(n_simulations)
+    block = max(int(chunk_size) // n_simulations, 1)
+    reachable = int(min(reachable_prospects, np.iinfo(np.int64).max))
+
+    spend = np.zeros(n_simulations)
+    revenue = np.zeros(n_simulations)
+    new_users = np.zeros(n_simulations, dtype=np.int64)
+    activated_users = np.zeros(n_simulations, dtype=np.int64)
+    prospects_reached = np.zeros(n_simulations, dtype=np.int64)
+    exhausted = np.zeros(n_simulations, dtype=bool)
+
+    start = 0
+    while start < reachable and not exhausted.all():
+        width = min(block, reachable - start)
+        active = ~exhausted
+
+        converted = rng.random((n_simulations, width)) < conversion
+        if promo_ride_continue >= 1:
+            rides_used = np.full((n_simulations, width), max_rides)
+        else:
+            rides_used = np.minimum(rng.geometric(1 - promo_ride_continue, (n_simulations, width)), max_rides)
+        rides_used = np.where(converted, rides_used, 0)
+
+        # Бюджет расходуется в порядке показа; первый не поместившийся клиент останавливает кампанию
+        cumulative = spend[:, None] + np.cumsum(rides_used * cost_per_promo_ride, axis=1)
+        fits = (cumulative <= promo_budget) & active[:, None]
+        overflow = ~fits & active[:, None]
+        stop = np.where(active, np.where(overflow.any(axis=1), overflow.argmax(axis=1), width), 0)
+        served = np.arange(width)[None, :] < stop[:, None]
+
+        rides_served = np.where(served, rides_used, 0)
+        users = converted & served
+        is_activated = users & (rng.random((n_simulations, width)) < activation[rides_served])
+        months = rng.geometric(monthly_churn / 100, (n_simulations, width))
+        organic_rides = rng.poisson(organic_frequency * months * is_activated)
+
+        spend += (rides_served * cost_per_promo_ride).sum(axis=1)
+        revenue += (rides_served * promo_aov * take_rate / 100).sum(axis=1) + organic_rides.sum(axis=1) * ride_revenue
+        new_users += users.sum(axis=1)
+        activated_users += is_activated.sum(axis=1)
+        prospects_reached += stop
+        exhausted |= active & (stop < width)
+        start += width
+
+    safe_users = np.where(new_users > 0, new_users, np.nan)
+    effective_cac = spend / safe_users
+    return {
+        'new_users': new_users,
+        'activated_users': activated_users,
+        'prospects_reached': prospects_reached,
+        'spend': spend,
+        'total_revenue': revenue,
+        'effective_cac': effective_cac,
+        'ltv_cac_ratio': np.nan_to_num(revenue / safe_users / effective_cac),
+        'roi': (revenue - promo_budget) / promo_budget * 100,
+        'budget_exhausted': exhausted
+    }
+
+def reactivation_promo_kernel(segment_counts=(150000, 80000, 200000), promo_size=25, personalization_lift=40,
+                              base_rates=REACTIVATION_BASE_RATES, base_aov=350,
+                              reactivated_ltv=REACTIVATED_LTV) -> Dict[str, np.ndarray]:
+    """Реактивация по сегментам неактивности; ось сегментов последняя"""
+    promo_size = np.asarray(promo_size, dtype=float)[..., None]
+    personalization_lift = np.asarray(personalization_lift, dtype=float)[..., None]
+    segment_counts = np.asarray(segment_counts, dtype=float)
+
+    # Эффект промокодов и персонализации: каждые 20% скидки = 1x лифт
+    total_lift = promo_size / 20 * (1 + personalization_lift / 100)
+    boosted_rate = np.minimum(base_rates * (1 + total_lift), MAX_REACTIVATION_RATE)
+    reactivated = segment_counts * boosted_rate / 100
+    cost_per_reactivation = base_aov * (promo_size / 100) * REACTIVATION_PROMO_RIDES
+    cost = reactivated * cost_per_reactivation
+
+    # Промо оплачивается и тем, кто вернулся бы сам, а LTV прирастает только сверх базы
+    incremental = reactivated - segment_counts * base_rates / 100
+    return {
+        'boosted_rate': boosted_rate,
+        'reactivated': reactivated,
+        'cost_per_reactivation': np.broadcast_to(cost_per_reactivation, cost.shape),
+        'cost': cost,
+        'incremental_reactivated': incremental,
+        'ltv_gained': incremental * reactivated_ltv
+    }
+
+def retention_promo_kernel(segment_counts=(25000, 50000, 150000), coverage=1.0,
+                           churn_probability=RETENTION_CHURN_PROBABILITY, effectiveness=RETENTION_EFFECTIVENESS,
+                           cost_per_intervention=RETENTION_COST_PER_INTERVENTION,
+                           retained_ltv=RETAINED_LTV) -> Dict[str, np.ndarray]:
+    """Сохраненные пользователи и затраты retention-программы по риск-сегментам"""
+    covered = np.asarray(segment_counts, dtype=float) * np.asarray(coverage, dtype=float)[..., None]
+    # Пользователи, которых потеряли бы без программы, и сохраненные благодаря ей
+    would_churn = covered * churn_probability / 100
+    saved = would_churn * effectiveness / 100
+    cost = covered * cost_per_intervention
+    return {
+        'would_churn': would_churn,
+        'saved': saved,
+        'cost': cost,
+        'cost_per_saved': np.where(saved > 0, cost / np.where(saved > 0, saved, 1), 0),
+        'ltv_gained': saved * retained_ltv
+    }
+
+def competitive_defense_kernel(competitor_discount=50, threat_duration=6, at_risk_users=75000, organic_churn=12,
+                               segment_shares=DEFENSE_SEGMENT_SHARES, segment_ltv=DEFENSE_SEGMENT_LTV,
+                               price_sensitivity=DEFENSE_PRICE_SENSITIVITY, base_aov=350) -> Dict[str, np.ndarray]:
+    """Дневная модель выживания под атакой конкурента для всех стратегий × скоростей × сегментов
+
+    Недельный churn угрозы (каждые 50% скидки = 2x, затухание exp(-неделя / 4)) переводится
+    в дневной hazard; выживание - cumprod(1 - hazard) по дням. Защита снижает hazard
+    сегмента начиная с дня запуска, оплачивается за оставшихся к этому дню пользователей.
+    Чувствительность к цене нормируется на среднюю по базе, поэтому сегменты перераспределяют
+    угрозу, но не меняют ее общий уровень. Выходы имеют форму (стратегия, скорость, сегмент),
+    дневные ряды - еще и ось дней.
+    """
+    segment_shares = np.asarray(segment_shares, dtype=float)
+    segment_users = at_risk_users * segment_shares
+    price_sensitivity = np.asarray(price_sensitivity, dtype=float)
+    price_sensitivity = price_sensitivity / (segment_shares @ price_sensitivity / segment_shares.sum())
+    days = np.arange(1, int(threat_duration) * 7 + 1)
+
+    # Недельный churn угрозы по сегментам → дневной hazard: (сегмент, день)
+    base_weekly_churn = organic_churn / 4
+    threat_multiplier = 1 + competitor_discount / 50
+    # Затухание по номеру недели, как в недельной модели: дни недели w делят churn недели w
+    weekly_churn = (base_weekly_churn * threat_multiplier * price_sensitivity[:, None]
+                    * np.exp(-np.ceil(days / 7) / 4)) / 100
+    hazard = 1 - (1 - np.minimum(weekly_churn, 0.99)) ** (1 / 7)
+
+    # Снижение hazard после запуска защиты: (стратегия, скорость, сегмент, день)
+    effectiveness = np.minimum(DEFENSE_EFFECTIVENESS[:, None] * DEFENSE_SEGMENT_FIT / 100, 0.95)
+    active = days[None, :] >= RESPONSE_DELAY_DAYS[:, None]
+    mitigation = effectiveness[:, None, :, None] * active[None, :, None, :]
+    defended_hazard = hazard[None, None] * (1 - mitigation)
+
+    survival_none = np.cumprod(1 - hazard, axis=-1)
+    survival_defended = np.cumprod(1 - defended_hazard, axis=-1)
+    previous = np.concatenate([np.ones(hazard.shape[:-1] + (1,)), survival_none[..., :-1]], axis=-1)
+    daily_lost = segment_users[:, None] * (previous - survival_none)
+
+    total_lost = segment_users * (1 - survival_none[:, -1])
+    users_saved = segment_users * (survival_defended[..., -1] - survival_none[:, -1])
+
+    # Защита оплачивается за пользователей, оставшихся к дню запуска
+    start_index = np.minimum(RESPONSE_DELAY_DAYS, len(days)) - 1
+    remaining_at_start = segment_users[None, :] * previous[:, start_index].T
+    cost_per_user = np.where(np.arange(len(DEFENSE_STRATEGIES)) == 0,
+                             competitor_discount / 100 * base_aov * DEFENSE_MATCHING_RIDES,
+                             np.nan_to_num(DEFENSE_COST_PER_USER))
+    cost = cost_per_user[:, None, None] * remaining_at_start[None, :, :]
+    ltv_saved = users_saved * np.asarray(segment_ltv, dtype=float)
+
+    return {
+        'days': days,
+        'segment_users': segment_users,
+        'daily_lost': daily_lost,
+        'survival_none': survival_none,
+        'survival_defended': survival_defended,
+        'total_lost': total_lost,
+        'effectiveness': effectiveness,
+        'users_saved': users_saved,
+        'cost': cost,
+        'ltv_saved': ltv_saved,
+        'net_value': ltv_saved - cost,
+        'roi': (ltv_saved - cost) / cost * 100
+    }
+
+def best_defense_response(defense: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Лучшая пара стратегия × скорость для каждого сегмента; без защиты, если ни одна не окупается"""
+    n_strategies, n_speeds, n_segments = defense['net_value'].shape
+    flat = defense['net_value'].reshape(-1, n_segments)
+    best = flat.argmax(axis=0)
+    strategy, speed = np.unravel_index(best, (n_strategies, n_speeds))
+    segments = np.arange(n_segments)
+    worthwhile = flat[best, segments] > 0
+
+    def pick(name):
+        return np.where(worthwhile, defense[name][strategy, speed, segments], 0.0)
+
+    return {
+        'strategy': np.where(worthwhile, strategy, -1),
+        'speed': np.where(worthwhile, speed, -1),
+        'users_saved': pick('users_saved'),
+        'cost': pick('cost'),
+        'ltv_saved': pick('ltv_saved'),
+        'net_value': pick('net_value')
+    }
+
+def concave_envelope(spend, value) -> Tuple[np.ndarray, np.ndarray]:
+    """Верхняя вогнутая огибающая точек (затраты, эффект) из (0, 0) с положительным наклоном"""
+    points = np.column_stack([np.append(np.ravel(spend), 0.0), np.append(np.ravel(value), 0.0)])
+    points = points[np.isfinite(points).all(axis=1)]
+    points = points[np.lexsort((-points[:, 1], points[:, 0]))]
+
+    hull = []
+    for x, y in points:
+        if hull and x == hull[-1][0]:
+            continue
+        while len(hull) >= 2:
+            (x1, y1), (x2, y2) = hull[-2], hull[-1]
+            # Средняя точка ниже хорды - не на вогнутой огибающей
+            if (y2 - y1) * (x - x1) <= (y - y1) * (x2 - x1):
+                hull.pop()
+            else:
+                break
+        hull.append((x, y))
+
+    hull = np.array(hull)
+    # Только возрастающая часть: дальше дополнительный бюджет не окупается
+    keep = np.concatenate([[True], np.diff(hull[:, 1]) > 0])
+    keep = np.logical_and.accumulate(keep)
+    return hull[keep, 0], hull[keep, 1]
+
+def promo_program_curves(reachable_prospects=50000, reactivation_counts=(150000, 80000, 200000),
+                         personalization_lift=40, retention_counts=(25000, 50000, 150000),
+                         competitor_discount=50, threat_duration=6, at_risk_users=75000, organic_churn=12,
+                         promo_elasticity=1.2, activation_rate=55,
+                         organic_frequency=3.8) -> Dict[str, Dict[str, np.ndarray]]:
+    """Кривые отклика (затраты → прирост LTV) промопрограмм по формулам их страниц
+
+    Каждая программа описывается набором вогнутых кусочно-линейных кривых: новые
+    пользователи - огибающая по скидке × промо-поездкам × бюджету, реактивация - по
+    размеру скидки для каждого сегмента, retention - доля охвата риск-сегмента,
+    защита - смесь стратегий и скоростей реакции для каждого сегмента под угрозой.
+    """
+    curves = {}
+
+    discounts, rides, budgets = np.meshgrid(np.linspace(20, 80, 25), np.arange(1, 11),
+                                            np.linspace(0, 20_000_000, 81)[1:], indexing='ij')
+    acquisition = new_user_promo_kernel(discounts, rides, budgets, promo_elasticity, activation_rate,
+                                        organic_frequency, reachable_prospects)
+    curves['new_users'] = [concave_envelope(acquisition['spend'], acquisition['total_revenue'])]
+
+    promo_sizes = np.linspace(0, 50, 101)
+    reactivation = reactivation_promo_kernel(reactivation_counts, promo_sizes, personalization_lift)
+    curves['reactivation'] = [concave_envelope(reactivation['cost'][:, k], reactivation['ltv_gained'][:, k])
+                              for k in range(len(REACTIVATION_SEGMENTS))]
+
+    retention = retention_promo_kernel(retention_counts, 1.0)
+    curves['retention'] = [concave_envelope(retention['cost'][k], retention['ltv_gained'][k])
+                           for k in range(len(RETENTION_SEGMENTS))]
+
+    defense = competitive_defense_kernel(competitor_discount, threat_duration, at_risk_users, organic_churn)
+    curves['defense'] = [concave_envelope(defense['cost'][..., g], defense['ltv_saved'][..., g])
+                         for g in range(len(DEFENSE_SEGMENTS))]
+    return curves
+
+def promo_allocation_path(curves: Dict[str, list], min_marginal_return: float = 1.0) -> Dict[str, np.ndarray]:
+    """Порядок финансирования отрезков кривых по убыванию предельной отдачи
+
+    Для вогнутых кусочно-линейных кривых жадное заполнение по предельному ROI
+    дает то же решение, что и линейная программа на линеаризованных кривых, а
+    пересчет под новый лимит сводится к поиску позиции в накопленных затратах.
+    Отрезки, где рубль бюджета дает меньше min_marginal_return рублей LTV, не финансируются.
+    """
+    programs, spends, gains = [], [], []
+    for p, name in enumerate(PROMO_PROGRAMS):
+        for spend, value in curves[name]:
+            programs.append(np.full(len(spend) - 1, p))
+            spends.append(np.diff(spend))
+            gains.append(np.diff(value))
+
+    programs, spends, gains = np.concatenate(programs), np.concatenate(spends), np.concatenate(gains)
+    worthwhile = gains >= min_marginal_return * spends
+    programs, spends, gains = programs[worthwhile], spends[worthwhile], gains[worthwhile]
+    order = np.argsort(-gains / spends, kind='stable')
+    return {
+        'program': programs[order],
+        'spend': spends[order],
+        'gain': gains[order],
+        'marginal_return': (gains / spends)[order],
+        'cumulative_spend': np.concatenate([[0.0], np.cumsum(spends[order])])
+    }
+
+def allocate_promo_budget(path: Dict[str, np.ndarray], caps) -> Dict[str, np.ndarray]:
+    """Распределение общего лимита по программам; caps - скаляр или массив лимитов"""
+    caps = np.asarray(caps, dtype=float)
+    if len(path['spend']) == 0:
+        zeros = np.zeros(caps.shape)
+        return {'spend': np.zeros(caps.shape + (len(PROMO_PROGRAMS),)), 'ltv_gained': np.zeros(caps.shape + (len(PROMO_PROGRAMS),)),
+                'total_spend': zeros, 'total_ltv_gained': zeros, 'marginal_return': zeros}
+    funded = np.clip(caps[..., None] - path['cumulative_spend'][:-1], 0, path['spend'])
+    gained = funded * path['marginal_return']
+
+    one_hot = path['program'][:, None] == np.arange(len(PROMO_PROGRAMS))
+    last = np.minimum(np.searchsorted(path['cumulative_spend'], caps, side='right') - 1, len(path['spend']) - 1)
+    return {
+        'spend': funded @ one_hot,
+        'ltv_gained': gained @ one_hot,
+        'total_spend': funded.sum(axis=-1),
+        'total_ltv_gained': gained.sum(axis=-1),
+        'marginal_return': np.where(caps < path['cumulative_spend'][-1], path['marginal_return'][last], 0.0)
+    }
+
+def generate_reactivation_data(n_users: int = 430_000, n_history: int = 600_000, max_days: int = 720,
+                               discounts=(0, 10, 20, 30, 40, 50), seed: int = 42) -> Dict[str, np.ndarray]:
+    """Синтетические дни неактивности пользователей и история прошлых кампаний реактивации
+
+    Базовая реактивация и отклик на скидку затухают с давностью последней поездки:
+    недавние часто возвращаются сами, давним нужна большая скидка для того же эффекта.
+    """
+    rng = np.random.default_rng(seed)
+    days_inactive = np.minimum(rng.exponential(max_days / 3, n_users), max_days - 1).astype(np.int32) + 1
+
+    history_days = rng.integers(1, max_days + 1, n_history)
+    discount = rng.choice(np.asarray(discounts, dtype=float), n_history)
+    base_rate = 0.02 + 0.16 * np.exp(-history_days / 75)
+    max_uplift = 0.02 + 0.13 * np.exp(-history_days / 200)
+    response_scale = 8 + 12 * history_days / max_days
+    rate = np.minimum(base_rate + max_uplift * (1 - np.exp(-discount / response_scale)),
+                      MAX_REACTIVATION_RATE / 100)
+    return {
+        'days_inactive': days_inactive,
+        'history_days': history_days,
+        'history_discount': discount,
+        'history_reactivated': rng.random(n_history) < rate
+    }
+
+def days_since_last_ride(last_ride_dates, as_of=None) -> np.ndarray:
+    """Дни с последней поездки; по умолчанию отсчет от самой поздней даты выборки"""
+    dates = pd.to_datetime(pd.Series(last_ride_dates)).dt.normalize()
+    as_of = dates.max() if as_of is None else pd.Timestamp(as_of).normalize()
+    return np.maximum((as_of - dates).dt.days.to_numpy(), 0)
+
+def load_reactivation_table(source: Union[str, Path, object]) -> pd.DataFrame:
+    """CSV с last_ride_date или days_inactive (+ discount и reactivated для истории кампаний)"""
+    table = pd.read_csv(source)
+    if 'days_inactive' not in table:
+        if 'last_ride_date' not in table:
+            raise ValueError("Нужна колонка last_ride_date или days_inactive")
+        table['days_inactive'] = days_since_last_ride(table['last_ride_date'])
+    return table
+
+def reactivation_curve(curves: Dict[str, np.ndarray], discount) -> np.ndarray:
+    """Доля реактивации по корзинам (строки) при скидке discount: база + насыщающийся лифт"""
+    discount = np.asarray(discount, dtype=float)
+    uplift = curves['max_uplift'][:, None] * (1 - np.exp(-discount / curves['response_scale'][:, None]))
+    return np.minimum(curves['base_rate'][:, None] + uplift, MAX_REACTIVATION_RATE / 100)
+
+def split_history(history_days, history_discount, history_reactivated, holdout_share: float = 0.3,
+                  seed: int = 42) -> Tuple[Tuple[np.ndarray, ...], Tuple[np.ndarray, ...]]:
+    """Случайное разбиение истории кампаний на обучающую и отложенную части"""
+    columns = tuple(np.asarray(column) for column in (history_days, history_discount, history_reactivated))
+    holdout = np.random.default_rng(seed).random(len(columns[0])) < holdout_share
+    return tuple(column[~holdout] for column in columns), tuple(column[holdout] for column in columns)
+
+def fit_reactivation_curves(history_days, history_discount, history_reactivated, bucket_days: int = 7,
+                            max_days: int = 720, smoothing_days: float = 21,
+                            response_scales=(3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 40, 50)) -> Dict[str, np.ndarray]:
+    """Кривая реактивации база + лифт × (1 - exp(-скидка / масштаб)) для каждой корзины давности
+
+    Суммы регрессии считаются по дням через bincount и сглаживаются гауссовым ядром
+    шириной smoothing_days, поэтому каждая корзина (даже однодневная) оценивается по
+    соседним дням и кривые плавно меняются с давностью. Для каждого масштаба насыщения
+    база и лифт находятся линейной регрессией по всем корзинам сразу; в каждой корзине
+    остается масштаб с наименьшей суммой квадратов остатков. Лифт не отрицательный.
+    """
+    n_buckets = int(np.ceil(max_days / bucket_days))
+    n_days = n_buckets * bucket_days
+    day = np.clip(np.asarray(history_days), 0, n_days - 1)
+    discount = np.asarray(history_discount, dtype=float)
+    y = np.asarray(history_reactivated, dtype=float)
+    scales = np.asarray(response_scales, dtype=float)
+
+    def total(weights=None):
+        # Сглаженные по дням суммы, затем сложенные в корзины
+        daily = np.bincount(day, weights=weights, minlength=n_days).astype(float)
+        if smoothing_days > 0:
+            daily = gaussian_filter1d(daily, smoothing_days, mode='constant')
+        return daily.reshape(n_buckets, bucket_days).sum(axis=1)
+
+    observations = np.bincount(np.asarray(day) // bucket_days, minlength=n_buckets)
+    n, sy, syy = total(), total(y), total(y * y)
+    safe_n = np.where(n > 0, n, 1.0)
+    # Регрессор 1 - exp(-скидка / масштаб) для всех масштабов: (масштабы, наблюдения)
+    g = 1 - np.exp(-discount[None, :] / scales[:, None])
+    sg = np.stack([total(row) for row in g])
+    sgg = np.stack([total(row * row) for row in g])
+    sgy = np.stack([total(row * y) for row in g])
+
+    variance = n * sgg - sg ** 2
+    valid = variance > 1e-9 * np.maximum(n, 1) ** 2
+    uplift = np.where(valid, (n * sgy - sg * sy) / np.where(valid, variance, 1), 0.0)
+    uplift = np.maximum(uplift, 0.0)
+    base = np.clip((sy - uplift * sg) / safe_n, 0.0, 1.0)
+    sse = syy - 2 * base * sy - 2 * uplift * sgy + n * base ** 2 + 2 * base * uplift * sg + uplift ** 2 * sgg
+
+    best = sse.argmin(axis=0)
+    columns = np.arange(n_buckets)
+    return {
+        'bucket_start': columns * bucket_days,
+        'bucket_days': bucket_days,
+        'observations': observations,
+        # Вес наблюдений, на которых оценена корзина после сглаживания
+        'effective_observations': n,
+        'base_rate': base[best, columns],
+        'max_uplift': uplift[best, columns],
+        'response_scale': scales[best]
+    }
+
+def optimize_bucket_discounts(days_inactive, curves: Dict[str, np.ndarray], discount_grid=np.arange(0, 51),
+                              base_aov=350, promo_rides=REACTIVATION_PROMO_RIDES,
+                              reactivated_ltv=REACTIVATED_LTV, uniform_discount=25,
+                              eval_curves: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """Оптимальная скидка для каждой корзины давности по сетке скидок (корзины × скидки одним массивом)
+
+    Промо оплачивается всем вернувшимся, включая тех, кто вернулся бы сам, а LTV
+    прирастает только сверх базовой реактивации. Скидка 0 означает «не отправлять промо».
+    Скидки выбираются по curves, а итоги плана и единой скидки считаются по eval_curves
+    (например, кривым по отложенной истории), чтобы выигрыш не завышался подгонкой под шум.
+    """
+    eval_curves = curves if eval_curves is None else eval_curves
+    n_buckets = len(curves['base_rate'])
+    bucket = np.minimum(np.asarray(days_inactive) // curves['bucket_days'], n_buckets - 1)
+    users = np.bincount(bucket, minlength=n_buckets).astype(float)
+    discounts = np.asarray(discount_grid, dtype=float)
+    rows = np.arange(n_buckets)
+
+    def outcome(discount, fitted):
+        discount = np.asarray(discount, dtype=float)
+        rate = np.maximum(reactivation_curve(fitted, discount), fitted['base_rate'][:, None])
+        reactivated = users[:, None] * rate
+        incremental = users[:, None] * (rate - fitted['base_rate'][:, None])
+        cost = reactivated * base_aov * discount / 100 * promo_rides
+        subsidized = (reactivated - incremental) * base_aov * discount / 100 * promo_rides
+        return reactivated, incremental, cost, incremental * reactivated_ltv - cost, subsidized
+
+    net_value_grid = outcome(discounts, curves)[3]
+    best = net_value_grid.argmax(axis=1)
+    reactivated, incremental, cost, net_value, subsidized = (
+        value[:, 0] for value in outcome(discounts[best][:, None], eval_curves))
+    uniform = outcome([float(uniform_discount)], eval_curves)
+
+    return {
+        'bucket_start': curves['bucket_start'],
+        'users': users,
+        'discount_grid': discounts,
+        'net_value_grid': net_value_grid,
+        'optimal_discount': discounts[best],
+        'reactivated': reactivated,
+        'incremental_reactivated': incremental,
+        'cost': cost,
+        'net_value': net_value,
+        # Расходы на тех, кто вернулся бы без промо
+        'subsidized_cost': subsidized,
+        'uniform_cost': uniform[2][:, 0],
+        'uniform_net_value': uniform[3][:, 0],
+        'uniform_subsidized_cost': uniform[4][:, 0]
+    }
+
+def generate_retention_users(n_users: int = 1_000_000, base_aov=350, take_rate=PROMO_TAKE_RATE,
+                             seed: int = 42) -> Dict[str, np.ndarray]:
+    """Синтетическая активность пользователей, отток за следующий месяц и оставшийся LTV"""
+    rng = np.random.default_rng(seed)
+    ride_rate = rng.gamma(2.0, 2.0, n_users)
+    rides_last_30d = rng.poisson(ride_rate)
+    rides_prev_30d = rng.poisson(ride_rate * rng.lognormal(0, 0.3, n_users))
+    features = {
+        'days_since_last_ride': np.minimum(rng.exponential(30 / (ride_rate + 0.5)), 90),
+        'rides_last_30d': rides_last_30d.astype(float),
+        'rides_trend': (rides_last_30d - rides_prev_30d) / (rides_prev_30d + 1),
+        'support_tickets': rng.poisson(0.3, n_users).astype(float),
+        'promo_share': rng.beta(2, 5, n_users)
+    }
+    logit = (-1.5 + 0.05 * features['days_since_last_ride'] - 0.25 * features['rides_last_30d']
+             - 0.8 * features['rides_trend'] + 0.5 * features['support_tickets'] + 1.5 * features['promo_share'])
+    return {
+        **features,
+        'churned': rng.random(n_users) < 1 / (1 + np.exp(-logit)),
+        'ltv_remaining': ride_rate * base_aov * take_rate / 100 * RETENTION_LIFETIME_MONTHS
+    }
+
+def feature_matrix(users, features=RETENTION_FEATURES) -> np.ndarray:
+    """Матрица признаков (пользователи × признаки) из словаря массивов или DataFrame"""
+    return np.column_stack([np.asarray(users[name], dtype=float) for name in features])
+
+def fit_churn_model(X: np.ndarray, churned, l2: float = 1e-4, max_iter: int = 25,
+                    tol: float = 1e-8) -> Dict[str, np.ndarray]:
+    """Логистическая регрессия оттока методом Ньютона (IRLS) на стандартизованных признаках"""
+    mean, std = X.mean(axis=0), X.std(axis=0)
+    std = np.where(std > 0, std, 1.0)
+    Z = np.column_stack([np.ones(len(X)), (X - mean) / std])
+    y = np.asarray(churned, dtype=float)
+    penalty = l2 * len(X) * np.eye(Z.shape[1])
+    penalty[0, 0] = 0  # Свободный член не штрафуется
+
+    coef = np.zeros(Z.shape[1])
+    converged = False
+    for iteration in range(1, max_iter + 1):
+        p = 1 / (1 + np.exp(-(Z @ coef)))
+        gradient = Z.T @ (y - p) - penalty @ coef
+        hessian = (Z * (p * (1 - p))[:, None]).T @ Z + penalty
+        step = np.linalg.solve(hessian, gradient)
+        coef += step
+        if np.abs(step).max() < tol:
+            converged = True
+            break
+
+    return {'coef': coef, 'mean': mean, 'std': std, 'iterations': iteration, 'converged': converged}
+
+def churn_probability(model: Dict[str, np.ndarray], X: np.ndarray, chunk_size: int = 1_000_000) -> np.ndarray:
+    """Вероятность оттока для миллионов пользователей блоками по chunk_size строк"""
+    scores = np.empty(len(X))
+    for start in range(0, len(X), chunk_size):
+        block = (X[start:start + chunk_size] - model['mean']) / model['std']
+        scores[start:start + chunk_size] = 1 / (1 + np.exp(-(model['coef'][0] + block @ model['coef'][1:])))
+    return scores
+
+def rank_retention_targets(churn_prob, ltv_remaining, budget: float, cost_per_intervention: float = 100,
+                           roi_points: int = 200) -> Dict[str, np.ndarray]:
+    """Топ-K пользователей по ожидаемому сохраненному LTV минус стоимость вмешательства
+
+    Эффективность вмешательства растет с риском по опорным точкам риск-сегментов
+    retention-страницы. K ограничен бюджетом и числом пользователей с положительным
+    эффектом; argpartition выбирает топ-K за линейное время, сортируются только они.
+    """
+    churn_prob = np.asarray(churn_prob, dtype=float)
+    order = np.argsort(RETENTION_CHURN_PROBABILITY)
+    effectiveness = np.interp(churn_prob * 100, RETENTION_CHURN_PROBABILITY[order],
+                              RETENTION_EFFECTIVENESS[order]) / 100
+    expected_saved = churn_prob * effectiveness
+    saved_ltv = expected_saved * np.asarray(ltv_remaining, dtype=float)
+    net_value = saved_ltv - cost_per_intervention
+
+    k = int(min(budget // cost_per_intervention, (net_value > 0).sum()))
+    if k > 0:
+        top = np.argpartition(-net_value, k - 1)[:k]
+        top = top[np.argsort(-net_value[top], kind='stable')]
+    else:
+        top = np.array([], dtype=int)
+
+    # Кривая ROI по мере расширения списка: точки на равных долях топ-K
+    cumulative_saved_ltv = np.cumsum(saved_ltv[top])
+    points = np.unique(np.linspace(0, k, min(roi_points, k) + 1).astype(int))[1:] if k > 0 else np.array([], dtype=int)
+    spend = points * cost_per_intervention
+    ltv_at_points = cumulative_saved_ltv[points - 1] if k > 0 else np.array([])
+
+    return {
+        'targets': top,
+        'churn_probability': churn_prob[top],
+        'expected_saved': expected_saved[top],
+        'saved_ltv': saved_ltv[top],
+        'net_value': net_value[top],
+        'spend': k * cost_per_intervention,
+        'total_saved_users': expected_saved[top].sum(),
+        'total_saved_ltv': cumulative_saved_ltv[-1] if k > 0 else 0.0,
+        'curve_targets': points,
+        'curve_spend': spend,
+        'curve_saved_ltv': ltv_at_points,
+        'curve_roi': (ltv_at_points - spend) / np.where(spend > 0, spend, 1) * 100
+    }
+
+def fit_frequency_from_segments(segment_counts, cuts=BEHAVIOR_CUTS) -> Tuple[float, float]:
+    """Гамма-распределение месячной частоты (shape, scale) по числу пользователей в интервалах частоты"""
+    counts = np.asarray(segment_counts, dtype=float)
+    edges = np.concatenate([[0.0], cuts, [np.inf]])
+
+    def negative_log_likelihood(log_params):
+        shape, scale = np.exp(log_params)
+        probabilities = np.diff(gamma.cdf(edges, shape, scale=scale))
+        return -(counts * np.log(np.maximum(probabilities, 1e-300))).sum()
+
+    mean = (counts * np.array([1.5, 5, 12])[:len(counts)]).sum() / counts.sum()
+    result = minimize(negative_log_likelihood, np.log([1.0, mean]), method='Nelder-Mead')
+    shape, scale = np.exp(result.x)
+    return float(shape), float(scale)
+
+def fit_frequency_from_rides(ride_counts) -> Tuple[float, float]:
+    """Гамма-распределение интенсивности по месячным числам поездок (метод моментов гамма-пуассона)"""
+    rides = np.asarray(ride_counts, dtype=float)
+    mean, variance = rides.mean(), rides.var()
+    # Пуассоновский шум добавляет к дисперсии среднее; без избыточной дисперсии почти вырожденная гамма
+    excess = max(variance - mean, mean * 1e-3)
+    return float(mean ** 2 / excess), float(excess / mean)
+
+def frequency_bins(shape: float, scale: float, n_users: float, n_bins: int = 2000,
+                   tail: float = 0.9995) -> Tuple[np.ndarray, np.ndarray]:
+    """Гистограммная дискретизация распределения частоты: центры интервалов и пользователи в них"""
+    edges = np.linspace(0, gamma.ppf(tail, shape, scale=scale), n_bins + 1)
+    probabilities = np.diff(gamma.cdf(edges, shape, scale=scale))
+    # Хвост за последней границей относится к последнему интервалу
+    probabilities[-1] += gamma.sf(edges[-1], shape, scale=scale)
+    centers = np.maximum((edges[:-1] + edges[1:]) / 2, 1e-3)
+    return centers, n_users * probabilities
+
+def frequency_promo_kernel(frequency, discount, take_rate=PROMO_TAKE_RATE) -> Dict[str, np.ndarray]:
+    """Частота, затраты и доп. выручка на пользователя при скидке (broadcast частоты и скидки)"""
+    frequency = np.asarray(frequency, dtype=float)
+    discount = np.asarray(discount, dtype=float)
+    aov = np.interp(frequency, BEHAVIOR_AOV_FREQUENCY, BEHAVIOR_AOV)
+
+    # Эффект промо на frequency обратно пропорционален базовой частоте
+    frequency_lift = (discount / 100) * (10 / frequency)
+    new_frequency = frequency * (1 + frequency_lift)
+    promo_cost = new_frequency * aov * discount / 100
+    incremental_revenue = (new_frequency - frequency) * aov * take_rate / 100
+    return {
+        'new_frequency': new_frequency,
+        'promo_cost': promo_cost,
+        'incremental_revenue': incremental_revenue,
+        'net_value': incremental_revenue - promo_cost
+    }
+
+def frequency_segments_kernel(centers, users, cuts, discounts, take_rate=PROMO_TAKE_RATE) -> Dict[str, np.ndarray]:
+    """Интегралы по распределению частоты для сегментов между порогами cuts со своими скидками"""
+    segment = np.searchsorted(np.asarray(cuts, dtype=float), centers, side='right')
+    n_segments = len(cuts) + 1
+    per_user = frequency_promo_kernel(centers, np.asarray(discounts, dtype=float)[segment], take_rate)
+
+    def total(weights):
+        return np.bincount(segment, weights=users * weights, minlength=n_segments)
+
+    segment_users = total(np.ones_like(centers))
+    safe_users = np.maximum(segment_users, 1e-12)
+    cost = total(per_user['promo_cost'])
+    incremental_revenue = total(per_user['incremental_revenue'])
+    return {
+        'users': segment_users,
+        'avg_frequency': total(centers) / safe_users,
+        'new_frequency': total(per_user['new_frequency']) / safe_users,
+        'cost': cost,
+        'incremental_revenue': incremental_revenue,
+        'net_value': incremental_revenue - cost,
+        'roi': np.where(cost > 0, (incremental_revenue - cost) / np.where(cost > 0, cost, 1) * 100, 0.0)
+    }
+
+def optimize_frequency_segments(centers, users, n_segments: int = 3, discount_grid=np.arange(0, 71),
+                                n_candidates: int = 100, take_rate=PROMO_TAKE_RATE) -> Dict[str, np.ndarray]:
+    """Пороги сегментов и скидки, максимизирующие доп. выручку за вычетом затрат на промо
+
+    Вклад каждого интервала частоты при каждой скидке считается одним массивом
+    (скидки × интервалы), префиксные суммы дают эффект любого сегмента между двумя
+    кандидатами порогов, а лучшие пороги находятся динамическим программированием.
+    """
+    discounts = np.asarray(discount_grid, dtype=float)
+    per_user = frequency_promo_kernel(centers[None, :], discounts[:, None], take_rate)
+    prefix = np.concatenate([np.zeros((len(discounts), 1)), np.cumsum(per_user['net_value'] * users, axis=1)], axis=1)
+
+    # Кандидаты порогов - границы интервалов на равных квантилях пользователей
+    cumulative_users = np.concatenate([[0.0], np.cumsum(users)])
+    positions = np.unique(np.searchsorted(cumulative_users, np.linspace(0, cumulative_users[-1], n_candidates + 1)))
+    positions = np.clip(positions, 0, len(centers))
+    positions[0], positions[-1] = 0, len(centers)
+    positions = np.unique(positions)
+
+    # Лучший эффект сегмента между кандидатами a < b при лучшей скидке
+    segment_value = prefix[:, positions][:, None, :] - prefix[:, positions][:, :, None]
+    best_discount = segment_value.argmax(axis=0)
+    best_value = segment_value.max(axis=0)
+    m = len(positions)
+    valid = np.arange(m)[:, None] < np.arange(m)[None, :]
+    best_value = np.where(valid, best_value, -np.inf)
+
+    # value[k, b]: лучший эффект k+1 сегментов на [0, positions[b])
+    value = best_value[0][None, :].repeat(n_segments, axis=0)
+    parent = np.zeros((n_segments, m), dtype=int)
+    for k in range(1, n_segments):
+        candidates = value[k - 1][:, None] + best_value
+        parent[k] = candidates.argmax(axis=0)
+        value[k] = candidates.max(axis=0)
+
+    bounds = [m - 1]
+    for k in range(n_segments - 1, 0, -1):
+        bounds.append(parent[k, bounds[-1]])
+    bounds = [0] + bounds[::-1]
+
+    cut_positions = positions[bounds[1:-1]]
+    edges = np.concatenate([[0.0], (centers[:-1] + centers[1:]) / 2, [np.inf]])
+    cuts = edges[cut_positions]
+    segment_discounts = discounts[[best_discount[a, b] for a, b in zip(bounds[:-1], bounds[1:])]]
+    return {
+        'cuts': cuts,
+        'discounts': segment_discounts,
+        'net_value': value[n_segments - 1, m - 1],
+        'segments': frequency_segments_kernel(centers, users, cuts, segment_discounts, take_rate),
+        # Эффект каждой скидки для пользователя каждой частоты - для кривых на странице
+        'discount_grid': discounts,
+        'net_value_per_user': per_user['net_value']
+    }
+
+def generate_slot_table(n_cities: int = 5, n_zones: int = 8, weekly_rides: float = 400_000, supply_ratio: float = 1.2,
+                        trip_minutes: float = 20, seed: int = 42) -> pd.DataFrame:
+    """Синтетическая таблица слотов город × зона × час недели: заявки и водители онлайн"""
+    rng = np.random.default_rng(seed)
+    demand_profile = hour_of_week_profile()
+    # Водители выходят на линию более равномерно, чем пассажиры заказывают поездки
+    supply_profile = hour_of_week_profile(peak_height=1.6, night_level=0.35)
+    city_rides = weekly_rides * rng.lognormal(0, 0.5, n_cities)
+
+    requests = (city_rides[:, None, None] * demand_profile[None, :, None]
+                * zone_shares(n_zones, 0.35)[None, None, :])
+    fleet_hours = supply_ratio * city_rides * trip_minutes / 60
+    drivers = (fleet_hours[:, None, None] * supply_profile[None, :, None]
+               * zone_shares(n_zones, 0.2)[None, None, :])
+
+    city, hour, zone = np.meshgrid(np.arange(n_cities), np.arange(HOURS_PER_WEEK), np.arange(n_zones), indexing='ij')
+    return pd.DataFrame({
+        'city': [f"Город {k + 1}" for k in city.ravel()],
+        'zone': zone.ravel(),
+        'hour': hour.ravel(),
+        'requests': requests.ravel(),
+        'drivers': drivers.ravel()
+    })
+
+def load_slot_table(source: Union[str, Path, object]) -> pd.DataFrame:
+    """CSV слотов: city, zone, hour (0-167), requests, drivers, [elasticity]"""
+    table = pd.read_csv(source)
+    missing = set(SLOT_COLUMNS) - set(table.columns)
+    if missing:
+        raise ValueError(f"В таблице слотов нет колонок: {', '.join(sorted(missing))}")
+    if not table['hour'].between(0, HOURS_PER_WEEK - 1).all():
+        raise ValueError("hour должен быть от 0 до 167")
+    return table
+
+def slot_elasticity(requests: np.ndarray, elasticity_range: Tuple[float, float] = SLOT_ELASTICITY_RANGE) -> np.ndarray:
+    """Эластичность слота: чем ниже спрос относительно пика города-зоны, тем выше чувствительность к цене"""
+    low, high = elasticity_range
+    relative = requests / np.maximum(requests.max(axis=1, keepdims=True), 1e-12)
+    return high - (high - low) * relative
+
+def hour_of_week_pricing_kernel(requests, drivers, multiplier, elasticity, base_aov=350, take_rate=PROMO_TAKE_RATE,
+                                trip_minutes=20, target_utilization=0.8, supply_elasticity=0.6,
+                                incremental_ride_value=100) -> Dict[str, np.ndarray]:
+    """Поездки и маржа слота при ценовом множителе: > 1 - surge, < 1 - скидка за счет платформы
+
+    Спрос падает как multiplier^-elasticity, surge привлекает водителей
+    (multiplier^supply_elasticity), исполняется не больше пропускной способности.
+    Водитель получает долю от полной цены, поэтому скидка уменьшает маржу платформы
+    на всю свою величину; каждая дополнительная поездка дает incremental_ride_value.
+    """
+    multiplier = np.asarray(multiplier, dtype=float)
+    demand = requests * multiplier ** -elasticity
+    capacity = drivers * np.maximum(multiplier, 1.0) ** supply_elasticity * 60 / trip_minutes * target_utilization
+    rides = np.minimum(demand, capacity)
+
+    take = take_rate / 100
+    margin_per_ride = base_aov * np.where(multiplier >= 1, take * multiplier, take - (1 - multiplier))
+    return {
+        'demand': demand,
+        'rides': rides,
+        'margin': rides * margin_per_ride,
+        'objective': rides * (margin_per_ride + incremental_ride_value),
+        'utilization': rides / np.maximum(capacity, 1e-12) * target_utilization
+    }
+
+def optimize_hour_of_week_pricing(slots: pd.DataFrame, surge_cap: float = 2.0, max_discount: float = 40,
+                                  multiplier_step: float = 0.01, chunk_cells: int = 20_000,
+                                  **params) -> Dict[str, np.ndarray]:
+    """Лучший ценовой множитель для каждого слота город × зона × час недели
+
+    Слоты сводятся в массив (города-зоны, 168 часов); сетка множителей от
+    1 - max_discount до surge_cap перебирается для всех слотов сразу блоками по
+    chunk_cells строк, чтобы память не росла с числом городов и зон.
+    """
+    cities = slots['city'].astype(str).to_numpy()
+    zones = slots['zone'].astype(str).to_numpy()
+    keys, row = np.unique(np.char.add(np.char.add(cities, '|'), zones), return_inverse=True)
+    hour = slots['hour'].to_numpy(dtype=int)
+
+    shape = (len(keys), HOURS_PER_WEEK)
+    requests, drivers = np.zeros(shape), np.zeros(shape)
+    np.add.at(requests, (row, hour), slots['requests'].to_numpy(dtype=float))
+    np.add.at(drivers, (row, hour), slots['drivers'].to_numpy(dtype=float))
+    if 'elasticity' in slots:
+        elasticity = np.full(shape, np.mean(SLOT_ELASTICITY_RANGE))
+        elasticity[row, hour] = slots['elasticity'].to_numpy(dtype=float)
+    else:
+        elasticity = slot_elasticity(requests)
+
+    grid = np.round(np.arange(1 - max_discount / 100, surge_cap + 1e-9, multiplier_step), 6)
+    multiplier = np.ones(shape)
+    rows_per_chunk = max(chunk_cells // HOURS_PER_WEEK, 1)
+    for start in range(0, shape[0], rows_per_chunk):
+        block = slice(start, start + rows_per_chunk)
+        outcome = hour_of_week_pricing_kernel(requests[block, :, None], drivers[block, :, None], grid,
+                                              elasticity[block, :, None], **params)
+        multiplier[block] = grid[outcome['objective'].argmax(axis=2)]
+
+    baseline = hour_of_week_pricing_kernel(requests, drivers, 1.0, elasticity, **params)
+    optimal = hour_of_week_pricing_kernel(requests, drivers, multiplier, elasticity, **params)
+    city_zone = np.array([key.split('|', 1) for key in keys])
+    return {
+        'city': city_zone[:, 0],
+        'zone': city_zone[:, 1],
+        'requests': requests,
+        'elasticity': elasticity,
+        'multiplier': multiplier,
+        'rides': optimal['rides'],
+        'margin': optimal['margin'],
+        'utilization': optimal['utilization'],
+        'baseline_rides': baseline['rides'],
+        'baseline_margin': baseline['margin'],
+        'baseline_utilization': baseline['utilization']
+    }
+
+def generate_ride_log_chunks(n_users: int = 1_000_000, days: int = 90, users_per_chunk: int = 500_000,
+                             seed: int = 42) -> Iterator[Dict[str, np.ndarray]]:
+    """Синтетический журнал поездок блоками пользователей: user_id, day, fare"""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_users, users_per_chunk):
+        size = min(users_per_chunk, n_users - start)
+        ride_rate = rng.gamma(1.2, 3.5, size)  # Поездок в месяц
+        # Часть пользователей перестала ездить до конца окна наблюдения
+        active_until = np.clip(days - rng.exponential(20, size) * (rng.random(size) < 0.4), 1, days)
+        counts = rng.poisson(ride_rate * active_until / 30)
+        user_id = np.repeat(np.arange(start, start + size, dtype=np.int64), counts)
+        day = (rng.random(len(user_id)) * np.repeat(active_until, counts)).astype(np.int32)
+        fare = rng.lognormal(np.log(330), 0.35, len(user_id)) * np.repeat(rng.lognormal(0, 0.25, size), counts)
+        yield {'user_id': user_id, 'day': day, 'fare': fare}
+
+def read_ride_log_chunks(source: Union[str, Path, object],
+                         chunksize: int = 5_000_000) -> Iterator[Dict[str, np.ndarray]]:
+    """Потоковое чтение CSV журнала поездок (user_id - целое или строка, ride_date - дата, fare)"""
+    for chunk in pd.read_csv(source, usecols=RIDE_LOG_COLUMNS, chunksize=chunksize):
+        if chunk['user_id'].isna().any():
+            raise ValueError("В журнале есть поездки без user_id")
+        user_id = chunk['user_id']
+        day = pd.to_datetime(chunk['ride_date']).dt.normalize()
+        yield {
+            'user_id': (user_id.to_numpy(dtype=np.int64) if pd.api.types.is_integer_dtype(user_id)
+                        else user_id.astype(str).to_numpy(dtype=str)),
+            'day': ((day - pd.Timestamp(0)) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64),
+            'fare': chunk['fare'].to_numpy(dtype=float)
+        }
+
+def _merge_user_codes(sorted_ids: np.ndarray, sorted_codes: np.ndarray, n_codes: int,
+                      users: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Коды пользователей блока: известные - из отсортированного справочника, новые - следующие по счету"""
+    pos = np.searchsorted(sorted_ids, users)
+    found = pos < len(sorted_ids)
+    found[found] = sorted_ids[pos[found]] == users[found]
+    new = ~found
+
+    codes = np.empty(len(users), dtype=np.int64)
+    codes[found] = sorted_codes[pos[found]]
+    codes[new] = n_codes + np.arange(new.sum())
+    if new.any():
+        # Слияние отсортированных справочников: новые id вставляются на свои места
+        sorted_ids = np.insert(sorted_ids.astype(np.result_type(sorted_ids, users)), pos[new], users[new])
+        sorted_codes = np.insert(sorted_codes, pos[new], codes[new])
+    return sorted_ids, sorted_codes, codes
+
+def accumulate_rfm(chunks: Iterable[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Recency, frequency, monetary по пользователям за один проход по журналу
+
+    В каждом блоке поездки группируются по пользователю через np.unique и bincount.
+    user_id (целые или строки) кодируются плотно: отсортированный справочник id → код
+    пополняется слиянием с уникальными id блока, а частичные итоги копятся в массивах,
+    индексированных кодом. Память пропорциональна числу пользователей, а не значениям id.
+    """
+    # int32 для счетчиков и дней: 50M пользователей занимают ~800 МБ
+    frequency = np.zeros(0, dtype=np.int32)
+    monetary = np.zeros(0)
+    last_day = np.zeros(0, dtype=np.int32)
+    sorted_ids, sorted_codes, n_codes = None, np.zeros(0, dtype=np.int64), 0
+    first_day, as_of = np.iinfo(np.int32).max, np.iinfo(np.int32).min
+
+    for chunk in chunks:
+        if len(chunk['user_id']) == 0:
+            continue
+        users, inverse = np.unique(np.asarray(chunk['user_id']), return_inverse=True)
+        if sorted_ids is None:
+            sorted_ids = users[:0]
+        elif (sorted_ids.dtype.kind in 'iu') != (users.dtype.kind in 'iu'):
+            # Числовые и строковые id в одном журнале сравниваются как строки
+            sorted_ids = sorted_ids.astype(str)
+            order = np.argsort(sorted_ids, kind='stable')
+            sorted_ids, sorted_codes = sorted_ids[order], sorted_codes[order]
+            users, remap = np.unique(users.astype(str), return_inverse=True)
+            inverse = remap[inverse]
+
+        sorted_ids, sorted_codes, codes = _merge_user_codes(sorted_ids, sorted_codes, n_codes, users)
+        n_codes = len(sorted_codes)
+        if n_codes > len(frequency):
+            size = max(n_codes, 2 * len(frequency))
+            frequency = np.pad(frequency, (0, size - len(frequency)))
+            monetary = np.pad(monetary, (0, size - len(monetary)))
+            last_day = np.pad(last_day, (0, size - len(last_day)), constant_values=np.iinfo(np.int32).min)
+
+        day = np.asarray(chunk['day'], dtype=np.int32)
+        frequency[codes] += np.bincount(inverse, minlength=len(users)).astype(np.int32)
+        monetary[codes] += np.bincount(inverse, weights=chunk['fare'], minlength=len(users))
+        # Последний день пользователя в блоке: максимум по группе
+        chunk_last = np.full(len(users), np.iinfo(np.int32).min, dtype=np.int32)
+        np.maximum.at(chunk_last, inverse, day)
+        last_day[codes] = np.maximum(last_day[codes], chunk_last)
+        first_day, as_of = min(first_day, int(day.min())), max(as_of, int(day.max()))
+
+    # Итоги в порядке user_id
+    return {
+        'user_id': sorted_ids if sorted_ids is not None else np.zeros(0, dtype=np.int64),
+        'recency': (as_of - last_day[sorted_codes]).astype(np.int32),
+        'frequency': frequency[sorted_codes],
+        'monetary': monetary[sorted_codes],
+        'observed_days': as_of - first_day + 1 if n_codes else 0
+    }
+
+def rfm_scores(rfm: Dict[str, np.ndarray], n_quantiles: int = 5) -> Dict[str, np.ndarray]:
+    """Квантильные баллы 1..n_quantiles; у recency высокий балл - недавняя поездка"""
+    levels = np.linspace(0, 1, n_quantiles + 1)[1:-1]
+
+    def score(values):
+        edges = np.quantile(values, levels)
+        return (np.searchsorted(edges, values, side='right') + 1).astype(np.int8)
+
+    return {
+        'r': (n_quantiles + 1 - score(rfm['recency'])).astype(np.int8),
+        'f': score(rfm['frequency']),
+        'm': score(rfm['monetary'])
+    }
+
+def value_tier_table(rfm: Dict[str, np.ndarray], bounds=VALUE_TIER_BOUNDS) -> Dict[str, np.ndarray]:
+    """Средние по value-сегментам (по месячным тратам): пользователи, траты, частота, риск оттока"""
+    months = max(rfm['observed_days'], 1) / 30
+    monthly_spend = rfm['monetary'] / months
+    tier = np.searchsorted(np.asarray(bounds, dtype=float), monthly_spend, side='right')
+    n_tiers = len(bounds) + 1
+
+    count = np.bincount(tier, minlength=n_tiers)
+    safe_count = np.maximum(count, 1)
+
+    def average(values):
+        return np.bincount(tier, weights=values, minlength=n_tiers) / safe_count
+
+    return {
+        'count': count,
+        'avg_monthly_spend': average(monthly_spend),
+        'frequency': average(rfm['frequency'] / months),
+        'churn_risk': average((rfm['recency'] > RFM_CHURN_RECENCY_DAYS).astype(float)) * 100,
+        'avg_recency': average(rfm['recency'].astype(float))
+    }
+
+def generate_zone_table(n_zones: int = 2000, seed: int = 42) -> pd.DataFrame:
+    """Синтетические районы: население, доход, конкуренция, транспорт и текущее проникновение"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'zone': [f"Район {k + 1}" for k in range(n_zones)],
+        'population': rng.lognormal(np.log(40000), 0.6, n_zones).round(),
+        'avg_income': rng.lognormal(np.log(60000), 0.35, n_zones).round(-3),
+        'competition': rng.integers(1, 11, n_zones),
+        'public_transport': rng.integers(1, 11, n_zones),
+        'current_penetration': rng.uniform(2, 19, n_zones).round(1)
+    })
+
+def load_zone_table(source: Union[str, Path, object]) -> pd.DataFrame:
+    """CSV районов с колонками ZONE_COLUMNS"""
+    table = pd.read_csv(source)
+    missing = set(ZONE_COLUMNS) - set(table.columns)
+    if missing:
+        raise ValueError(f"В таблице районов нет колонок: {', '.join(sorted(missing))}")
+    return table
+
+def zone_promo_response(zones: pd.DataFrame, discount, base_aov=350, promo_rides=ZONE_PROMO_RIDES,
+                        new_user_ltv=ZONE_NEW_USER_LTV) -> Dict[str, np.ndarray]:
+    """Новые пользователи, затраты и LTV района при скидке; discount вещается на ось районов
+
+    Кампания забирает долю незанятого потенциала района, насыщаясь с ростом скидки.
+    Конкуренция снижает достижимую долю, доход и хороший транспорт замедляют отклик.
+    Чек растет с доходом, а слабый транспорт повышает частоту поездок и LTV; колонка
+    ltv в таблице районов заменяет эту оценку.
+    """
+    population = zones['population'].to_numpy(dtype=float)
+    income = zones['avg_income'].to_numpy(dtype=float) / 55000
+    transport = zones['public_transport'].to_numpy(dtype=float)
+    headroom = np.maximum(population * (ZONE_MAX_PENETRATION - zones['current_penetration'].to_numpy(dtype=float))
+                          / 100, 0)
+    max_capture = 0.3 * (1 - zones['competition'].to_numpy(dtype=float) / 20)
+    response_scale = 15 * income ** 0.7 * (1 + transport / 10)
+
+    aov = base_aov * income ** 0.3
+    if 'ltv' in zones:
+        ltv = zones['ltv'].to_numpy(dtype=float)
+    else:
+        ltv = new_user_ltv * income ** 0.3 * (1 + (5 - transport) / 20)
+
+    discount = np.asarray(discount, dtype=float)
+    new_users = headroom * max_capture * (1 - np.exp(-discount / response_scale))
+    cost = new_users * aov * discount / 100 * promo_rides
+    return {'new_users': new_users, 'cost': cost, 'ltv': new_users * ltv}
+
+def allocate_zone_discounts(zones: pd.DataFrame, budget: float, discount_grid=np.arange(0, 60.25, 0.25),
+                            min_marginal_roi: float = 1.0, tol: float = 1e-6, max_iter: int = 100,
+                            **params) -> Dict[str, np.ndarray]:
+    """Скидки районов, максимизирующие LTV новых пользователей при общем бюджете
+
+    Лагранжева релаксация: при цене бюджета lambda каждый район независимо выбирает
+    скидку с максимумом LTV - lambda × затраты (сетка скидки × районы одним массивом),
+    а lambda подбирается бисекцией, пока затраты не уложатся в бюджет. В итоге
+    предельный ROI районов, получивших скидку, выровнен на уровне lambda; lambda не
+    опускается ниже min_marginal_roi, так что неокупаемая часть бюджета не тратится.
+    """
+    discounts = np.asarray(discount_grid, dtype=float)
+    response = zone_promo_response(zones, discounts[:, None], **params)
+    columns = np.arange(len(zones))
+
+    def choose(price):
+        best = (response['ltv'] - price * response['cost']).argmax(axis=0)
+        return best, response['cost'][best, columns].sum()
+
+    low = float(min_marginal_roi)
+    high = max(2 * low, 1.0)
+    best, spend = choose(low)
+    if spend > budget:
+        while choose(high)[1] > budget:
+            high *= 2
+        for _ in range(max_iter):
+            middle = (low + high) / 2
+            if choose(middle)[1] > budget:
+                low = middle
+            else:
+                high = middle
+            if high - low < tol * high:
+                break
+        low = high
+        best, spend = choose(high)
+
+    # Предельный ROI района на следующем шаге скидки
+    step = np.minimum(best + 1, len(discounts) - 1)
+    extra_cost = response['cost'][step, columns] - response['cost'][best, columns]
+    extra_ltv = response['ltv'][step, columns] - response['ltv'][best, columns]
+    return {
+        'zone': zones['zone'].to_numpy(),
+        'discount': discounts[best],
+        'spend': response['cost'][best, columns],
+        'new_users': response['new_users'][best, columns],
+        'ltv': response['ltv'][best, columns],
+        'marginal_roi': np.where(extra_cost > 0, extra_ltv / np.where(extra_cost > 0, extra_cost, 1), 0.0),
+        'budget_price': low,
+        'total_spend': spend
+    }
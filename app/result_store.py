@@ -0,0 +1,160 @@
+"""Журнал прогонов сценариев в локальном SQLite.
+
+Каждый прогон - строка в runs (сценарий, хэш параметров, время) и набор значений
+входов и выходов в run_values по одному полю на строку. Записи только добавляются.
+Индексы по (scenario, param_hash) и (field, run_id) позволяют искать прогоны и
+сравнивать отдельные поля сотен прогонов, не загружая журнал целиком.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# Журнал лежит в корне проекта, а не в текущей директории процесса
+RESULT_STORE_PATH = Path(__file__).resolve().parent.parent / '.cache' / 'scenario_results.sqlite'
+
+# Одно соединение разделяют сессии Streamlit: запросы и пара проверка дубля + вставка идут под блокировкой
+_STORE_LOCK = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    scenario TEXT NOT NULL,
+    param_hash TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_scenario_hash ON runs (scenario, param_hash);
+CREATE TABLE IF NOT EXISTS run_values (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    kind TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value
+);
+CREATE INDEX IF NOT EXISTS run_values_run ON run_values (run_id);
+CREATE INDEX IF NOT EXISTS run_values_field ON run_values (field, run_id);
+"""
+
+
+def _plain(value):
+    """Значение для SQLite: numpy-скаляры в float/int/str"""
+    if isinstance(value, (np.generic, np.ndarray)):
+        value = np.asarray(value).item()
+    # SQLite хранит NaN как NULL
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
+
+def params_hash(params: Dict[str, object]) -> str:
+    """Стабильный хэш набора входов сценария"""
+    payload = json.dumps({key: _plain(value) for key, value in params.items()}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def open_result_store(path: Union[str, Path] = RESULT_STORE_PATH) -> sqlite3.Connection:
+    """Соединение с журналом, схема создается при первом открытии"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.executescript(_SCHEMA)
+    return connection
+
+def find_runs(connection: sqlite3.Connection, scenario: Optional[str] = None,
+              param_hash: Optional[str] = None, limit: int = 500) -> pd.DataFrame:
+    """Прогоны по сценарию и/или хэшу параметров, новые первыми"""
+    conditions, args = [], []
+    if scenario is not None:
+        conditions.append("scenario = ?")
+        args.append(scenario)
+    if param_hash is not None:
+        conditions.append("param_hash = ?")
+        args.append(param_hash)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with _STORE_LOCK:
+        return pd.read_sql_query(
+            f"SELECT run_id, scenario, param_hash, created_at FROM runs {where} ORDER BY run_id DESC LIMIT ?",
+            connection, params=[*args, limit], index_col='run_id'
+        )
+
+def record_run(connection: sqlite3.Connection, scenario: str, inputs: Dict[str, object],
+               outputs: Dict[str, object], deduplicate: bool = True) -> int:
+    """Добавить прогон; при deduplicate повторный прогон с теми же входами и выходами не пишется
+
+    Выходы сравниваются с последним прогоном с тем же хэшем входов, поэтому после
+    изменения формул ядра прогон записывается заново.
+    """
+    run_hash = params_hash(inputs)
+
+    # Сохраняются только скалярные выходы
+    rows = [('input', key, _plain(value)) for key, value in inputs.items()]
+    rows += [('output', key, _plain(value)) for key, value in outputs.items() if np.ndim(value) == 0]
+
+    with _STORE_LOCK:
+        if deduplicate:
+            existing = connection.execute(
+                "SELECT run_id FROM runs WHERE scenario = ? AND param_hash = ? ORDER BY run_id DESC LIMIT 1",
+                (scenario, run_hash)
+            ).fetchone()
+            if existing is not None:
+                stored = connection.execute(
+                    "SELECT field, value FROM run_values WHERE run_id = ? AND kind = 'output'", existing
+                ).fetchall()
+                if dict(stored) == {field: value for kind, field, value in rows if kind == 'output'}:
+                    return existing[0]
+
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (scenario, param_hash, created_at) VALUES (?, ?, ?)",
+                (scenario, run_hash, datetime.now().isoformat(timespec='seconds'))
+            )
+            run_id = cursor.lastrowid
+            connection.executemany("INSERT INTO run_values (run_id, kind, field, value) VALUES (?, ?, ?, ?)",
+                                   [(run_id, *row) for row in rows])
+    return run_id
+
+def _id_list(run_ids: Sequence[int]) -> str:
+    return ', '.join(str(int(run_id)) for run_id in run_ids)
+
+def changed_fields(connection: sqlite3.Connection, run_ids: Sequence[int]) -> List[str]:
+    """Поля, значения которых различаются между прогонами (агрегация на стороне SQLite)"""
+    if len(run_ids) == 0:
+        return []
+    with _STORE_LOCK:
+        rows = connection.execute(
+            f"SELECT field FROM run_values WHERE run_id IN ({_id_list(run_ids)}) "
+            "GROUP BY kind, field HAVING COUNT(DISTINCT value) > 1 OR COUNT(*) < ? ORDER BY kind, field",
+            (len(run_ids),)
+        ).fetchall()
+    return [field for (field,) in rows]
+
+def load_runs(connection: sqlite3.Connection, run_ids: Sequence[int],
+              fields: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Значения прогонов бок о бок: строки - поля (вход/выход), колонки - прогоны"""
+    if len(run_ids) == 0:
+        return pd.DataFrame()
+
+    query = f"SELECT run_id, kind, field, value FROM run_values WHERE run_id IN ({_id_list(run_ids)})"
+    args = []
+    if fields is not None:
+        if len(fields) == 0:
+            return pd.DataFrame(columns=list(run_ids))
+        query += f" AND field IN ({', '.join('?' * len(fields))})"
+        args = list(fields)
+
+    with _STORE_LOCK:
+        values = pd.read_sql_query(query, connection, params=args)
+    table = values.pivot_table(index=['kind', 'field'], columns='run_id', values='value', aggfunc='first')
+    # Входы (input) выше выходов (output), колонки в порядке запроса
+    return table.sort_index().reindex(columns=list(run_ids))
+
+def diff_runs(connection: sqlite3.Connection, run_ids: Sequence[int], only_changed: bool = True) -> pd.DataFrame:
+    """Сравнение прогонов: только различающиеся поля или все"""
+    fields = changed_fields(connection, run_ids) if only_changed else None
+    return load_runs(connection, run_ids, fields)
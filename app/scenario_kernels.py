@@ -0,0 +1,839 @@
+"""Чистые вычислительные ядра сценариев ride-hailing.
+
+Каждое ядро принимает скаляры или массивы одной формы (numpy broadcasting)
+и возвращает словарь массивов. UI в app/scenarios.py только собирает
+параметры со слайдеров и отображает результат, поэтому любой сценарий
+можно прогнать пакетно по таблице параметров:
+
+    python -m app.scenario_kernels economic_crisis params.csv -o results.csv
+"""
+import argparse
+import inspect
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.optimize import differential_evolution
+from typing import Callable, Dict, Optional, Tuple
+from app.supply_demand import pickup_wait_model, hour_of_week_profile, zone_shares, WEEKS_PER_MONTH
+
+COMPETITIVE_WAR_STRATEGIES = ['Не реагируем', 'Промовойна', 'Фокус на retention']
+COMPETITIVE_WAR_KEYS = ['ignore', 'promo', 'retention']
+
+PANDEMIC_PHASES = ["🔒 Lockdown (полная изоляция)", "📉 Partial restrictions", "📈 Recovery phase", "🆕 New normal"]
+PANDEMIC_PHASE_DEMAND_CHANGE = np.array([-80, -50, -20, 10])
+PANDEMIC_PHASE_SAFETY_PREMIUM = np.array([80, 60, 30, 10])
+
+LAUNCH_STRATEGIES = ["Aggressive (быстрый захват)", "Moderate (постепенный рост)", "Conservative (осторожный вход)"]
+LAUNCH_CAC_MULTIPLIERS = np.array([2.0, 1.3, 1.0])
+LAUNCH_MONTHS_TO_TARGET = np.array([12, 18, 24])
+
+
+def competitive_war_kernel(market_share_loss=25, promo_intensity=30, cac_inflation=50,
+                           promo_retained_share=0.95, retention_loss_factor=0.6,
+                           retention_frequency_lift=1.2, base_aov=350, base_frequency=4.5,
+                           base_take_rate=25, base_cac=1500, base_users=100000) -> Dict[str, np.ndarray]:
+    """Пользователи, выручка и CAC трех стратегий ответа на промовойну"""
+    market_share_loss = np.asarray(market_share_loss, dtype=float)
+    promo_intensity = np.asarray(promo_intensity, dtype=float)
+    cac_inflation = np.asarray(cac_inflation, dtype=float)
+
+    # Не реагируем: теряем долю, CAC прежний
+    users_ignore = base_users * (1 - market_share_loss / 100)
+    revenue_ignore = users_ignore * base_aov * (base_take_rate / 100) * base_frequency
+
+    # Промовойна: небольшая потеря все равно есть, промокоды едят маржу
+    users_promo = base_users * np.asarray(promo_retained_share, dtype=float)
+    effective_take_rate = base_take_rate - promo_intensity
+    revenue_promo = users_promo * base_aov * (effective_take_rate / 100) * base_frequency
+
+    # Retention: меньшие потери и рост частоты у лояльных пользователей
+    users_retention = base_users * (1 - market_share_loss / 100 * retention_loss_factor)
+    revenue_retention = users_retention * base_aov * (base_take_rate / 100) * base_frequency * retention_frequency_lift
+
+    users_ignore, users_promo, users_retention, revenue_ignore, revenue_promo, revenue_retention, cac_inflation = \
+        np.broadcast_arrays(users_ignore, users_promo, users_retention, revenue_ignore, revenue_promo,
+                            revenue_retention, cac_inflation)
+
+    return {
+        'users_ignore': users_ignore,
+        'revenue_ignore': revenue_ignore,
+        'cac_ignore': np.full(users_ignore.shape, float(base_cac)),
+        'users_promo': users_promo,
+        'revenue_promo': revenue_promo,
+        'cac_promo': base_cac * (1 + cac_inflation / 100),
+        'effective_take_rate': np.broadcast_to(effective_take_rate, users_ignore.shape),
+        'users_retention': users_retention,
+        'revenue_retention': revenue_retention,
+        'cac_retention': np.full(users_ignore.shape, base_cac * 1.1)
+    }
+
+def _softmax(utility: np.ndarray) -> np.ndarray:
+    """Доли выбора logit-модели по последней оси"""
+    weights = np.exp(utility - utility.max(axis=-1, keepdims=True))
+    return weights / weights.sum(axis=-1, keepdims=True)
+
+def promo_war_agent_kernel(n_markets=250, n_platforms=3, n_weeks=52, aggressor_promo=30, aggressor_weeks=8,
+                           max_promo=50, promo_step=5, riders_per_market=300_000, base_aov=350,
+                           base_take_rate=25, rides_per_week=1.0, base_wait=5, rider_value_weeks=8,
+                           budget_weeks=8, rider_inertia=0.25, driver_inertia=0.15, wait_weight=0.3,
+                           density_effect=0.8, truce_promo=2, uncertainty=0.3, seed=42) -> Dict[str, np.ndarray]:
+    """Агентная промовойна N платформ в n_markets независимых рынках
+
+    Платформа 0 - мы, платформа 1 - агрессор: первые aggressor_weeks недель он держит
+    промо aggressor_promo (% от чека). Каждую неделю остальные (и агрессор после кампании)
+    выбирают промо из сетки 0..max_promo как лучший ответ на текущие промо соперников:
+    недельная маржа плюс ценность прироста базы (rider_value_weeks недель маржи на пассажира).
+    Промо ограничено бюджетом budget_weeks недель базовой маржи. Пассажиры выбирают
+    платформу logit-моделью по цене и времени подачи, водители - по заработку на водителя,
+    обе стороны переходят с инерцией. Больший парк сокращает подачу (density_effect), поэтому
+    выигранная доля может закрепиться. Чувствительности и бренды случайны по рынкам.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (n_markets, n_platforms)
+    aggressor = 1 % n_platforms
+
+    price_sensitivity = 3.0 * rng.lognormal(0, uncertainty, (n_markets, 1))
+    wait_sensitivity = wait_weight * rng.lognormal(0, uncertainty, (n_markets, 1))
+    earnings_sensitivity = 4.0 * rng.lognormal(0, uncertainty, (n_markets, 1))
+    brand = rng.normal(0, 0.2 * uncertainty, shape)
+    weekly_rides = riders_per_market * rides_per_week * rng.lognormal(0, uncertainty, (n_markets, 1))
+
+    rider_share = rng.dirichlet(np.full(n_platforms, 20.0), n_markets)
+    driver_share = rider_share.copy()
+
+    take = base_take_rate / 100
+    rider_value = base_aov * take * rider_value_weeks  # Ценность недельной поездки-пассажира
+    budget = budget_weeks * weekly_rides * rider_share * base_aov * take * rng.lognormal(0, uncertainty, shape)
+    burn = np.zeros(shape)
+
+    promo_grid = np.arange(0, max_promo + 1e-9, promo_step) / 100
+    own = np.eye(n_platforms, dtype=bool)  # (платформа, платформа-соперник)
+
+    history = {key: np.empty((n_markets, n_weeks, n_platforms))
+               for key in ('rider_share', 'driver_share', 'promo', 'profit')}
+    promo = np.zeros(shape)
+
+    for week in range(n_weeks):
+        # Подача дольше при большем числе пассажиров на водителя и короче у большего парка (плотность машин)
+        density = np.maximum(driver_share * n_platforms, 1e-6) ** -density_effect
+        wait = np.clip(base_wait * (rider_share / np.maximum(driver_share, 1e-6)) ** 0.7 * density, 2, 30)
+
+        # Лучший ответ по осям (рынок, платформа, вариант промо, платформа в выборе пассажира)
+        candidates = np.where(own[None, :, None, :], promo_grid[None, None, :, None], promo[:, None, None, :])
+        utility = (brand[:, None, None, :] - price_sensitivity[:, :, None, None] * np.log1p(-candidates)
+                   - wait_sensitivity[:, :, None, None] * wait[:, None, None, :])
+        next_share = (1 - rider_inertia) * rider_share[:, None, None, :] + rider_inertia * _softmax(utility)
+        own_share = (next_share * own[None, :, None, :]).sum(axis=-1)
+
+        gmv = weekly_rides[:, :, None] * own_share * base_aov
+        candidate_burn = gmv * promo_grid
+        share_gain = own_share - rider_share[:, :, None]
+        objective = gmv * (take - promo_grid) + rider_value * weekly_rides[:, :, None] * share_gain
+        objective = np.where(candidate_burn <= (budget - burn)[:, :, None], objective, -np.inf)
+        promo = promo_grid[objective.argmax(axis=2)]
+
+        # Агрессор держит кампанию, пока хватает бюджета
+        if week < aggressor_weeks:
+            committed = aggressor_promo / 100
+            affordable = weekly_rides[:, 0] * rider_share[:, aggressor] * base_aov * committed \
+                <= budget[:, aggressor] - burn[:, aggressor]
+            promo[:, aggressor] = np.where(affordable, committed, promo[:, aggressor])
+
+        # Реальный ход недели: пассажиры по цене и подаче, водители по заработку
+        utility = brand - price_sensitivity * np.log1p(-promo) - wait_sensitivity * wait
+        rider_share = (1 - rider_inertia) * rider_share + rider_inertia * _softmax(utility)
+        earnings_index = np.log(rider_share / np.maximum(driver_share, 1e-6))
+        driver_target = _softmax(earnings_sensitivity * earnings_index)
+        driver_share = (1 - driver_inertia) * driver_share + driver_inertia * driver_target
+
+        gmv = weekly_rides * rider_share * base_aov
+        burn += gmv * promo
+        history['rider_share'][:, week] = rider_share
+        history['driver_share'][:, week] = driver_share
+        history['promo'][:, week] = promo * 100
+        history['profit'][:, week] = gmv * (take - promo)
+
+    # Перемирие: с этой недели до конца горизонта промо всех платформ не выше truce_promo
+    at_war = history['promo'].max(axis=2) > truce_promo
+    last_war_week = np.where(at_war.any(axis=1), n_weeks - at_war[:, ::-1].argmax(axis=1), 0)
+    truce_week = np.where(at_war[:, -1], np.nan, last_war_week.astype(float))
+
+    return {
+        'rider_share': history['rider_share'][:, -1],
+        'driver_share': history['driver_share'][:, -1],
+        'cumulative_burn': burn,
+        'cumulative_profit': history['profit'].sum(axis=1),
+        'truce_week': truce_week,
+        'share_path': history['rider_share'],
+        'promo_path': history['promo']
+    }
+
+def _promo_war_chunk(args: Tuple[int, Dict]) -> Dict[str, np.ndarray]:
+    """Один пакет рынков для пула процессов"""
+    seed, params = args
+    return promo_war_agent_kernel(seed=seed, **params)
+
+def simulate_promo_war_markets(n_markets=2000, n_workers=None, chunk_markets=250, seed=42,
+                               **params) -> Dict[str, np.ndarray]:
+    """Прогон независимых рынков пакетами по chunk_markets в пуле процессов
+
+    Зерна пакетов порождаются из seed через SeedSequence, поэтому результат
+    не зависит от числа процессов. n_workers=1 считает в текущем процессе.
+    """
+    sizes = np.diff(np.append(np.arange(0, n_markets, chunk_markets), n_markets))
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(len(sizes))]
+    tasks = [(chunk_seed, {**params, 'n_markets': int(size)}) for chunk_seed, size in zip(seeds, sizes)]
+
+    if n_workers == 1 or len(tasks) == 1:
+        chunks = [_promo_war_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            chunks = list(executor.map(_promo_war_chunk, tasks))
+
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+def economic_crisis_kernel(demand_drop=35, price_sensitivity=1.8, price_cut=15, cost_optimization=25,
+                           base_volume=1_000_000, base_aov=350, base_take_rate=25,
+                           base_ops_cost=50, rides_per_user=4.5) -> Dict[str, np.ndarray]:
+    """Объем, выручка и прибыль в кризис с учетом снижения цен и оптимизации расходов"""
+    demand_drop = np.asarray(demand_drop, dtype=float)
+    price_sensitivity = np.asarray(price_sensitivity, dtype=float)
+    price_cut = np.asarray(price_cut, dtype=float)
+    cost_optimization = np.asarray(cost_optimization, dtype=float)
+
+    new_volume = base_volume * (1 - demand_drop / 100)
+    new_aov = base_aov * (1 - price_cut / 100)
+
+    # Price elasticity effect
+    additional_volume_from_price_cut = base_volume * (price_cut / 100) * price_sensitivity
+    final_volume = np.minimum(new_volume + additional_volume_from_price_cut, base_volume * 0.9)
+
+    new_ops_cost = base_ops_cost * (1 - cost_optimization / 100)
+
+    base_revenue = base_volume * base_aov * (base_take_rate / 100)
+    new_revenue = final_volume * new_aov * (base_take_rate / 100)
+
+    base_profit = base_revenue - (base_volume / rides_per_user) * base_ops_cost
+    new_profit = new_revenue - (final_volume / rides_per_user) * new_ops_cost
+
+    return {
+        'final_volume': final_volume,
+        'new_aov': np.broadcast_to(new_aov, final_volume.shape),
+        'new_revenue': new_revenue,
+        'new_profit': new_profit,
+        'base_revenue': np.full(final_volume.shape, base_revenue),
+        'base_profit': np.full(final_volume.shape, base_profit),
+        'profit_impact': (new_profit - base_profit) / base_profit
+    }
+
+def crisis_response_surface(demand_drops, price_sensitivities, price_cuts, cost_optimizations,
+                            **base_metrics) -> Dict[str, np.ndarray]:
+    """Прибыль кризиса на сетке (спрос × эластичность × снижение цен × оптимизация расходов)
+
+    Возвращает полную поверхность profit_impact и оптимальное снижение цен
+    для каждой комбинации остальных осей (ось снижения цен свернута argmax).
+    """
+    demand_drops = np.asarray(demand_drops, dtype=float)
+    price_sensitivities = np.asarray(price_sensitivities, dtype=float)
+    price_cuts = np.asarray(price_cuts, dtype=float)
+    cost_optimizations = np.asarray(cost_optimizations, dtype=float)
+
+    result = economic_crisis_kernel(demand_drops[:, None, None, None], price_sensitivities[None, :, None, None],
+                                    price_cuts[None, None, :, None], cost_optimizations[None, None, None, :],
+                                    **base_metrics)
+    profit_impact = result['profit_impact']
+    best = profit_impact.argmax(axis=2)
+
+    return {
+        'profit_impact': profit_impact,
+        'optimal_price_cut': price_cuts[best],
+        'optimal_profit_impact': np.take_along_axis(profit_impact, best[:, :, None, :], axis=2)[:, :, 0, :]
+    }
+
+def regulation_kernel(licensing_cost=15000, driver_retention_impact=25, surge_limitation=2.0, digital_tax=5,
+                      base_drivers=50000, base_surge_revenue_share=15, base_avg_surge=2.5,
+                      base_monthly_revenue=500_000_000) -> Dict[str, np.ndarray]:
+    """Потери выручки и дополнительные расходы от регулирования"""
+    licensing_cost = np.asarray(licensing_cost, dtype=float)
+    driver_retention_impact = np.asarray(driver_retention_impact, dtype=float)
+    surge_limitation = np.asarray(surge_limitation, dtype=float)
+    digital_tax = np.asarray(digital_tax, dtype=float)
+
+    # Влияние на водителей
+    remaining_drivers = base_drivers * (1 - driver_retention_impact / 100)
+    supply_shortage = (base_drivers - remaining_drivers) / base_drivers
+
+    # Влияние на surge pricing (только если лимит ниже текущего среднего surge)
+    surge_revenue_loss = np.where(
+        surge_limitation < base_avg_surge,
+        (base_surge_revenue_share / 100) * base_monthly_revenue * ((base_avg_surge - surge_limitation) / base_avg_surge),
+        0.0
+    )
+
+    # Влияние дефицита водителей на спрос
+    demand_impact = supply_shortage * 0.8  # 80% эластичность спроса к доступности
+    demand_loss = base_monthly_revenue * demand_impact
+
+    tax_cost = base_monthly_revenue * (digital_tax / 100)
+    monthly_licensing_cost = (base_drivers * licensing_cost) / 12  # Амортизация на год
+
+    total_revenue_impact = surge_revenue_loss + demand_loss
+    total_cost_impact = tax_cost + monthly_licensing_cost
+    net_impact = total_revenue_impact + total_cost_impact
+
+    remaining_drivers, surge_revenue_loss, demand_loss, total_cost_impact, monthly_licensing_cost, net_impact = \
+        np.broadcast_arrays(remaining_drivers, surge_revenue_loss, demand_loss, total_cost_impact,
+                            monthly_licensing_cost, net_impact)
+
+    return {
+        'remaining_drivers': remaining_drivers,
+        'lost_drivers': base_drivers - remaining_drivers,
+        'surge_revenue_loss': surge_revenue_loss,
+        'demand_loss': demand_loss,
+        'monthly_licensing_cost': monthly_licensing_cost,
+        'total_cost_impact': total_cost_impact,
+        'net_impact': net_impact,
+        'total_impact_pct': net_impact / base_monthly_revenue * 100
+    }
+
+def _regulation_market(drivers, surge, licensing_cost, surge_cap, requests_base, online_share, zones_demand,
+                       zones_supply, aov, take_rate, price_elasticity, trip_minutes, patience_minutes,
+                       driver_hours_per_month, target_utilization, surge_response):
+    """Один шаг рынка: по водителям и surge (N, часы, зоны) - поездки, заработок и новый surge"""
+    # Спрос в ячейке час × зона снижается от surge, водители распределены по часам и зонам
+    requests = requests_base[:, :, None] * zones_demand * surge ** -price_elasticity
+    drivers_online = (drivers[:, None] * driver_hours_per_month / WEEKS_PER_MONTH * online_share)[:, :, None] \
+        * zones_supply
+
+    market = pickup_wait_model(requests, drivers_online, trip_minutes, patience_minutes=patience_minutes)
+    fulfilled = requests * (1 - market['unfulfilled_share'])
+
+    # Surge следует за перегрузкой ячейки, но не выше лимита регулятора
+    load = (requests * trip_minutes / 60) / np.maximum(drivers_online, 1e-9)
+    surge_target = np.clip((load / target_utilization) ** surge_response, 1.0, surge_cap[:, None, None])
+
+    weekly_gmv = (fulfilled * aov * surge).sum(axis=(1, 2))
+    monthly_gmv = weekly_gmv * WEEKS_PER_MONTH
+    earnings = monthly_gmv * (1 - take_rate / 100) / np.maximum(drivers, 1e-9) - licensing_cost / 12
+
+    return {
+        'requests': requests,
+        'fulfilled': fulfilled,
+        'wait_minutes': market['wait_minutes'],
+        'surge_target': surge_target,
+        'monthly_gmv': monthly_gmv,
+        'earnings': earnings
+    }
+
+def regulation_equilibrium_kernel(licensing_cost=15000, digital_tax=5, surge_limitation=2.0,
+                                  base_drivers=50000, base_monthly_revenue=500_000_000, base_avg_surge=2.5,
+                                  aov=350, take_rate=25, supply_elasticity=1.2, price_elasticity=0.6,
+                                  trip_minutes=25, patience_minutes=10, driver_hours_per_month=60,
+                                  target_utilization=0.7, surge_response=3.0, n_zones=5, damping=0.5,
+                                  tol=1e-4, max_iter=200) -> Dict[str, np.ndarray]:
+    """Равновесие: заработок водителей → предложение → ожидание и спрос → заработок
+
+    Заработок водителя за вычетом лицензии задает предложение D = D0 * (E / E0)^elasticity,
+    предложение через Erlang-C (по 168 часам недели и зонам) задает ожидание и исполненный
+    спрос, спрос с surge (не выше surge_limitation) задает заработок. Все ячейки сетки
+    параметров итерируются одним батчем с демпфированием до сходимости.
+    """
+    licensing_cost, digital_tax, surge_limitation = np.broadcast_arrays(
+        np.asarray(licensing_cost, dtype=float), np.asarray(digital_tax, dtype=float),
+        np.asarray(surge_limitation, dtype=float)
+    )
+    shape = licensing_cost.shape
+
+    # Калибровка базы: без лицензий, surge ограничен текущим пиковым уровнем
+    demand_profile = hour_of_week_profile()
+    online_share = hour_of_week_profile(peak_height=1.6, night_level=0.35)
+    base_rides = base_monthly_revenue / (take_rate / 100 * aov)
+    requests_base = base_rides / WEEKS_PER_MONTH * demand_profile
+    params = dict(online_share=online_share, zones_demand=zone_shares(n_zones, 0.35),
+                  zones_supply=zone_shares(n_zones, 0.2), aov=aov, take_rate=take_rate,
+                  price_elasticity=price_elasticity, trip_minutes=trip_minutes, patience_minutes=patience_minutes,
+                  driver_hours_per_month=driver_hours_per_month, target_utilization=target_utilization,
+                  surge_response=surge_response)
+
+    def solve(licensing, cap, initial_surge, fixed_supply=False, base_earnings=None):
+        n = len(licensing)
+        drivers = np.full(n, float(base_drivers))
+        # Старт из базового состояния: без изменений регулирования рынок остается на месте
+        surge = np.minimum(np.broadcast_to(initial_surge, (n, len(demand_profile), n_zones)),
+                           cap[:, None, None])
+        hourly_requests = np.broadcast_to(requests_base, (n, len(demand_profile)))
+        converged = np.zeros(n, dtype=bool)
+
+        for iteration in range(1, max_iter + 1):
+            market = _regulation_market(drivers, surge, licensing, cap, hourly_requests, **params)
+            if fixed_supply:
+                new_drivers = drivers
+            else:
+                supply_ratio = np.maximum(market['earnings'], 0) / base_earnings
+                new_drivers = base_drivers * supply_ratio ** supply_elasticity
+            new_drivers = np.maximum(new_drivers, 1.0)
+
+            driver_change = np.abs(new_drivers - drivers) / np.maximum(drivers, 1.0)
+            surge_change = np.abs(market['surge_target'] - surge).max(axis=(1, 2))
+            converged = (driver_change < tol) & (surge_change < tol)
+
+            drivers = drivers + damping * (new_drivers - drivers)
+            surge = surge + damping * (market['surge_target'] - surge)
+            if converged.all():
+                break
+
+        market = _regulation_market(drivers, surge, licensing, cap, hourly_requests, **params)
+        return drivers, surge, market, converged, iteration
+
+    _, base_surge, base_market, _, _ = solve(np.zeros(1), np.array([base_avg_surge]), 1.0,
+                                          fixed_supply=True)
+    base_earnings = base_market['earnings'][0]
+    base_platform_revenue = base_market['monthly_gmv'][0] * take_rate / 100
+
+    drivers, surge, market, converged, iterations = solve(licensing_cost.ravel(), surge_limitation.ravel(),
+                                                          base_surge, base_earnings=base_earnings)
+
+    requests = market['requests']
+    fulfilled = market['fulfilled']
+    total_fulfilled = np.maximum(fulfilled.sum(axis=(1, 2)), 1e-9)
+    platform_revenue = market['monthly_gmv'] * take_rate / 100
+    net_platform_revenue = platform_revenue * (1 - digital_tax.ravel() / 100)
+
+    result = {
+        'drivers': drivers,
+        'driver_change_pct': (drivers / base_drivers - 1) * 100,
+        'driver_earnings': market['earnings'],
+        'avg_wait_minutes': (fulfilled * market['wait_minutes']).sum(axis=(1, 2)) / total_fulfilled,
+        'lost_demand_share': 1 - total_fulfilled / requests.sum(axis=(1, 2)),
+        'avg_surge': (fulfilled * surge).sum(axis=(1, 2)) / total_fulfilled,
+        'monthly_rides': total_fulfilled * WEEKS_PER_MONTH,
+        'platform_revenue': net_platform_revenue,
+        'revenue_impact_pct': (net_platform_revenue / base_platform_revenue - 1) * 100,
+        'converged': converged,
+        'iterations': np.full(converged.shape, iterations)
+    }
+    return {key: value.reshape(shape) for key, value in result.items()}
+
+def pandemic_kernel(demand_change=-80, safety_premium=80, safety_measures_cost=8, delivery_expansion=25,
+                    pricing_adjustment=0, base_monthly_volume=2_000_000, base_aov=350,
+                    base_take_rate=25) -> Dict[str, np.ndarray]:
+    """Объем поездок, выручка такси и доставки в фазе пандемии"""
+    demand_change = np.asarray(demand_change, dtype=float)
+    safety_premium = np.asarray(safety_premium, dtype=float)
+    safety_measures_cost = np.asarray(safety_measures_cost, dtype=float)
+    delivery_expansion = np.asarray(delivery_expansion, dtype=float)
+    pricing_adjustment = np.asarray(pricing_adjustment, dtype=float)
+
+    new_volume = base_monthly_volume * (1 + demand_change / 100)
+
+    # Safety premium effect - люди предпочитают такси общественному транспорту
+    safety_boost = base_monthly_volume * 0.1 * (safety_premium / 100)  # 10% базы могут переключиться
+    final_volume = new_volume + safety_boost
+
+    new_aov = base_aov * (1 + pricing_adjustment / 100)
+
+    # Диверсификация в доставку
+    delivery_revenue = base_monthly_volume * base_aov * (base_take_rate / 100) * (delivery_expansion / 100)
+
+    ride_revenue = final_volume * new_aov * (base_take_rate / 100)
+    safety_costs = ride_revenue * (safety_measures_cost / 100)
+
+    total_revenue = ride_revenue + delivery_revenue
+    net_revenue = total_revenue - safety_costs
+
+    base_total_revenue = base_monthly_volume * base_aov * (base_take_rate / 100)
+
+    final_volume, safety_boost, new_aov, delivery_revenue, ride_revenue, safety_costs, total_revenue, net_revenue = \
+        np.broadcast_arrays(final_volume, safety_boost, new_aov, delivery_revenue, ride_revenue,
+                            safety_costs, total_revenue, net_revenue)
+
+    return {
+        'final_volume': final_volume,
+        'safety_boost': safety_boost,
+        'new_aov': new_aov,
+        'ride_revenue': ride_revenue,
+        'delivery_revenue': delivery_revenue,
+        'safety_costs': safety_costs,
+        'total_revenue': total_revenue,
+        'net_revenue': net_revenue,
+        'base_total_revenue': np.full(final_volume.shape, base_total_revenue),
+        'volume_change': (final_volume - base_monthly_volume) / base_monthly_volume * 100,
+        'revenue_change': (total_revenue - base_total_revenue) / base_total_revenue * 100,
+        'net_revenue_change': (net_revenue - base_total_revenue) / base_total_revenue * 100
+    }
+
+def pandemic_trajectory_kernel(n_paths=20000, n_months=24, mean_durations=(2, 3, 4), relapse_probability=0.15,
+                               duration_uncertainty=0.3, safety_measures_cost=8, delivery_expansion=25,
+                               pricing_adjustment=0, seed=42, **base_metrics) -> Dict[str, np.ndarray]:
+    """Монте-Карло траекторий Lockdown → Partial → Recovery → New normal по месяцам
+
+    Длительность фазы геометрическая: каждый месяц фаза заканчивается с вероятностью
+    1 / средняя длительность (своей для каждой траектории, бета-разброс duration_uncertainty).
+    При выходе из Partial/Recovery с вероятностью relapse_probability возможен откат в Lockdown.
+    New normal поглощающая. Выручка каждого месяца считается pandemic_kernel по фазе.
+    """
+    rng = np.random.default_rng(seed)
+    mean_durations = np.asarray(mean_durations, dtype=float)
+
+    # Вероятности выхода из фаз для каждой траектории
+    exit_mean = np.clip(1 / mean_durations, 1e-3, 1 - 1e-3)
+    concentration = max(1 / duration_uncertainty ** 2 - 1, 2.0)
+    exit_probability = rng.beta(exit_mean * concentration, (1 - exit_mean) * concentration,
+                                size=(n_paths, len(mean_durations)))
+
+    phases = np.empty((n_paths, n_months), dtype=np.int8)
+    phase = np.zeros(n_paths, dtype=np.int8)
+    paths = np.arange(n_paths)
+    last_phase = len(PANDEMIC_PHASES) - 1
+
+    for month in range(n_months):
+        phases[:, month] = phase
+        active = phase < last_phase
+        exits = active & (rng.random(n_paths) < exit_probability[paths, np.minimum(phase, last_phase - 1)])
+        relapse = exits & (phase > 0) & (rng.random(n_paths) < relapse_probability)
+        phase = np.where(relapse, 0, np.where(exits, phase + 1, phase)).astype(np.int8)
+
+    monthly = pandemic_kernel(PANDEMIC_PHASE_DEMAND_CHANGE[phases], PANDEMIC_PHASE_SAFETY_PREMIUM[phases],
+                              safety_measures_cost, delivery_expansion, pricing_adjustment, **base_metrics)
+
+    # Потери относительно докризисной выручки (отрицательные - рост)
+    revenue_loss = monthly['base_total_revenue'] - monthly['net_revenue']
+    cumulative_loss = np.cumsum(revenue_loss, axis=1)
+
+    recovered = phases == last_phase
+    recovery_month = np.where(recovered.any(axis=1), recovered.argmax(axis=1) + 1.0, np.nan)
+
+    return {
+        'phases': phases,
+        'final_volume': monthly['final_volume'],
+        'delivery_revenue': monthly['delivery_revenue'],
+        'safety_costs': monthly['safety_costs'],
+        'net_revenue': monthly['net_revenue'],
+        'cumulative_loss': cumulative_loss,
+        'total_loss': cumulative_loss[:, -1],
+        'recovery_month': recovery_month
+    }
+
+def public_transport_kernel(metro_expansion=8, bus_improvement=25, public_transport_price=45, coverage_impact=55,
+                            current_aov=350, current_frequency=4.2,
+                            current_users=150000) -> Dict[str, np.ndarray]:
+    """Потеря спроса ride-hailing от развития общественного транспорта"""
+    metro_expansion = np.asarray(metro_expansion, dtype=float)
+    bus_improvement = np.asarray(bus_improvement, dtype=float)
+    public_transport_price = np.asarray(public_transport_price, dtype=float)
+    coverage_impact = np.asarray(coverage_impact, dtype=float)
+
+    price_ratio = current_aov / public_transport_price
+
+    # Эластичность спроса: чем больше разница в цене, тем больше переключаются
+    demand_elasticity_effect = np.minimum(0.4, (price_ratio - 3) * 0.1)  # Максимум 40% могут переключиться
+    coverage_effect = (coverage_impact / 100) * 0.3  # До 30% дополнительного влияния
+    total_demand_loss = (demand_elasticity_effect + coverage_effect) * 100
+
+    # Качественные улучшения общ.транспорта
+    quality_multiplier = 1 + (bus_improvement / 100) * 0.5
+    metro_effect = metro_expansion * 0.02  # Каждая станция = 2% дополнительного влияния
+
+    final_demand_loss = np.minimum(60, total_demand_loss * quality_multiplier + metro_effect * 100)
+
+    new_users = current_users * (1 - final_demand_loss / 100)
+    new_frequency = current_frequency * 0.95  # Небольшое снижение частоты
+
+    revenue_impact = (new_users * new_frequency - current_users * current_frequency) / (current_users * current_frequency) * 100
+
+    return {
+        'price_ratio': np.broadcast_to(price_ratio, final_demand_loss.shape),
+        'final_demand_loss': final_demand_loss,
+        # Больше всего страдают короткие поездки в центре, премиум менее чувствителен
+        'short_trips_loss': final_demand_loss * 1.5,
+        'long_trips_loss': final_demand_loss * 0.6,
+        'premium_trips_loss': final_demand_loss * 0.3,
+        'new_users': new_users,
+        'new_frequency': np.full(final_demand_loss.shape, new_frequency),
+        'revenue_impact': revenue_impact
+    }
+
+def launch_strategy_codes(strategy) -> np.ndarray:
+    """Индексы стратегий запуска: принимает названия, префиксы (Aggressive...) или коды 0-2"""
+    strategy = np.asarray(strategy)
+    if np.issubdtype(strategy.dtype, np.number):
+        return strategy.astype(int)
+
+    prefixes = np.array([name.split()[0] for name in LAUNCH_STRATEGIES])
+    first_words = np.char.partition(strategy.astype(str), ' ')[..., 0]
+    codes = np.full(strategy.shape, -1)
+    for code, prefix in enumerate(prefixes):
+        codes[first_words == prefix] = code
+    if (codes < 0).any():
+        raise ValueError(f"Неизвестная стратегия запуска, ожидается одна из: {', '.join(LAUNCH_STRATEGIES)}")
+    return codes
+
+def new_city_launch_kernel(city_population=1_200_000, avg_income=55000, public_transport_quality=5,
+                           existing_competitors=2, strategy=0, target_market_share=20,
+                           initial_promo_budget=8_000_000, horizon=None, fixed_cost=0.0,
+                           promo_cac_reduction=0.0, promo_saturation=0.25,
+                           share_cac_growth=0.0) -> Dict[str, np.ndarray]:
+    """Потенциал рынка, прогноз unit economics и итоги финансовой модели запуска
+
+    horizon, fixed_cost, promo_cac_reduction и share_cac_growth - допущения оптимизатора плана
+    запуска, по умолчанию выключены: итоги считаются до выхода на цель, CAC задан стратегией.
+    """
+    city_population = np.asarray(city_population, dtype=float)
+    avg_income = np.asarray(avg_income, dtype=float)
+    public_transport_quality = np.asarray(public_transport_quality, dtype=float)
+    existing_competitors = np.asarray(existing_competitors, dtype=float)
+    codes = launch_strategy_codes(strategy)
+    target_market_share = np.asarray(target_market_share, dtype=float)
+
+    # Предполагаем, что 10-25% населения потенциально может использовать ride-hailing
+    market_penetration_potential = np.clip(0.15 + (avg_income - 30000) / 120000 * 0.1, 0.10, 0.25)
+
+    # Плохой транспорт = больше потенциал, конкуренция снижает потенциал
+    transport_multiplier = 1.5 - (public_transport_quality / 10) * 0.5
+    competition_factor = 1 / (1 + existing_competitors * 0.2)
+
+    total_addressable_market = city_population * market_penetration_potential * transport_multiplier * competition_factor
+
+    estimated_frequency = np.clip(2.5 + (avg_income - 30000) / 60000, 1.5, 5.0)
+    estimated_aov = np.clip(200 + (avg_income - 30000) / 1000, 150, 500)
+
+    target_users = total_addressable_market * (target_market_share / 100)
+
+    # CAC зависит от стратегии и конкуренции
+    base_cac = 800 + existing_competitors * 300
+    estimated_cac = base_cac * LAUNCH_CAC_MULTIPLIERS[codes]
+
+    # Допущения оптимизатора: последние пользователи большой доли дороже,
+    # промо на первые поездки заменяет часть платного привлечения с убывающей отдачей
+    estimated_cac = estimated_cac / (1 - share_cac_growth * np.minimum(target_market_share, 90) / 100)
+    promo_per_user = np.asarray(initial_promo_budget, dtype=float) / np.maximum(target_users, 1)
+    promo_effect = 1 - np.exp(-promo_per_user / (promo_saturation * estimated_cac))
+    estimated_cac = estimated_cac * (1 - promo_cac_reduction * promo_effect)
+
+    total_addressable_market, target_users, estimated_frequency, estimated_aov, estimated_cac, codes = \
+        np.broadcast_arrays(total_addressable_market, target_users, estimated_frequency, estimated_aov,
+                            estimated_cac, codes)
+
+    months_to_target = LAUNCH_MONTHS_TO_TARGET[codes]
+    plan = launch_plan_kernel(target_users, estimated_aov, estimated_frequency, estimated_cac,
+                              initial_promo_budget, months_to_target, codes, horizon, fixed_cost=fixed_cost)
+
+    return {
+        'total_addressable_market': total_addressable_market,
+        'target_users': target_users,
+        'estimated_frequency': estimated_frequency,
+        'estimated_aov': estimated_aov,
+        'estimated_cac': estimated_cac,
+        'months_to_target': months_to_target,
+        **plan
+    }
+
+def launch_monthly_kernel(target_users, aov, frequency, cac, promo_budget, months_to_target, strategy=0,
+                          horizon=None, active_share=0.85, take_rate=25,
+                          ops_cost_per_user=15, fixed_cost=0.0) -> Dict[str, np.ndarray]:
+    """Помесячная финансовая модель запуска: массивы формы (..., месяц)"""
+    codes = launch_strategy_codes(strategy)
+    if horizon is None:
+        horizon = months_to_target
+    target_users, aov, frequency, cac, promo_budget, months_to_target, codes, horizon = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (target_users, aov, frequency, cac, promo_budget,
+                                                       months_to_target)),
+        codes, np.asarray(horizon, dtype=int)
+    )
+
+    months = np.arange(1, int(horizon.max(initial=1)) + 1, dtype=float)
+    target_period = months_to_target[..., None]
+    progress = np.minimum(months / target_period, 1.0)
+    code = codes[..., None]
+
+    # Кривая роста: Aggressive - быстрый старт, Moderate - линейно, Conservative - медленный старт
+    curve = np.where(code == 0, 1 - np.exp(-3 * progress), np.where(code == 1, progress, progress ** 1.5))
+    valid = months <= horizon[..., None]
+
+    users = target_users[..., None] * curve * valid
+    new_users = np.diff(users, axis=-1, prepend=0.0) * valid
+    cac_spend = new_users * cac[..., None]
+
+    # Промо расходы больше в начале: вес от 2 до 1 в течение выхода на цель
+    promo_weight = (2 - months / target_period) * (months <= target_period)
+    promo_spend = promo_budget[..., None] / target_period * promo_weight * valid
+
+    # Разовые расходы на открытие в первом месяце
+    fixed_spend = np.where(months == 1, fixed_cost, 0.0) * valid
+
+    revenue = users * active_share * aov[..., None] * frequency[..., None] * take_rate / 100
+    profit = revenue - (cac_spend + promo_spend + fixed_spend + users * ops_cost_per_user)
+
+    return {
+        'months': np.broadcast_to(months, users.shape),
+        'valid': valid,
+        'users': users,
+        'new_users': new_users,
+        'revenue': revenue,
+        'cac_spend': cac_spend,
+        'promo_spend': promo_spend,
+        'fixed_spend': fixed_spend,
+        'profit': profit,
+        'cumulative_revenue': np.cumsum(revenue, axis=-1),
+        'cumulative_spend': np.cumsum(cac_spend + promo_spend + fixed_spend, axis=-1),
+        'cumulative_profit': np.cumsum(profit, axis=-1)
+    }
+
+def launch_plan_kernel(target_users, aov, frequency, cac, promo_budget, months_to_target, strategy=0,
+                       horizon=None, **assumptions) -> Dict[str, np.ndarray]:
+    """Итоги планов запуска: месяц breakeven (0 - не достигнут), инвестиции и ROI на горизонте"""
+    monthly = launch_monthly_kernel(target_users, aov, frequency, cac, promo_budget, months_to_target,
+                                    strategy, horizon, **assumptions)
+
+    valid = monthly['valid']
+    positive = (monthly['cumulative_profit'] > 0) & valid
+    breakeven_month = np.where(positive.any(axis=-1), positive.argmax(axis=-1) + 1, 0)
+
+    # Значения в последнем месяце горизонта каждого плана
+    last = np.maximum(valid.sum(axis=-1, keepdims=True) - 1, 0)
+    total_investment = np.take_along_axis(monthly['cumulative_spend'], last, axis=-1)[..., 0]
+    final_revenue = np.take_along_axis(monthly['cumulative_revenue'], last, axis=-1)[..., 0]
+    final_profit = np.take_along_axis(monthly['cumulative_profit'], last, axis=-1)[..., 0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        final_roi = np.where(total_investment > 0, (final_revenue - total_investment) / total_investment * 100, 0.0)
+
+    return {
+        'breakeven_month': breakeven_month,
+        'total_investment': total_investment,
+        'final_revenue': final_revenue,
+        'final_profit': final_profit,
+        'final_roi': final_roi,
+        # Максимальная накопленная просадка = требуемый объем финансирования
+        'max_cash_exposure': np.maximum(-np.min(monthly['cumulative_profit'], axis=-1), 0.0)
+    }
+
+def optimize_launch_plan(city_population=1_200_000, avg_income=55000, public_transport_quality=5,
+                         existing_competitors=2, objective: str = 'roi', max_cash_exposure: float = np.inf,
+                         budget_bounds: Tuple[float, float] = (1_000_000, 50_000_000),
+                         share_bounds: Tuple[float, float] = (5, 40), horizon: Optional[int] = None,
+                         fixed_cost: float = 0.0, promo_cac_reduction: float = 0.0, share_cac_growth: float = 0.0,
+                         seed: int = 42) -> pd.DataFrame:
+    """Оптимальный промо-бюджет и целевая доля для каждой стратегии запуска
+
+    objective='roi' максимизирует ROI на горизонте, 'breakeven' минимизирует месяц breakeven.
+    Планы с просадкой выше max_cash_exposure штрафуются. Стратегия перебирается,
+    непрерывные параметры ищутся differential evolution с векторной целевой функцией.
+
+    Допущения по умолчанию выключены и совпадают с моделью страницы запуска: горизонт до выхода
+    на цель, без разовых расходов, CAC не зависит от промо и доли. В такой модели ROI монотонен
+    по бюджету и доле, и оптимум лежит на границах; внутренний оптимум дают horizon (месяцев
+    с начала запуска), fixed_cost (разовые расходы в первом месяце), promo_cac_reduction
+    (максимальная доля CAC, которую заменяет промо) и share_cac_growth (CAC растет как
+    1 / (1 - share_cac_growth * доля)).
+    """
+    rows = []
+    for code, strategy in enumerate(LAUNCH_STRATEGIES):
+
+        def evaluate(x):
+            # x: (2, популяция) - бюджет и доля для всей популяции сразу
+            return new_city_launch_kernel(city_population, avg_income, public_transport_quality,
+                                          existing_competitors, code, x[1], x[0], horizon, fixed_cost,
+                                          promo_cac_reduction, share_cac_growth=share_cac_growth)
+
+        def loss(x):
+            plan = evaluate(x)
+            if objective == 'breakeven':
+                # Недостигнутый breakeven хуже любого месяца; при равенстве лучше выше ROI
+                months = np.where(plan['breakeven_month'] > 0, plan['breakeven_month'],
+                                  (horizon or LAUNCH_MONTHS_TO_TARGET[code]) + 1)
+                value = months - plan['final_roi'] * 1e-4
+            else:
+                value = -plan['final_roi']
+            overdraft = np.maximum(plan['max_cash_exposure'] - max_cash_exposure, 0)
+            return value + 1e3 * (overdraft > 0) + overdraft / 1e6
+
+        result = differential_evolution(loss, [budget_bounds, share_bounds], vectorized=True, updating='deferred',
+                                        popsize=30, maxiter=200, tol=1e-8, seed=seed, polish=False, init='sobol')
+        best = {key: np.asarray(value).item() for key, value in evaluate(result.x[:, None]).items()}
+        rows.append({
+            'strategy': strategy,
+            'initial_promo_budget': result.x[0],
+            'target_market_share': result.x[1],
+            'feasible': best['max_cash_exposure'] <= max_cash_exposure,
+            **best
+        })
+
+    plans = pd.DataFrame(rows)
+    if objective == 'breakeven':
+        months = plans['breakeven_month'].where(plans['breakeven_month'] > 0, np.inf)
+        order = np.lexsort((-plans['final_roi'], months, ~plans['feasible']))
+    else:
+        order = np.lexsort((-plans['final_roi'], ~plans['feasible']))
+    return plans.iloc[order].reset_index(drop=True)
+
+# Реестр ядер под теми же названиями, по которым ride_hailing_scenarios выбирает сценарий
+SCENARIO_KERNELS: Dict[str, Callable[..., Dict[str, np.ndarray]]] = {
+    "🆚 Конкурентная война (агрессивные промокоды)": competitive_war_kernel,
+    "📉 Экономический кризис (снижение спроса)": economic_crisis_kernel,
+    "🚫 Усиление регулирования": regulation_kernel,
+    "🦠 Пандемия/форс-мажор": pandemic_kernel,
+    "🚇 Развитие общественного транспорта": public_transport_kernel,
+    "🚗 Запуск в новом городе": new_city_launch_kernel
+}
+
+# Короткие имена для CLI и кода
+SCENARIO_ALIASES = {
+    'competitive_war': "🆚 Конкурентная война (агрессивные промокоды)",
+    'economic_crisis': "📉 Экономический кризис (снижение спроса)",
+    'regulation': "🚫 Усиление регулирования",
+    'pandemic': "🦠 Пандемия/форс-мажор",
+    'public_transport': "🚇 Развитие общественного транспорта",
+    'new_city_launch': "🚗 Запуск в новом городе"
+}
+
+
+def get_scenario_kernel(name: str) -> Callable[..., Dict[str, np.ndarray]]:
+    """Ядро сценария по названию из UI или короткому имени"""
+    name = SCENARIO_ALIASES.get(name, name)
+    if name not in SCENARIO_KERNELS:
+        raise KeyError(f"Неизвестный сценарий '{name}', доступны: {', '.join(SCENARIO_ALIASES)}")
+    return SCENARIO_KERNELS[name]
+
+def scenario_parameters(name: str) -> Dict[str, object]:
+    """Параметры ядра сценария и их значения по умолчанию"""
+    signature = inspect.signature(get_scenario_kernel(name))
+    return {param.name: param.default for param in signature.parameters.values()}
+
+def run_scenario_batch(name: str, params: pd.DataFrame) -> pd.DataFrame:
+    """Прогон сценария по таблице параметров: одна строка = один набор входов"""
+    kernel = get_scenario_kernel(name)
+    known = scenario_parameters(name)
+
+    unknown = [column for column in params.columns if column not in known]
+    if unknown:
+        raise ValueError(f"Параметры не поддерживаются сценарием: {', '.join(unknown)}")
+
+    outputs = kernel(**{column: params[column].to_numpy() for column in params.columns})
+    results = pd.DataFrame({key: np.broadcast_to(value, (len(params),)) for key, value in outputs.items()},
+                           index=params.index)
+    return pd.concat([params, results], axis=1)
+
+
+def main(argv=None):
+    """CLI: пакетный прогон сценария по CSV с параметрами"""
+    parser = argparse.ArgumentParser(description="Пакетный прогон сценариев ride-hailing")
+    parser.add_argument('scenario', help=f"Сценарий: {', '.join(SCENARIO_ALIASES)}")
+    parser.add_argument('params', nargs='?', help="CSV с колонками-параметрами ядра")
+    parser.add_argument('-o', '--output', help="Куда сохранить результаты (CSV), по умолчанию stdout")
+    args = parser.parse_args(argv)
+
+    if args.params is None:
+        for param, default in scenario_parameters(args.scenario).items():
+            print(f"{param}={default}")
+        return
+
+    results = run_scenario_batch(args.scenario, pd.read_csv(args.params))
+    if args.output:
+        results.to_csv(args.output, index=False)
+    else:
+        print(results.to_csv(index=False))
+
+
+if __name__ == "__main__":
+    main()
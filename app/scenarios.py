@@ -9,6 +9,37 @@ from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import random
 from typing import Dict, List, Tuple, Optional
+from app.geo import (
+    TRIP_SEGMENT_NAMES, generate_trips, load_trip_points, metro_network, station_catchment_impact
+)
+from app.result_store import open_result_store, record_run, find_runs, diff_runs
+from app.scenario_kernels import (
+    SCENARIO_KERNELS, SCENARIO_ALIASES, COMPETITIVE_WAR_STRATEGIES, COMPETITIVE_WAR_KEYS,
+    LAUNCH_STRATEGIES, PANDEMIC_PHASES,
+    competitive_war_kernel, economic_crisis_kernel, new_city_launch_kernel, launch_monthly_kernel,
+    launch_plan_kernel, crisis_response_surface, regulation_equilibrium_kernel, pandemic_trajectory_kernel,
+    get_scenario_kernel, run_scenario_batch, optimize_launch_plan, simulate_promo_war_markets
+)
+
+def _scalars(result: Dict[str, np.ndarray]) -> Dict[str, float]:
+    """Результат ядра для одного набора параметров в виде скаляров"""
+    return {key: np.asarray(value).item() for key, value in result.items()}
+
+@st.cache_resource
+def get_result_store():
+    """Общее соединение с журналом прогонов сценариев"""
+    return open_result_store()
+
+def _run_scenario(scenario: str, **params) -> Dict[str, float]:
+    """Прогон ядра сценария с записью входов и выходов в журнал и в сессию"""
+    result = _scalars(get_scenario_kernel(scenario)(**params))
+    run_id = record_run(get_result_store(), scenario, params, result)
+    
+    session_runs = st.session_state.setdefault('scenario_results', [])
+    if run_id not in session_runs:
+        session_runs.append(run_id)
+    return result
+
 def ride_hailing_scenarios():
     """Сценарное планирование для ride-hailing"""
     st.header("🎪 Сценарное планирование для Ride-Hailing")
@@ -20,14 +51,7 @@ def ride_hailing_scenarios():
     
     scenario_type = st.selectbox(
         "Выберите сценарий:",
-        [
-            "🆚 Конкурентная война (агрессивные промокоды)",
-            "📉 Экономический кризис (снижение спроса)",
-            "🚫 Усиление регулирования",
-            "🦠 Пандемия/форс-мажор",
-            "🚇 Развитие общественного транспорта",
-            "🚗 Запуск в новом городе"
-        ]
+        list(SCENARIO_KERNELS.keys())
     )
     
     if scenario_type == "🆚 Конкурентная война (агрессивные промокоды)":
@@ -42,6 +66,44 @@ def ride_hailing_scenarios():
         public_transport_scenario()
     elif scenario_type == "🚗 Запуск в новом городе":
         new_city_launch_scenario()
+    
+    with st.expander("💾 Сохраненные прогоны сценариев"):
+        show_saved_runs()
+
+def show_saved_runs():
+    """Поиск прогонов в журнале и сравнение выбранных бок о бок"""
+    store = get_result_store()
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        scenario_filter = st.selectbox("Сценарий", ["Все"] + list(SCENARIO_ALIASES.keys()), key="saved_runs_scenario")
+    
+    with col2:
+        only_session = st.checkbox("Только прогоны этой сессии", key="saved_runs_session")
+    
+    runs = find_runs(store, None if scenario_filter == "Все" else scenario_filter)
+    if only_session:
+        runs = runs[runs.index.isin(st.session_state.get('scenario_results', []))]
+    
+    if runs.empty:
+        st.info("Прогонов пока нет - они записываются при каждом расчете сценария")
+        return
+    
+    st.caption(f"Найдено прогонов: {len(runs)}")
+    
+    labels = {run_id: f"#{run_id} {row.scenario} ({row.created_at})" for run_id, row in runs.iterrows()}
+    selected = st.multiselect("Прогоны для сравнения", list(labels), default=list(labels)[:2],
+                              format_func=labels.get, key="saved_runs_selected")
+    only_changed = st.checkbox("Только различающиеся поля", value=True, key="saved_runs_changed")
+    
+    if selected:
+        diff = diff_runs(store, selected, only_changed=only_changed)
+        if diff.empty:
+            st.success("Выбранные прогоны совпадают по всем полям")
+        else:
+            diff.columns = [f"#{run_id}" for run_id in diff.columns]
+            st.dataframe(diff, use_container_width=True)
 
 def competitive_war_scenario():
     """Сценарий конкурентной войны"""
@@ -76,23 +138,25 @@ def competitive_war_scenario():
         st.metric("Базовый CAC", f"{base_cac:,} руб")
     
     # Расчет сценариев
+    war = _run_scenario('competitive_war', market_share_loss=market_share_loss, promo_intensity=promo_intensity,
+                        cac_inflation=cac_inflation, base_aov=base_aov, base_frequency=base_frequency,
+                        base_take_rate=base_take_rate, base_cac=base_cac, base_users=base_users)
     
     # Сценарий 1: Не реагируем на конкуренцию
-    scenario_1_users = base_users * (1 - market_share_loss / 100)
-    scenario_1_revenue = scenario_1_users * base_aov * (base_take_rate / 100) * base_frequency
-    scenario_1_cac = base_cac  # CAC не меняется, но пользователей меньше
+    scenario_1_users = war['users_ignore']
+    scenario_1_revenue = war['revenue_ignore']
+    scenario_1_cac = war['cac_ignore']  # CAC не меняется, но пользователей меньше
     
     # Сценарий 2: Агрессивная промореакция
-    scenario_2_users = base_users * 0.95  # Небольшая потеря все равно есть
-    effective_take_rate = base_take_rate - promo_intensity  # Промокоды едят маржу
-    scenario_2_revenue = scenario_2_users * base_aov * (effective_take_rate / 100) * base_frequency
-    scenario_2_cac = base_cac * (1 + cac_inflation / 100)
+    scenario_2_users = war['users_promo']
+    effective_take_rate = war['effective_take_rate']  # Промокоды едят маржу
+    scenario_2_revenue = war['revenue_promo']
+    scenario_2_cac = war['cac_promo']
     
     # Сценарий 3: Фокус на retention без промокодов
-    scenario_3_users = base_users * (1 - market_share_loss / 100 * 0.6)  # Меньшие потери
-    scenario_3_frequency = base_frequency * 1.2  # Повышение лояльности существующих
-    scenario_3_revenue = scenario_3_users * base_aov * (base_take_rate / 100) * scenario_3_frequency
-    scenario_3_cac = base_cac * 1.1  # Небольшой рост CAC
+    scenario_3_users = war['users_retention']
+    scenario_3_revenue = war['revenue_retention']
+    scenario_3_cac = war['cac_retention']
     
     # Результаты сравнения
     st.subheader("📈 Сравнение сценариев")
@@ -102,7 +166,7 @@ def competitive_war_scenario():
             'Сценарий': 'Не реагируем',
             'Пользователи': f"{scenario_1_users:,.0f}",
             'Месячная выручка': f"{scenario_1_revenue:,.0f} руб",
-            'Эффективный CAC': f"{scenario_1_cac:,} руб",
+            'Эффективный CAC': f"{scenario_1_cac:,.0f} руб",
             'Take Rate': f"{base_take_rate}%",
             'Риски': 'Потеря доли рынка'
         },
@@ -110,7 +174,7 @@ def competitive_war_scenario():
             'Сценарий': 'Промовойна',
             'Пользователи': f"{scenario_2_users:,.0f}",
             'Месячная выручка': f"{scenario_2_revenue:,.0f} руб",
-            'Эффективный CAC': f"{scenario_2_cac:,} руб",
+            'Эффективный CAC': f"{scenario_2_cac:,.0f} руб",
             'Take Rate': f"{effective_take_rate:.1f}%",
             'Риски': 'Низкая маржинальность'
         },
@@ -118,7 +182,7 @@ def competitive_war_scenario():
             'Сценарий': 'Фокус на retention',
             'Пользователи': f"{scenario_3_users:,.0f}",
             'Месячная выручка': f"{scenario_3_revenue:,.0f} руб",
-            'Эффективный CAC': f"{scenario_3_cac:,} руб",
+            'Эффективный CAC': f"{scenario_3_cac:,.0f} руб",
             'Take Rate': f"{base_take_rate}%",
             'Риски': 'Медленная реакция'
         }
@@ -136,6 +200,14 @@ def competitive_war_scenario():
     else:
         st.warning("⚠️ **Рекомендация**: Промовойна оправдана, но контролируйте unit economics.")
     
+    # Стохастический режим: параметры и коэффициенты реакции как распределения
+    if st.checkbox("🎲 Стохастический режим (Монте-Карло)"):
+        show_competitive_war_monte_carlo(market_share_loss, promo_intensity)
+    
+    # Конкурент как игрок, а не фиксированный шок
+    if st.checkbox("🤖 Агентная модель промовойны (несколько платформ)"):
+        show_promo_war_agents(base_aov, base_take_rate)
+    
     st.markdown("""
     ### 💡 Альтернативные стратегии конкуренции:
     
@@ -146,6 +218,189 @@ def competitive_war_scenario():
     5. **Supply-side**: переманивание лучших водителей
     """)
 
+@st.cache_data(show_spinner=False)
+def cached_promo_war_markets(n_markets: int, n_platforms: int, aggressor_promo: float, aggressor_weeks: int,
+                             budget_weeks: float, rider_value_weeks: float, base_aov: float,
+                             base_take_rate: float) -> Dict[str, np.ndarray]:
+    """Агентная промовойна по независимым рынкам в пуле процессов (кэш по входам)"""
+    return simulate_promo_war_markets(
+        n_markets, n_platforms=n_platforms, aggressor_promo=aggressor_promo, aggressor_weeks=aggressor_weeks,
+        budget_weeks=budget_weeks, rider_value_weeks=rider_value_weeks, base_aov=base_aov,
+        base_take_rate=base_take_rate
+    )
+
+def show_promo_war_agents(base_aov: float, base_take_rate: float):
+    """Равновесные доли, сожженный бюджет и время до перемирия в агентной промовойне"""
+    st.subheader("🤖 Агентная промовойна")
+    
+    st.markdown("""
+    Каждая платформа раз в неделю выбирает промо как лучший ответ на промо соперников, 
+    пассажиры переходят по цене и времени подачи, водители - по заработку. 
+    Платформа 1 - мы, платформа 2 - агрессор, открывающий войну.
+    """)
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        n_platforms = st.slider("Платформ на рынке", 2, 5, 3)
+        n_markets = st.select_slider("Независимых рынков", [500, 1000, 2000, 5000], value=1000)
+    
+    with col2:
+        aggressor_promo = st.slider("Промо агрессора (% от чека)", 0, 50, 30, 5)
+        aggressor_weeks = st.slider("Длительность кампании агрессора (недель)", 1, 26, 8)
+    
+    with col3:
+        budget_weeks = st.slider("Бюджет на войну (недель маржи)", 2, 26, 8)
+        rider_value_weeks = st.slider("Ценность пассажира (недель маржи)", 2, 52, 8)
+    
+    with st.spinner("Симуляция рынков..."):
+        war = cached_promo_war_markets(n_markets, n_platforms, aggressor_promo, aggressor_weeks,
+                                       budget_weeks, rider_value_weeks, base_aov, base_take_rate)
+    
+    platform_names = [f"Платформа {i + 1}" + (" (мы)" if i == 0 else " (агрессор)" if i == 1 else "")
+                      for i in range(n_platforms)]
+    final_share = war['rider_share']
+    leader = final_share.argmax(axis=1)
+    
+    results_df = pd.DataFrame({
+        'Платформа': platform_names,
+        'Доля пассажиров (средняя)': final_share.mean(axis=0) * 100,
+        'Доля P10': np.percentile(final_share, 10, axis=0) * 100,
+        'Доля P90': np.percentile(final_share, 90, axis=0) * 100,
+        'Доля водителей': war['driver_share'].mean(axis=0) * 100,
+        'Лидер рынка, % рынков': np.bincount(leader, minlength=n_platforms) / len(leader) * 100,
+        'Сожженный бюджет, млн руб': war['cumulative_burn'].mean(axis=0) / 1e6,
+        'Маржа за год, млн руб': war['cumulative_profit'].mean(axis=0) / 1e6
+    })
+    st.dataframe(results_df.style.format({column: '{:.1f}' for column in results_df.columns[1:]}),
+                 use_container_width=True)
+    
+    truce_week = war['truce_week']
+    truce_reached = ~np.isnan(truce_week)
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Медиана до перемирия",
+                  f"{np.median(truce_week[truce_reached]):.0f} нед." if truce_reached.any() else "—")
+    
+    with col2:
+        st.metric("Рынков без перемирия за год", f"{1 - truce_reached.mean():.1%}")
+    
+    with col3:
+        st.metric("Рынков с долей лидера > 50%", f"{(final_share.max(axis=1) > 0.5).mean():.1%}")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        weeks = np.arange(1, war['share_path'].shape[1] + 1)
+        fig = go.Figure()
+        for i, name in enumerate(platform_names):
+            fig.add_trace(go.Scatter(x=weeks, y=war['share_path'][:, :, i].mean(axis=0) * 100,
+                                     mode='lines', name=name))
+        fig.update_layout(title="Средняя доля пассажиров по неделям", xaxis_title="Неделя",
+                          yaxis_title="Доля, %", height=400)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        fig = go.Figure()
+        for i, name in enumerate(platform_names):
+            fig.add_trace(go.Scatter(x=weeks, y=war['promo_path'][:, :, i].mean(axis=0),
+                                     mode='lines', name=name))
+        fig.update_layout(title="Среднее промо по неделям (% от чека)", xaxis_title="Неделя",
+                          yaxis_title="Промо, %", height=400)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    if truce_reached.any():
+        fig = px.histogram(x=truce_week[truce_reached], nbins=26, title="Неделя перемирия по рынкам",
+                           labels={'x': 'Неделя'})
+        fig.update_layout(height=350, yaxis_title="Рынков")
+        st.plotly_chart(fig, use_container_width=True)
+
+def _beta_draws(rng: np.random.Generator, mean, spread: float, size: int) -> np.ndarray:
+    """Бета-распределение с заданным средним и относительным разбросом"""
+    mean = np.clip(mean, 1e-3, 1 - 1e-3)
+    concentration = max(1 / spread ** 2 - 1, 2.0)
+    return rng.beta(mean * concentration, (1 - mean) * concentration, size)
+
+def _lognormal_draws(rng: np.random.Generator, mean, spread: float, size: int) -> np.ndarray:
+    """Логнормальное распределение с заданным средним и коэффициентом вариации"""
+    sigma = np.sqrt(np.log1p(spread ** 2))
+    return mean * rng.lognormal(-sigma ** 2 / 2, sigma, size)
+
+@st.cache_data(show_spinner=False)
+def simulate_competitive_war(market_share_loss: float, promo_intensity: float,
+                             uncertainty: float = 0.3, n_draws: int = 1_000_000,
+                             chunk_size: int = 250_000, seed: int = 42) -> Dict:
+    """Монте-Карло трех стратегий: частота побед и квантили выручки (кэш по входам)"""
+    rng = np.random.default_rng(seed)
+    revenue = np.empty((3, n_draws), dtype=np.float32)
+    wins = np.zeros(3, dtype=np.int64)
+    
+    # Чанки ограничивают память на промежуточные массивы
+    for start in range(0, n_draws, chunk_size):
+        size = min(chunk_size, n_draws - start)
+        outcomes = competitive_war_kernel(
+            market_share_loss=100 * _beta_draws(rng, market_share_loss / 100, uncertainty, size),
+            promo_intensity=promo_intensity,
+            promo_retained_share=_beta_draws(rng, 0.95, uncertainty / 5, size),
+            retention_loss_factor=_beta_draws(rng, 0.6, uncertainty, size),
+            retention_frequency_lift=_lognormal_draws(rng, 1.2, uncertainty / 3, size)
+        )
+        chunk_revenue = np.stack([outcomes[f'revenue_{key}'] for key in COMPETITIVE_WAR_KEYS])
+        revenue[:, start:start + size] = chunk_revenue
+        wins += np.bincount(chunk_revenue.argmax(axis=0), minlength=3)
+    
+    quantile_levels = [0.05, 0.25, 0.5, 0.75, 0.95]
+    histograms = [np.histogram(strategy_revenue, bins=60) for strategy_revenue in revenue]
+    
+    return {
+        'win_share': wins / n_draws,
+        'quantile_levels': quantile_levels,
+        'quantiles': np.quantile(revenue, quantile_levels, axis=1).T,
+        'mean': revenue.mean(axis=1, dtype=np.float64),
+        'histograms': histograms
+    }
+
+def show_competitive_war_monte_carlo(market_share_loss: float, promo_intensity: float):
+    """Распределение исходов конкурентной войны"""
+    st.subheader("🎲 Распределение исходов (Монте-Карло)")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        uncertainty = st.slider("Неопределенность параметров (коэф. вариации)", 0.05, 0.6, 0.3, 0.05)
+    
+    with col2:
+        n_draws = st.select_slider("Количество симуляций", [10_000, 100_000, 1_000_000], value=1_000_000)
+    
+    result = simulate_competitive_war(market_share_loss, promo_intensity,
+                                      uncertainty=uncertainty, n_draws=n_draws)
+    
+    cols = st.columns(3)
+    for i, strategy in enumerate(COMPETITIVE_WAR_STRATEGIES):
+        with cols[i]:
+            st.metric(f"P(лучшая): {strategy}", f"{result['win_share'][i]:.1%}")
+    
+    quantiles_df = pd.DataFrame(
+        [[f"{v:,.0f} руб" for v in row] for row in result['quantiles']],
+        index=COMPETITIVE_WAR_STRATEGIES,
+        columns=[f"P{int(level * 100)}" for level in result['quantile_levels']]
+    )
+    quantiles_df['Среднее'] = [f"{v:,.0f} руб" for v in result['mean']]
+    
+    st.markdown("**Квантили месячной выручки**")
+    st.dataframe(quantiles_df, use_container_width=True)
+    
+    fig = go.Figure()
+    for strategy, (counts, edges) in zip(COMPETITIVE_WAR_STRATEGIES, result['histograms']):
+        fig.add_trace(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts / counts.sum(),
+                             name=strategy, opacity=0.6))
+    fig.update_layout(barmode='overlay', title="Распределение месячной выручки по стратегиям",
+                      xaxis_title="Выручка (руб)", yaxis_title="Доля симуляций", height=400)
+    
+    st.plotly_chart(fig, use_container_width=True)
+
 def economic_crisis_scenario():
     """Сценарий экономического кризиса"""
     st.subheader("📉 Экономический кризис и снижение спроса")
@@ -171,25 +426,20 @@ def economic_crisis_scenario():
     # Базовые метрики
     base_volume = 1000000  # поездок в месяц
     base_aov = 350
-    base_take_rate = 25
-    base_ops_cost = 50  # на пользователя в месяц
     
     # Расчет влияния кризиса
-    new_volume = base_volume * (1 - demand_drop / 100)
-    new_aov = base_aov * (1 - price_cut / 100)
-    
-    # Price elasticity effect
-    additional_volume_from_price_cut = base_volume * (price_cut / 100) * price_sensitivity
-    final_volume = min(new_volume + additional_volume_from_price_cut, base_volume * 0.9)
-    
-    new_ops_cost = base_ops_cost * (1 - cost_optimization / 100)
+    crisis = _run_scenario('economic_crisis', demand_drop=demand_drop, price_sensitivity=price_sensitivity,
+                           price_cut=price_cut, cost_optimization=cost_optimization,
+                           base_volume=base_volume, base_aov=base_aov)
+    final_volume = crisis['final_volume']
+    new_aov = crisis['new_aov']
     
     # Финансовые результаты
-    base_revenue = base_volume * base_aov * (base_take_rate / 100)
-    new_revenue = final_volume * new_aov * (base_take_rate / 100)
+    base_revenue = crisis['base_revenue']
+    new_revenue = crisis['new_revenue']
     
-    base_profit = base_revenue - (base_volume / 4.5) * base_ops_cost  # Assuming 4.5 rides per user per month
-    new_profit = new_revenue - (final_volume / 4.5) * new_ops_cost
+    base_profit = crisis['base_profit']
+    new_profit = crisis['new_profit']
     
     # Результаты
     st.subheader("📊 Влияние кризиса на бизнес")
@@ -213,7 +463,7 @@ def economic_crisis_scenario():
                  f"{((new_profit - base_profit) / base_profit * 100):+.1f}%")
     
     # Стратегические рекомендации для кризиса
-    profit_impact = (new_profit - base_profit) / base_profit
+    profit_impact = crisis['profit_impact']
     
     if profit_impact < -0.5:
         st.error("🚨 **Критическое влияние на прибыльность!** Необходимы экстренные меры.")
@@ -242,6 +492,82 @@ def economic_crisis_scenario():
     st.markdown("### 💡 Рекомендуемые действия:")
     for rec in recommendations:
         st.write(f"• {rec}")
+    
+    # Поверхность отклика по всем комбинациям параметров кризиса
+    if st.checkbox("🗺️ Поверхность отклика: оптимальное снижение цен"):
+        show_crisis_response_surface(price_sensitivity, price_cut, cost_optimization, demand_drop)
+
+@st.cache_data(show_spinner=False)
+def cached_crisis_surface(resolution: int) -> Dict[str, np.ndarray]:
+    """Поверхность отклика кризиса на плотной сетке (кэш по входам)"""
+    axes = {
+        'demand_drops': np.linspace(20, 60, resolution),
+        'price_sensitivities': np.linspace(1.2, 2.5, resolution),
+        'price_cuts': np.linspace(0, 30, 2 * resolution + 1),
+        'cost_optimizations': np.linspace(10, 40, 7)
+    }
+    return {**axes, **crisis_response_surface(**axes)}
+
+def show_crisis_response_surface(price_sensitivity: float, price_cut: float, cost_optimization: float,
+                                 demand_drop: float):
+    """Контурные карты прибыли и оптимального снижения цен"""
+    st.subheader("🗺️ Поверхность отклика")
+    
+    resolution = st.select_slider("Разрешение сетки", [20, 40, 60, 80], value=40)
+    surface = cached_crisis_surface(resolution)
+    
+    # Ближайшие к текущим значениям срезы сетки
+    s_idx = int(np.abs(surface['price_sensitivities'] - price_sensitivity).argmin())
+    c_idx = int(np.abs(surface['cost_optimizations'] - cost_optimization).argmin())
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        fig = go.Figure(data=go.Contour(
+            x=surface['price_cuts'],
+            y=surface['demand_drops'],
+            z=surface['profit_impact'][:, s_idx, :, c_idx] * 100,
+            colorscale='RdYlGn',
+            colorbar=dict(title="Δ прибыли, %"),
+            contours=dict(showlabels=True)
+        ))
+        fig.add_trace(go.Scatter(
+            x=surface['optimal_price_cut'][:, s_idx, c_idx], y=surface['demand_drops'],
+            mode='lines', name='Оптимум', line=dict(color='black', width=3)
+        ))
+        fig.add_trace(go.Scatter(x=[price_cut], y=[demand_drop], mode='markers', name='Текущий выбор',
+                                 marker=dict(size=12, color='blue', symbol='x')))
+        fig.update_layout(title=f"Прибыль: спрос × снижение цен (эластичность {surface['price_sensitivities'][s_idx]:.2f})",
+                          xaxis_title="Снижение цен (%)", yaxis_title="Снижение спроса (%)",
+                          height=450, showlegend=False)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        fig = go.Figure(data=go.Contour(
+            x=surface['price_sensitivities'],
+            y=surface['demand_drops'],
+            z=surface['optimal_price_cut'][:, :, c_idx],
+            colorscale='Blues',
+            colorbar=dict(title="Снижение цен, %"),
+            contours=dict(showlabels=True)
+        ))
+        fig.add_trace(go.Scatter(x=[price_sensitivity], y=[demand_drop], mode='markers',
+                                 marker=dict(size=12, color='red', symbol='x')))
+        fig.update_layout(title="Оптимальное снижение цен по тяжести кризиса",
+                          xaxis_title="Эластичность", yaxis_title="Снижение спроса (%)",
+                          height=450, showlegend=False)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    d_idx = int(np.abs(surface['demand_drops'] - demand_drop).argmin())
+    best_cut = surface['optimal_price_cut'][d_idx, s_idx, c_idx]
+    best_impact = surface['optimal_profit_impact'][d_idx, s_idx, c_idx]
+    current_impact = _scalars(economic_crisis_kernel(demand_drop, price_sensitivity, price_cut,
+                                                     cost_optimization))['profit_impact']
+    
+    st.info(f"""
+    🎯 **Оптимум для текущих условий**: снижение цен на {best_cut:.1f}% 
+    (изменение прибыли {best_impact * 100:+.1f}% против {current_impact * 100:+.1f}% при текущих {price_cut}%)
+    """)
 
 def regulation_scenario():
     """Сценарий усиления регулирования"""
@@ -271,31 +597,19 @@ def regulation_scenario():
         base_monthly_revenue = 500_000_000
     
     # Расчет влияния регулирования
+    regulation = _run_scenario(
+        'regulation', licensing_cost=licensing_cost, driver_retention_impact=driver_retention_impact,
+        surge_limitation=surge_limitation, digital_tax=digital_tax,
+        base_drivers=base_drivers, base_surge_revenue_share=base_surge_revenue_share,
+        base_avg_surge=base_avg_surge, base_monthly_revenue=base_monthly_revenue
+    )
     
-    # Влияние на водителей
-    remaining_drivers = base_drivers * (1 - driver_retention_impact / 100)
-    supply_shortage = (base_drivers - remaining_drivers) / base_drivers
-    
-    # Влияние на surge pricing
-    surge_revenue_loss = 0
-    if surge_limitation < base_avg_surge:
-        surge_revenue_loss = (base_surge_revenue_share / 100) * base_monthly_revenue * \
-                           ((base_avg_surge - surge_limitation) / base_avg_surge)
-    
-    # Влияние дефицита водителей на спрос
-    demand_impact = supply_shortage * 0.8  # 80% эластичность спроса к доступности
-    demand_loss = base_monthly_revenue * demand_impact
-    
-    # Налоговое влияние
-    tax_cost = base_monthly_revenue * (digital_tax / 100)
-    
-    # Licensing costs
-    monthly_licensing_cost = (base_drivers * licensing_cost) / 12  # Амортизация на год
-    
-    # Итоговое влияние
-    total_revenue_impact = surge_revenue_loss + demand_loss
-    total_cost_impact = tax_cost + monthly_licensing_cost
-    net_impact = total_revenue_impact + total_cost_impact
+    remaining_drivers = regulation['remaining_drivers']
+    surge_revenue_loss = regulation['surge_revenue_loss']
+    demand_loss = regulation['demand_loss']
+    monthly_licensing_cost = regulation['monthly_licensing_cost']
+    total_cost_impact = regulation['total_cost_impact']
+    net_impact = regulation['net_impact']
     
     # Результаты
     st.subheader("💰 Финансовое влияние регулирования")
@@ -360,6 +674,95 @@ def regulation_scenario():
     
     strategies_df = pd.DataFrame(strategies)
     st.dataframe(strategies_df, use_container_width=True)
+    
+    # Отток водителей выводится из равновесия рынка, а не задается слайдером
+    if st.checkbox("⚖️ Равновесие спроса и предложения водителей"):
+        show_regulation_equilibrium(licensing_cost, digital_tax, surge_limitation, driver_retention_impact,
+                                    base_drivers, base_avg_surge, base_monthly_revenue)
+
+@st.cache_data(show_spinner=False)
+def cached_regulation_equilibrium(digital_tax: float, base_drivers: int, base_avg_surge: float,
+                                  base_monthly_revenue: float) -> Dict[str, np.ndarray]:
+    """Равновесие на сетке лицензия × лимит surge при заданном налоге (кэш по входам)"""
+    axes = {
+        'licensing_costs': np.linspace(5000, 50000, 10),
+        'surge_limits': np.linspace(1.5, 3.0, 7)
+    }
+    equilibrium = regulation_equilibrium_kernel(
+        axes['licensing_costs'][:, None], digital_tax, axes['surge_limits'][None, :],
+        base_drivers=base_drivers, base_avg_surge=base_avg_surge, base_monthly_revenue=base_monthly_revenue
+    )
+    return {**axes, **equilibrium}
+
+def show_regulation_equilibrium(licensing_cost: float, digital_tax: float, surge_limitation: float,
+                                driver_retention_impact: float, base_drivers: int, base_avg_surge: float,
+                                base_monthly_revenue: float):
+    """Равновесный рынок при текущих требованиях и карта по сетке требований"""
+    st.subheader("⚖️ Равновесие рынка при регулировании")
+    
+    st.markdown("""
+    Заработок водителей за вычетом лицензии определяет число водителей, число водителей через 
+    модель очереди Erlang-C определяет ожидание и потерянный спрос, спрос с ограниченным surge 
+    определяет заработок. Расчет итерируется до согласованного состояния.
+    """)
+    
+    equilibrium = _scalars(regulation_equilibrium_kernel(
+        licensing_cost, digital_tax, surge_limitation, base_drivers=base_drivers,
+        base_avg_surge=base_avg_surge, base_monthly_revenue=base_monthly_revenue
+    ))
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Водители в равновесии", f"{equilibrium['drivers']:,.0f}",
+                 f"{equilibrium['driver_change_pct']:+.1f}% (допущение: -{driver_retention_impact}%)")
+    
+    with col2:
+        st.metric("Потерянный спрос", f"{equilibrium['lost_demand_share']:.1%}",
+                 f"ожидание {equilibrium['avg_wait_minutes']:.1f} мин", delta_color="off")
+    
+    with col3:
+        st.metric("Средний surge", f"{equilibrium['avg_surge']:.2f}x",
+                 f"лимит {surge_limitation:.1f}x", delta_color="off")
+    
+    with col4:
+        st.metric("Выручка платформы", f"{equilibrium['platform_revenue']:,.0f} руб",
+                 f"{equilibrium['revenue_impact_pct']:+.1f}%")
+    
+    if not equilibrium['converged']:
+        st.warning(f"⚠️ Равновесие не достигнуто за {equilibrium['iterations']:.0f} итераций, "
+                   f"показано последнее состояние")
+    
+    with st.spinner("Расчет равновесия по сетке требований..."):
+        grid = cached_regulation_equilibrium(digital_tax, base_drivers, base_avg_surge, base_monthly_revenue)
+    
+    col1, col2 = st.columns(2)
+    
+    for column, key, title, colorscale in [
+        (col1, 'revenue_impact_pct', "Изменение выручки платформы (%)", 'RdYlGn'),
+        (col2, 'driver_change_pct', "Изменение числа водителей (%)", 'RdYlGn')
+    ]:
+        with column:
+            fig = go.Figure(data=go.Heatmap(
+                x=grid['surge_limits'],
+                y=grid['licensing_costs'],
+                z=grid[key],
+                colorscale=colorscale,
+                colorbar=dict(title="%")
+            ))
+            fig.add_trace(go.Scatter(x=[surge_limitation], y=[licensing_cost], mode='markers',
+                                     marker=dict(size=12, color='black', symbol='x')))
+            fig.update_layout(title=f"{title}, налог {digital_tax}%",
+                              xaxis_title="Лимит surge (x)", yaxis_title="Лицензия (руб/год)",
+                              height=400, showlegend=False)
+            st.plotly_chart(fig, use_container_width=True)
+    
+    # Самое мягкое для выручки сочетание требований на сетке
+    best = np.unravel_index(np.argmax(grid['revenue_impact_pct']), grid['revenue_impact_pct'].shape)
+    st.info(f"""
+    🎯 **Наименее болезненное сочетание на сетке**: лицензия {grid['licensing_costs'][best[0]]:,.0f} руб, 
+    лимит surge {grid['surge_limits'][best[1]]:.2f}x — выручка {grid['revenue_impact_pct'][best]:+.1f}%
+    """)
 
 def pandemic_scenario():
     """Сценарий пандемии"""
@@ -373,7 +776,7 @@ def pandemic_scenario():
     # Фазы пандемии
     pandemic_phase = st.selectbox(
         "Фаза пандемии:",
-        ["🔒 Lockdown (полная изоляция)", "📉 Partial restrictions", "📈 Recovery phase", "🆕 New normal"]
+        PANDEMIC_PHASES
     )
     
     col1, col2 = st.columns(2)
@@ -416,37 +819,29 @@ def pandemic_scenario():
     base_take_rate = 25
     
     # Расчет влияния пандемии
+    pandemic = _run_scenario(
+        'pandemic', demand_change=demand_change, safety_premium=safety_premium,
+        safety_measures_cost=safety_measures_cost, delivery_expansion=delivery_expansion,
+        pricing_adjustment=pricing_adjustment,
+        base_monthly_volume=base_monthly_volume, base_aov=base_aov, base_take_rate=base_take_rate
+    )
     
-    # Изменение спроса с учетом структуры поездок
-    new_volume = base_monthly_volume * (1 + demand_change / 100)
-    
-    # Safety premium effect - люди предпочитают такси общественному транспорту
-    safety_boost = base_monthly_volume * 0.1 * (safety_premium / 100)  # 10% базы могут переключиться
-    final_volume = new_volume + safety_boost
-    
-    # Влияние на AOV
-    new_aov = base_aov * (1 + pricing_adjustment / 100)
-    
-    # Диверсификация в доставку
-    delivery_revenue = base_monthly_volume * base_aov * (base_take_rate / 100) * (delivery_expansion / 100)
-    
-    # Затраты на безопасность
-    base_revenue = final_volume * new_aov * (base_take_rate / 100)
-    safety_costs = base_revenue * (safety_measures_cost / 100)
-    
-    total_revenue = base_revenue + delivery_revenue
-    net_revenue = total_revenue - safety_costs
-    
-    # Сравнение с базовым сценарием
-    base_total_revenue = base_monthly_volume * base_aov * (base_take_rate / 100)
+    safety_boost = pandemic['safety_boost']
+    final_volume = pandemic['final_volume']
+    new_aov = pandemic['new_aov']
+    delivery_revenue = pandemic['delivery_revenue']
+    base_revenue = pandemic['ride_revenue']
+    safety_costs = pandemic['safety_costs']
+    total_revenue = pandemic['total_revenue']
+    net_revenue = pandemic['net_revenue']
     
     # Результаты
     st.subheader("📈 Влияние на бизнес-показатели")
     
     col1, col2, col3, col4 = st.columns(4)
     
-    volume_change = ((final_volume - base_monthly_volume) / base_monthly_volume) * 100
-    revenue_change = ((total_revenue - base_total_revenue) / base_total_revenue) * 100
+    volume_change = pandemic['volume_change']
+    revenue_change = pandemic['revenue_change']
     
     with col1:
         st.metric("Объем поездок", f"{final_volume:,.0f}", f"{volume_change:+.1f}%")
@@ -459,7 +854,7 @@ def pandemic_scenario():
     
     with col4:
         st.metric("Чистая выручка", f"{net_revenue:,.0f} руб", 
-                 f"{((net_revenue - base_total_revenue) / base_total_revenue * 100):+.1f}%")
+                 f"{pandemic['net_revenue_change']:+.1f}%")
     
     # Breakdown по источникам выручки
     if delivery_revenue > 0:
@@ -527,6 +922,97 @@ def pandemic_scenario():
     st.markdown(f"### 🎯 Рекомендации для фазы '{pandemic_phase}':")
     for rec in phase_recommendations[pandemic_phase]:
         st.write(f"• {rec}")
+    
+    # Многомесячная симуляция смены фаз
+    if st.checkbox("📆 Траектории пандемии по месяцам (Монте-Карло)"):
+        show_pandemic_trajectories(safety_measures_cost, delivery_expansion, pricing_adjustment)
+
+@st.cache_data(show_spinner=False)
+def cached_pandemic_trajectories(mean_durations: Tuple[int, int, int], relapse_probability: float, n_months: int,
+                                 n_paths: int, safety_measures_cost: float, delivery_expansion: float,
+                                 pricing_adjustment: float) -> Dict[str, np.ndarray]:
+    """Сводка траекторий пандемии: квантили потерь, время восстановления, доли фаз"""
+    result = pandemic_trajectory_kernel(n_paths=n_paths, n_months=n_months, mean_durations=mean_durations,
+                                        relapse_probability=relapse_probability,
+                                        safety_measures_cost=safety_measures_cost,
+                                        delivery_expansion=delivery_expansion,
+                                        pricing_adjustment=pricing_adjustment)
+    phase_share = np.stack([(result['phases'] == i).mean(axis=0) for i in range(len(PANDEMIC_PHASES))])
+    
+    return {
+        'loss_quantiles': np.quantile(result['cumulative_loss'], [0.05, 0.5, 0.95], axis=0),
+        'total_loss': result['total_loss'],
+        'recovery_month': result['recovery_month'],
+        'phase_share': phase_share
+    }
+
+def show_pandemic_trajectories(safety_measures_cost: float, delivery_expansion: float, pricing_adjustment: float):
+    """Распределение накопленных потерь и времени восстановления"""
+    st.subheader("📆 Траектории пандемии")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        lockdown_months = st.slider("Средняя длительность Lockdown (мес)", 1, 6, 2)
+        partial_months = st.slider("Средняя длительность Partial (мес)", 1, 12, 3)
+    
+    with col2:
+        recovery_months = st.slider("Средняя длительность Recovery (мес)", 1, 12, 4)
+        relapse_probability = st.slider("Вероятность новой волны при смене фазы (%)", 0, 50, 15) / 100
+    
+    with col3:
+        n_months = st.slider("Горизонт (мес)", 6, 48, 24)
+        n_paths = st.select_slider("Количество траекторий", [1_000, 10_000, 50_000], value=10_000)
+    
+    summary = cached_pandemic_trajectories((lockdown_months, partial_months, recovery_months), relapse_probability,
+                                           n_months, n_paths, safety_measures_cost, delivery_expansion,
+                                           pricing_adjustment)
+    
+    recovery = summary['recovery_month']
+    recovered_share = np.mean(~np.isnan(recovery))
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Медиана накопленных потерь", f"{np.median(summary['total_loss']):,.0f} руб")
+    
+    with col2:
+        st.metric("P95 накопленных потерь", f"{np.quantile(summary['total_loss'], 0.95):,.0f} руб")
+    
+    with col3:
+        median_recovery = np.nanmedian(recovery) if recovered_share > 0 else np.nan
+        st.metric("Медиана выхода в New normal", f"{median_recovery:.0f} мес" if recovered_share > 0 else "Не достигнут")
+    
+    with col4:
+        st.metric("Восстановились за горизонт", f"{recovered_share:.0%}")
+    
+    months = np.arange(1, n_months + 1)
+    p5, p50, p95 = summary['loss_quantiles']
+    
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('Накопленные потери выручки (P5-P95)',
+                                                        'Доля траекторий по фазам'))
+    fig.add_trace(go.Scatter(x=months, y=p95, mode='lines', line=dict(width=0), showlegend=False), row=1, col=1)
+    fig.add_trace(go.Scatter(x=months, y=p5, mode='lines', line=dict(width=0), fill='tonexty',
+                             fillcolor='rgba(255,0,0,0.2)', name='P5-P95'), row=1, col=1)
+    fig.add_trace(go.Scatter(x=months, y=p50, mode='lines', line=dict(color='red', width=3), name='Медиана'),
+                  row=1, col=1)
+    fig.add_hline(y=0, line_dash="dash", line_color="black", row=1, col=1)
+    
+    for phase, share in zip(PANDEMIC_PHASES, summary['phase_share']):
+        fig.add_trace(go.Scatter(x=months, y=share, mode='lines', stackgroup='phases', name=phase), row=1, col=2)
+    
+    fig.update_layout(height=450)
+    fig.update_xaxes(title_text="Месяц")
+    fig.update_yaxes(title_text="Руб (отрицательные = рост)", row=1, col=1)
+    fig.update_yaxes(title_text="Доля траекторий", row=1, col=2)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    if recovered_share > 0:
+        fig = go.Figure(data=go.Histogram(x=recovery[~np.isnan(recovery)], xbins=dict(size=1),
+                                          marker_color='green'))
+        fig.update_layout(title="Распределение времени выхода в New normal", xaxis_title="Месяц",
+                          yaxis_title="Траекторий", height=300)
+        st.plotly_chart(fig, use_container_width=True)
 
 def public_transport_scenario():
     """Развитие общественного транспорта"""
@@ -562,34 +1048,22 @@ def public_transport_scenario():
         st.metric("Соотношение цен", f"{current_aov/public_transport_price:.1f}x")
     
     # Расчет влияния
+    transport = _run_scenario(
+        'public_transport', metro_expansion=metro_expansion, bus_improvement=bus_improvement,
+        public_transport_price=public_transport_price, coverage_impact=coverage_impact,
+        current_aov=current_aov, current_frequency=current_frequency, current_users=current_users
+    )
     
-    # Price advantage общественного транспорта
-    price_ratio = current_aov / public_transport_price
-    
-    # Оценка переключения пользователей
-    # Эластичность спроса: чем больше разница в цене, тем больше переключаются
-    demand_elasticity_effect = min(0.4, (price_ratio - 3) * 0.1)  # Максимум 40% могут переключиться
-    
-    # Влияние покрытия маршрутов
-    coverage_effect = (coverage_impact / 100) * 0.3  # До 30% дополнительного влияния
-    
-    total_demand_loss = (demand_elasticity_effect + coverage_effect) * 100
-    
-    # Качественные улучшения общ.транспорта
-    quality_multiplier = 1 + (bus_improvement / 100) * 0.5
-    metro_effect = metro_expansion * 0.02  # Каждая станция = 2% дополнительного влияния
-    
-    final_demand_loss = min(60, total_demand_loss * quality_multiplier + metro_effect * 100)
+    final_demand_loss = transport['final_demand_loss']
     
     # Влияние на сегменты
-    # Больше всего страдают короткие поездки в центре
-    short_trips_loss = final_demand_loss * 1.5
-    long_trips_loss = final_demand_loss * 0.6
-    premium_trips_loss = final_demand_loss * 0.3  # Премиум сегмент менее чувствителен
+    short_trips_loss = transport['short_trips_loss']
+    long_trips_loss = transport['long_trips_loss']
+    premium_trips_loss = transport['premium_trips_loss']
     
     # Новые показатели
-    new_users = current_users * (1 - final_demand_loss / 100)
-    new_frequency = current_frequency * 0.95  # Небольшое снижение частоты
+    new_users = transport['new_users']
+    new_frequency = transport['new_frequency']
     
     # Адаптационные стратегии
     st.subheader("📊 Сегментированное влияние")
@@ -608,7 +1082,7 @@ def public_transport_scenario():
     # Финансовое влияние
     col1, col2, col3 = st.columns(3)
     
-    revenue_impact = ((new_users * new_frequency) - (current_users * current_frequency)) / (current_users * current_frequency) * 100
+    revenue_impact = transport['revenue_impact']
     
     with col1:
         st.metric("Потеря пользователей", f"{current_users - new_users:,.0f}", 
@@ -663,6 +1137,103 @@ def public_transport_scenario():
     4. **Cargo/delivery**: Использование транспортной инфраструктуры
     5. **Data partnership**: Аналитика мобильности для города
     """)
+    
+    # Влияние метро по реальной геометрии поездок вместо фиксированных 2% на станцию
+    if st.checkbox("🗺️ Пространственная модель влияния новых станций"):
+        show_station_impact(metro_expansion, bus_improvement, public_transport_price, current_aov, transport)
+
+@st.cache_data(show_spinner=False)
+def cached_synthetic_trips(n_trips: int, seed: int = 42) -> Dict[str, np.ndarray]:
+    """Синтетические поездки города (кэш по размеру выборки)"""
+    return generate_trips(n_trips, seed=seed)
+
+def show_station_impact(metro_expansion: int, bus_improvement: float, public_transport_price: float,
+                        current_aov: float, transport: Dict[str, float]):
+    """Потеря поездок по сегментам от пешей доступности новых станций"""
+    st.subheader("🗺️ Влияние новых станций по поездкам")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        uploaded = st.file_uploader("Поездки (.npz или .csv: origin_x, origin_y, dest_x, dest_y, [premium]; км)",
+                                    type=["npz", "csv"], key="trip_points")
+        n_trips = st.select_slider("Синтетических поездок", [100_000, 500_000, 1_000_000, 2_000_000],
+                                   value=500_000, disabled=uploaded is not None)
+    
+    with col2:
+        walk_km = st.slider("Пешая доступность станции (км)", 0.3, 1.5, 0.8, 0.1)
+        n_lines = st.slider("Радиальных линий метро", 3, 8, 5)
+    
+    trips = load_trip_points(uploaded) if uploaded is not None else cached_synthetic_trips(n_trips)
+    existing_stations, new_stations = metro_network(metro_expansion, n_lines=n_lines)
+    
+    impact = station_catchment_impact(
+        trips, existing_stations, new_stations, walk_km=walk_km,
+        price_ratio=current_aov / public_transport_price, quality_multiplier=1 + bus_improvement / 200
+    )
+    
+    segment_trips = np.maximum(impact['segment_trips'], 1)
+    segments_df = pd.DataFrame({
+        'Сегмент': TRIP_SEGMENT_NAMES,
+        'Поездок': impact['segment_trips'],
+        'У новых станций': impact['segment_covered'].astype(int),
+        'Потеря (поездок)': impact['segment_lost'].round().astype(int),
+        'Потеря, %': impact['segment_lost'] / segment_trips * 100
+    })
+    st.dataframe(segments_df.style.format({'Поездок': '{:,.0f}', 'У новых станций': '{:,.0f}',
+                                           'Потеря (поездок)': '{:,.0f}', 'Потеря, %': '{:.2f}%'}),
+                 use_container_width=True)
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Потеря поездок от станций", f"{impact['lost_share']:.2%}",
+                 f"плоская модель: {metro_expansion * 2}%", delta_color="off")
+    
+    with col2:
+        st.metric("Потеря выручки от станций", f"{impact['revenue_lost_share']:.2%}")
+    
+    with col3:
+        premium_share = impact['premium_lost'] / max(impact['premium_trips'], 1)
+        st.metric("Потеря премиум поездок", f"{premium_share:.2%}")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # Для карты достаточно подвыборки поездок
+        sample = np.random.default_rng(0).choice(len(trips['origins']), min(5000, len(trips['origins'])),
+                                                 replace=False)
+        fig = go.Figure()
+        fig.add_trace(go.Scattergl(
+            x=trips['origins'][sample, 0], y=trips['origins'][sample, 1], mode='markers',
+            marker=dict(size=3, color=impact['switch_probability'][sample], colorscale='Reds',
+                        cmin=0, cmax=max(impact['switch_probability'].max(), 1e-9),
+                        colorbar=dict(title="P(ухода)")),
+            name='Начала поездок'
+        ))
+        fig.add_trace(go.Scatter(x=existing_stations[:, 0], y=existing_stations[:, 1], mode='markers',
+                                 marker=dict(size=8, color='gray', symbol='square'), name='Действующие станции'))
+        fig.add_trace(go.Scatter(x=new_stations[:, 0], y=new_stations[:, 1], mode='markers',
+                                 marker=dict(size=11, color='blue', symbol='diamond'), name='Новые станции'))
+        fig.update_layout(title="Поездки и станции (км от центра)", height=450,
+                          xaxis_title="x, км", yaxis_title="y, км", yaxis_scaleanchor='x')
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        if len(new_stations):
+            fig = px.bar(x=[f"Станция {i + 1}" for i in range(len(new_stations))], y=impact['station_lost'],
+                         title="Потерянные поездки по новым станциям",
+                         labels={'x': 'Станция', 'y': 'Поездок'})
+            fig.update_layout(height=450)
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("Новых станций нет - метро не меняет спрос")
+    
+    st.info(f"""
+    📍 **Пространственный эффект метро**: {impact['lost_share']:.2%} поездок против {metro_expansion * 2}% 
+    в плоской модели. Короткие поездки: {segments_df['Потеря, %'].iloc[0]:.2f}% 
+    (плоская модель {transport['short_trips_loss']:.1f}% с учетом цен и автобусов).
+    """)
 
 def new_city_launch_scenario():
     """Запуск в новом городе"""
@@ -697,38 +1268,22 @@ def new_city_launch_scenario():
         # Конкуренция
         existing_competitors = st.slider("Количество конкурентов", 0, 5, 2)
     
-    # Расчет потенциала рынка
-    
-    # Addressable market
-    # Предполагаем, что 15-25% населения потенциально может использовать ride-hailing
-    market_penetration_potential = 0.15 + (avg_income - 30000) / 120000 * 0.1  # Higher income = higher penetration
-    market_penetration_potential = min(0.25, max(0.10, market_penetration_potential))
-    
-    # Корректировки на качество общ.транспорта (плохой транспорт = больше потенциал)
-    transport_multiplier = 1.5 - (public_transport_quality / 10) * 0.5
-    
-    # Конкуренция снижает потенциал
-    competition_factor = 1 / (1 + existing_competitors * 0.2)
-    
-    total_addressable_market = city_population * market_penetration_potential * transport_multiplier * competition_factor
+    # Расчет потенциала рынка и прогноз метрик
+    launch = _run_scenario('new_city_launch', city_population=city_population, avg_income=avg_income,
+                           public_transport_quality=public_transport_quality,
+                           existing_competitors=existing_competitors, strategy=launch_strategy,
+                           target_market_share=target_market_share, initial_promo_budget=initial_promo_budget)
     
-    # Прогноз метрик
-    estimated_frequency = 2.5 + (avg_income - 30000) / 60000  # Больше доходы = больше поездок
-    estimated_frequency = min(5.0, max(1.5, estimated_frequency))
-    
-    estimated_aov = 200 + (avg_income - 30000) / 1000  # Зависимость от доходов
-    estimated_aov = min(500, max(150, estimated_aov))
-    
-    # CAC зависит от стратегии и конкуренции
-    strategy_multipliers = {"Aggressive (быстрый захват)": 2.0, "Moderate (постепенный рост)": 1.3, "Conservative (осторожный вход)": 1.0}
-    base_cac = 800 + existing_competitors * 300
-    estimated_cac = base_cac * strategy_multipliers[launch_strategy]
+    total_addressable_market = launch['total_addressable_market']
+    estimated_frequency = launch['estimated_frequency']
+    estimated_aov = launch['estimated_aov']
+    estimated_cac = launch['estimated_cac']
     
     # Timeline запуска по месяцам
-    months_to_target = 12 if launch_strategy.startswith("Aggressive") else 18 if launch_strategy.startswith("Moderate") else 24
+    months_to_target = int(launch['months_to_target'])
     
     # Расчет пользователей по месяцам
-    target_users = total_addressable_market * (target_market_share / 100)
+    target_users = launch['target_users']
     
     # Результаты анализа
     st.subheader("📊 Потенциал рынка")
@@ -751,9 +1306,16 @@ def new_city_launch_scenario():
     create_launch_financial_model(target_users, estimated_aov, estimated_frequency, estimated_cac, 
                                  initial_promo_budget, months_to_target, launch_strategy)
     
+    # Оптимальный план рядом с текущим
+    show_launch_optimizer(city_population, avg_income, public_transport_quality, existing_competitors,
+                          launch_strategy, initial_promo_budget, target_market_share)
+    
     # Рекомендации по запуску
     show_launch_recommendations(city_population, avg_income, public_transport_quality, 
                                existing_competitors, launch_strategy)
+    
+    # Пакетный скрининг планов запуска
+    show_launch_pipeline_screening(city_population, avg_income, public_transport_quality, existing_competitors)
 
 def create_launch_financial_model(target_users: float, aov: float, frequency: float, cac: float,
                                  promo_budget: int, months_to_target: int, strategy: str):
@@ -761,61 +1323,15 @@ def create_launch_financial_model(target_users: float, aov: float, frequency: fl
     
     st.subheader("💰 Финансовая модель запуска")
     
-    # Кривая роста пользователей
-    months = list(range(1, months_to_target + 1))
-    
-    # S-образная кривая роста
-    if strategy.startswith("Aggressive"):
-        # Быстрый рост в начале, потом замедление
-        users_curve = [target_users * (1 - np.exp(-3 * m / months_to_target)) for m in months]
-    elif strategy.startswith("Moderate"):
-        # Линейный рост
-        users_curve = [target_users * m / months_to_target for m in months]
-    else:
-        # Медленный старт, потом ускорение
-        users_curve = [target_users * (m / months_to_target) ** 1.5 for m in months]
-    
-    # Расчет помесячных показателей
-    monthly_data = []
-    cumulative_cac_spend = 0
-    cumulative_revenue = 0
-    
-    for i, month in enumerate(months):
-        current_users = users_curve[i]
-        new_users = current_users if i == 0 else current_users - users_curve[i-1]
-        
-        # CAC spend
-        monthly_cac_spend = new_users * cac
-        cumulative_cac_spend += monthly_cac_spend
-        
-        # Промо расходы (больше в начале)
-        promo_weight = 2 - (month / months_to_target)  # От 2 до 1
-        monthly_promo = (promo_budget / months_to_target) * promo_weight
-        
-        # Revenue (с учетом ramp-up новых пользователей)
-        # Новые пользователи в первый месяц делают только 50% от полной частоты
-        active_users = current_users * 0.85  # 85% активны каждый месяц
-        monthly_revenue = active_users * aov * frequency * 0.25  # 25% take rate
-        cumulative_revenue += monthly_revenue
-        
-        # Прибыльность
-        monthly_costs = monthly_cac_spend + monthly_promo + (current_users * 15)  # 15 руб ops cost на пользователя
-        monthly_profit = monthly_revenue - monthly_costs
-        
-        monthly_data.append({
-            'month': month,
-            'users': current_users,
-            'new_users': new_users,
-            'revenue': monthly_revenue,
-            'cac_spend': monthly_cac_spend,
-            'promo_spend': monthly_promo,
-            'profit': monthly_profit,
-            'cumulative_revenue': cumulative_revenue,
-            'cumulative_cac': cumulative_cac_spend
-        })
+    # Помесячная модель: кривая роста пользователей, CAC, промо и выручка
+    monthly = launch_monthly_kernel(target_users, aov, frequency, cac, promo_budget, months_to_target, strategy)
+    plan = _scalars(launch_plan_kernel(target_users, aov, frequency, cac, promo_budget, months_to_target, strategy))
     
     # График финансовой модели
-    df = pd.DataFrame(monthly_data)
+    df = pd.DataFrame({key: monthly[key] for key in ['months', 'users', 'new_users', 'revenue', 'cac_spend',
+                                                       'promo_spend', 'profit', 'cumulative_revenue',
+                                                       'cumulative_spend', 'cumulative_profit']})
+    df = df.rename(columns={'months': 'month'})
     
     fig = make_subplots(
         rows=2, cols=2,
@@ -843,7 +1359,7 @@ def create_launch_financial_model(target_users: float, aov: float, frequency: fl
     )
     
     # График 3: Накопительная прибыльность
-    cumulative_profit = np.cumsum(df['profit'])
+    cumulative_profit = df['cumulative_profit']
     fig.add_trace(
         go.Scatter(x=df['month'], y=cumulative_profit, mode='lines+markers',
                   name='Накопительная прибыль', line=dict(color='purple', width=3)),
@@ -852,7 +1368,7 @@ def create_launch_financial_model(target_users: float, aov: float, frequency: fl
     fig.add_hline(y=0, line_dash="dash", line_color="black", row=2, col=1)
     
     # График 4: ROI
-    cumulative_spend = df['cumulative_cac'] + np.cumsum(df['promo_spend'])
+    cumulative_spend = df['cumulative_spend']
     roi = (df['cumulative_revenue'] - cumulative_spend) / cumulative_spend * 100
     fig.add_trace(
         go.Scatter(x=df['month'], y=roi, mode='lines+markers',
@@ -873,15 +1389,9 @@ def create_launch_financial_model(target_users: float, aov: float, frequency: fl
     # Ключевые метрики
     col1, col2, col3 = st.columns(3)
     
-    breakeven_month = None
-    for i, profit in enumerate(cumulative_profit):
-        if profit > 0:
-            breakeven_month = i + 1
-            break
-    
-    total_investment = cumulative_spend[-1]
-    final_revenue = df['cumulative_revenue'].iloc[-1]
-    final_roi = roi.iloc[-1]
+    breakeven_month = int(plan['breakeven_month'])  # 0 - не достигнут
+    total_investment = plan['total_investment']
+    final_roi = plan['final_roi']
     
     with col1:
         if breakeven_month:
@@ -901,6 +1411,154 @@ def create_launch_financial_model(target_users: float, aov: float, frequency: fl
         </div>
         """, unsafe_allow_html=True)
 
+@st.cache_data(show_spinner=False)
+def cached_launch_optimization(city_population: int, avg_income: int, transport_quality: int, competitors: int,
+                               objective: str, max_cash_exposure: float, assumptions: Dict) -> pd.DataFrame:
+    """Кэшированный поиск оптимального плана запуска"""
+    return optimize_launch_plan(city_population, avg_income, transport_quality, competitors,
+                                objective=objective, max_cash_exposure=max_cash_exposure, **assumptions)
+
+def show_launch_optimizer(city_population: int, avg_income: int, transport_quality: int, competitors: int,
+                          strategy: str, promo_budget: int, target_share: int):
+    """Оптимальный план запуска в сравнении с текущим"""
+    st.subheader("🧭 Оптимизатор плана запуска")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        objective_label = st.radio("Цель оптимизации:", ["Максимальный ROI", "Быстрейший breakeven"], horizontal=True)
+    
+    with col2:
+        cash_limit = st.number_input("Лимит кассового разрыва (руб, 0 = без лимита)", 0, 1_000_000_000,
+                                     0, 5_000_000)
+    
+    with st.expander("Допущения оптимизатора", expanded=True):
+        st.markdown("""
+        Финансовая модель выше считает план до выхода на целевую долю, CAC задан стратегией, а промо - 
+        чистый расход. В такой модели ROI растет с долей и падает с бюджетом, и оптимум всегда на границе. 
+        Оптимизатор оценивает планы с дополнительными допущениями (0 - допущение выключено):
+        - **Горизонт окупаемости**: ROI и breakeven считаются на этом горизонте, а не только до выхода на цель;
+        - **Разовые расходы на открытие** (офис, онбординг водителей) в первом месяце;
+        - **Замещение CAC промо**: промо на первые поездки заменяет до указанной доли платного привлечения, 
+          с убывающей отдачей (63% эффекта при промо в четверть CAC на пользователя);
+        - **Рост CAC с долей**: последние пользователи дороже, CAC растет как 1 / (1 - k × доля).
+        
+        Текущий план в таблице пересчитан с теми же допущениями.
+        """)
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            horizon = st.slider("Горизонт окупаемости (мес, 0 = до выхода на цель)", 0, 60, 36, 6)
+            fixed_cost = st.number_input("Разовые расходы на открытие (руб)", 0, 50_000_000, 3_000_000, 500_000)
+        
+        with col2:
+            promo_cac_reduction = st.slider("Замещение CAC промо (макс. доля, %)", 0, 90, 50, 5)
+            share_cac_growth = st.slider("Рост CAC с долей (k)", 0.0, 1.0, 1.0, 0.1)
+    
+    objective = 'roi' if objective_label == "Максимальный ROI" else 'breakeven'
+    max_cash_exposure = float(cash_limit) if cash_limit > 0 else np.inf
+    assumptions = {
+        'horizon': horizon or None,
+        'fixed_cost': float(fixed_cost),
+        'promo_cac_reduction': promo_cac_reduction / 100,
+        'share_cac_growth': share_cac_growth
+    }
+    roi_label = f"ROI ({horizon} мес)" if horizon else "ROI (до выхода на цель)"
+    
+    with st.spinner("Поиск оптимального плана..."):
+        plans = cached_launch_optimization(city_population, avg_income, transport_quality, competitors,
+                                           objective, max_cash_exposure, assumptions)
+    
+    best = plans.iloc[0]
+    current = _scalars(new_city_launch_kernel(city_population, avg_income, transport_quality, competitors,
+                                              strategy, target_share, promo_budget, **assumptions))
+    
+    def describe(name, plan_strategy, budget, share, plan):
+        return {
+            'План': name,
+            'Стратегия': plan_strategy,
+            'Промо-бюджет': f"{budget:,.0f} руб",
+            'Целевая доля': f"{share:.1f}%",
+            'Breakeven': f"{int(plan['breakeven_month'])} мес" if plan['breakeven_month'] > 0 else "Не достигнут",
+            roi_label: f"{plan['final_roi']:.1f}%",
+            'Кассовый разрыв': f"{plan['max_cash_exposure']:,.0f} руб"
+        }
+    
+    comparison_df = pd.DataFrame([
+        describe("Текущий", strategy, promo_budget, target_share, current),
+        describe("Оптимальный", best['strategy'], best['initial_promo_budget'], best['target_market_share'], best)
+    ])
+    
+    st.dataframe(comparison_df, use_container_width=True)
+    
+    if not best['feasible']:
+        st.warning("⚠️ Ни один план не укладывается в лимит кассового разрыва - показан план с наименьшим превышением")
+    
+    with st.expander("Лучший план для каждой стратегии"):
+        st.dataframe(pd.DataFrame([
+            describe(row['strategy'].split()[0], row['strategy'], row['initial_promo_budget'],
+                     row['target_market_share'], row)
+            for _, row in plans.iterrows()
+        ]), use_container_width=True)
+
+def show_launch_pipeline_screening(city_population: int, avg_income: int, transport_quality: int,
+                                   competitors: int):
+    """Скрининг планов запуска: сетка для текущего города или CSV с пайплайном городов"""
+    with st.expander("📦 Скрининг планов запуска по пайплайну городов"):
+        st.markdown("""
+        Все планы считаются одной векторной операцией. Загрузите CSV с колонками параметров 
+        (`city_population`, `avg_income`, `public_transport_quality`, `existing_competitors`, `strategy`, 
+        `target_market_share`, `initial_promo_budget`, опционально `city`) или используйте сетку 
+        стратегия × промо-бюджет × целевая доля для текущего города.
+        """)
+        
+        uploaded = st.file_uploader("Пайплайн городов (CSV)", type="csv", key="launch_pipeline")
+        
+        if uploaded is not None:
+            try:
+                pipeline = pd.read_csv(uploaded)
+                labels = pipeline.pop('city') if 'city' in pipeline.columns else None
+                plans = run_scenario_batch("new_city_launch", pipeline)
+            except (ValueError, KeyError, TypeError) as error:
+                st.error(f"""
+                Не удалось рассчитать пайплайн: {error}. Ожидаемые колонки: `city_population`, `avg_income`, 
+                `public_transport_quality`, `existing_competitors`, `strategy`, `target_market_share`, 
+                `initial_promo_budget`, опционально `city`.
+                """)
+                return
+            if labels is not None:
+                plans.insert(0, 'city', labels)
+        else:
+            strategies = np.arange(len(LAUNCH_STRATEGIES))[:, None, None]
+            budgets = np.linspace(1_000_000, 50_000_000, 50)[None, :, None]
+            shares = np.arange(5, 41)[None, None, :]
+            
+            result = new_city_launch_kernel(city_population, avg_income, transport_quality, competitors,
+                                            strategies, shares, budgets)
+            grid_shape = result['final_roi'].shape
+            plans = pd.DataFrame({
+                'strategy': np.array(LAUNCH_STRATEGIES)[np.broadcast_to(strategies, grid_shape).ravel()],
+                'initial_promo_budget': np.broadcast_to(budgets, grid_shape).ravel(),
+                'target_market_share': np.broadcast_to(shares, grid_shape).ravel(),
+                **{key: np.broadcast_to(value, grid_shape).ravel() for key, value in result.items()}
+            })
+        
+        st.caption(f"Рассчитано планов: {len(plans):,}")
+        
+        # Лучшие планы: сначала по ROI, breakeven как дополнительный критерий
+        top = plans.assign(breakeven_sort=plans['breakeven_month'].replace(0, np.inf)) \
+            .sort_values(['final_roi', 'breakeven_sort'], ascending=[False, True]).head(15) \
+            .drop(columns='breakeven_sort')
+        
+        shown_columns = [column for column in ['city', 'strategy', 'initial_promo_budget', 'target_market_share',
+                                               'target_users', 'breakeven_month', 'total_investment', 'final_roi']
+                         if column in top.columns]
+        st.dataframe(top[shown_columns], use_container_width=True)
+        
+        reached = (plans['breakeven_month'] > 0).mean()
+        st.info(f"📊 Breakeven в пределах горизонта достигают {reached:.0%} планов")
+
 def show_launch_recommendations(population: int, income: int, transport_quality: int,
                                competitors: int, strategy: str):
     """Рекомендации по запуску"""
@@ -0,0 +1,126 @@
+import numpy as np
+from scipy.stats import poisson
+from typing import Dict, Tuple
+
+HOURS_PER_WEEK = 168
+WEEKS_PER_MONTH = 4.33
+
+
+def log_erlang_b(servers: np.ndarray, load: np.ndarray) -> np.ndarray:
+    """Логарифм вероятности блокировки Erlang-B: B(c, a) = P(N=c) / P(N<=c), N ~ Poisson(a)"""
+    return poisson.logpmf(servers, load) - poisson.logcdf(servers, load)
+
+def erlang_c(servers: np.ndarray, load: np.ndarray) -> np.ndarray:
+    """Вероятность ожидания Erlang-C, устойчивый расчет через log-space Erlang-B"""
+    servers, load = np.broadcast_arrays(np.asarray(servers, dtype=float), np.asarray(load, dtype=float))
+    result = np.ones(servers.shape)
+
+    # При загрузке >= 1 очередь растет неограниченно: ждут все
+    stable = (servers > 0) & (load < servers)
+    c = servers[stable]
+    a = load[stable]
+    rho = a / c
+
+    # C = B / (1 - rho * (1 - B))
+    log_b = log_erlang_b(c, a)
+    b = np.exp(log_b)
+    result[stable] = np.exp(log_b - np.log1p(-rho * (1 - b)))
+    result[load <= 0] = 0.0
+    return result
+
+def pickup_wait_model(requests_per_hour: np.ndarray, drivers_online: np.ndarray,
+                      trip_minutes: float = 20, base_pickup_minutes: float = 4,
+                      patience_minutes: float = 10) -> Dict[str, np.ndarray]:
+    """M/M/c модель подачи: ожидание, доля неисполненного спроса и загрузка водителей"""
+    arrival_rate = np.asarray(requests_per_hour, dtype=float) / 60  # заказов в минуту
+    servers = np.floor(np.asarray(drivers_online, dtype=float))
+    service_rate = 1 / trip_minutes
+    load = arrival_rate / service_rate  # Эрланги
+
+    prob_wait = erlang_c(servers, load)
+    stable = load < servers
+
+    # Скорость "разгрузки" очереди; в неустойчивом режиме очередь не разгружается
+    drain_rate = np.where(stable, servers * service_rate - arrival_rate, 0.0)
+    with np.errstate(divide='ignore'):
+        queue_wait = np.where(stable, prob_wait / np.where(stable, drain_rate, 1.0), np.inf)
+
+    # Пассажир уходит, если ожидание машины превышает его терпение
+    abandon_share = prob_wait * np.exp(-drain_rate * patience_minutes)
+    # При перегрузке исполняется не больше, чем позволяют водители
+    overload_share = np.where(load > 0, np.clip(1 - servers / np.maximum(load, 1e-12), 0, 1), 0.0)
+    unfulfilled_share = np.where(stable, abandon_share, np.maximum(overload_share, abandon_share))
+
+    # Без заказов никто не ждет и водители не заняты
+    has_demand = load > 0
+    return {
+        'wait_minutes': np.where(has_demand, base_pickup_minutes + np.minimum(queue_wait, patience_minutes), 0.0),
+        'unfulfilled_share': unfulfilled_share,
+        'utilization': np.where(servers > 0, np.minimum(load / np.maximum(servers, 1), 1.0), np.where(has_demand, 1.0, 0.0))
+    }
+
+def hour_of_week_profile(peak_hours: Tuple[int, ...] = (8, 18), peak_height: float = 2.5,
+                         night_level: float = 0.25, weekend_peak: float = 1.0) -> np.ndarray:
+    """Доля недельного объема по 168 часам недели (понедельник 00:00 = 0)"""
+    hours = np.arange(HOURS_PER_WEEK)
+    hour_of_day = hours % 24
+    day = hours // 24
+    weekend = day >= 5
+
+    # Базовый дневной уровень с провалом ночью
+    profile = night_level + (1 - night_level) * np.clip(np.sin(np.pi * (hour_of_day - 5) / 19), 0, None)
+
+    # Часы пик в будни, вечерний пик в выходные
+    for peak in peak_hours:
+        profile = profile + np.where(weekend, 0.0, (peak_height - 1) * np.exp(-0.5 * (hour_of_day - peak) ** 2))
+    evening_distance = np.minimum(np.abs(hour_of_day - 22), 24 - np.abs(hour_of_day - 22))
+    profile = profile + np.where(weekend, weekend_peak * np.exp(-0.5 * (evening_distance / 2) ** 2), 0.0)
+
+    return profile / profile.sum()
+
+def zone_shares(n_zones: int, concentration: float) -> np.ndarray:
+    """Доли зон города: центр получает больше, периферия меньше"""
+    weights = np.exp(-concentration * np.arange(n_zones))
+    return weights / weights.sum()
+
+def city_supply_demand(monthly_rides: np.ndarray, supply_ratio: float = 1.3, n_zones: int = 10,
+                       trip_minutes: float = 20, base_pickup_minutes: float = 4,
+                       patience_minutes: float = 10) -> Dict[str, np.ndarray]:
+    """Баланс спроса и предложения: массивы города × 168 часов × зоны"""
+    monthly_rides = np.asarray(monthly_rides, dtype=float)
+
+    demand_profile = hour_of_week_profile()
+    # Водители выходят на линию более равномерно, чем пассажиры заказывают поездки
+    supply_profile = hour_of_week_profile(peak_height=1.6, night_level=0.35)
+    demand_zones = zone_shares(n_zones, 0.35)
+    supply_zones = zone_shares(n_zones, 0.2)
+
+    weekly_rides = monthly_rides / WEEKS_PER_MONTH
+    requests = weekly_rides[:, None, None] * demand_profile[None, :, None] * demand_zones[None, None, :]
+
+    # Средняя нагрузка в Эрлангах за неделю, умноженная на запас предложения
+    avg_load = weekly_rides / HOURS_PER_WEEK * trip_minutes / 60
+    fleet_online = supply_ratio * avg_load * HOURS_PER_WEEK
+    drivers = fleet_online[:, None, None] * supply_profile[None, :, None] * supply_zones[None, None, :]
+
+    result = pickup_wait_model(requests, drivers, trip_minutes, base_pickup_minutes, patience_minutes)
+    result['requests'] = requests
+    result['drivers'] = drivers
+    return result
+
+def summarize_city_balance(balance: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Взвешенные по спросу итоги баланса по каждому городу"""
+    requests = balance['requests']
+    total = requests.sum(axis=(1, 2))
+    safe_total = np.where(total > 0, total, 1.0)
+
+    lost = (requests * balance['unfulfilled_share']).sum(axis=(1, 2))
+    avg_wait = (requests * balance['wait_minutes']).sum(axis=(1, 2)) / safe_total
+
+    return {
+        'lost_share': lost / safe_total,
+        'avg_wait_minutes': avg_wait,
+        # Пик только по ячейкам, где есть заказы
+        'peak_wait_minutes': np.where(requests > 0, balance['wait_minutes'], 0.0).max(axis=(1, 2)),
+        'avg_utilization': (requests * balance['utilization']).sum(axis=(1, 2)) / safe_total
+    }